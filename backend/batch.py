@@ -0,0 +1,85 @@
+from backend.downsample import RESOLUTIONS
+
+# Metrics the batch endpoint can serve, with the fact table each one is computed from
+BATCH_METRICS = {
+    "tvl": "dws_tvl_snapshots_dm",
+    "tvl_volatility": "dws_risk_metrics_dm",
+    "whale_concentration_pct": "dws_risk_metrics_dm",
+}
+
+# Per fact table, the query selecting (protocol_name, metric, snapshot_time, value) for the
+# lowercased protocol names in $1 and the metrics in $2. TVL is read from its protocol-level rollup.
+SERIES_SQL = {
+    "dws_tvl_snapshots_dm": """
+        SELECT p.protocol_name, 'tvl' AS metric, time_id_start(r.time_id) AS snapshot_time, r.tvl_usd AS value
+        FROM dws_tvl_protocol_dm r
+        JOIN dim_protocol_dm p ON r.protocol_id = p.protocol_id
+        WHERE lower(p.protocol_name) = ANY($1) AND 'tvl' = ANY($2)
+    """,
+    "dws_risk_metrics_dm": """
+        SELECT p.protocol_name, r.metric_name AS metric, time_id_start(r.time_id) AS snapshot_time, r.metric_value AS value
+        FROM dws_risk_metrics_dm r
+        JOIN dim_protocol_dm p ON r.protocol_id = p.protocol_id
+        WHERE lower(p.protocol_name) = ANY($1) AND r.metric_name = ANY($2)
+    """,
+}
+
+def build_batch_query(protocol_names, metrics, from_time=None, to_time=None, max_points=500, resolution="auto"):
+    """Returns (sql, args) bucketing every requested (protocol, metric) series in one query.
+
+    All series share one bucket width, chosen like `bucket_width` from the span of the
+    whole result, so their points line up and none has more than `max_points` points.
+    Each row is (protocol_name, metric, bucket, last, min, max, avg, width_seconds).
+    Raises ValueError for an unknown metric.
+    """
+    unknown = [metric for metric in metrics if metric not in BATCH_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metric: {', '.join(unknown)}")
+
+    tables = sorted({BATCH_METRICS[metric] for metric in metrics})
+    selects = [SERIES_SQL[table] for table in tables]
+
+    sql = f"""
+        WITH series AS (
+            {' UNION ALL '.join(selects)}
+        ),
+        ranged AS (
+            SELECT * FROM series
+            WHERE ($3::timestamptz IS NULL OR snapshot_time >= $3)
+            AND ($4::timestamptz IS NULL OR snapshot_time <= $4)
+        ),
+        needed AS (
+            SELECT GREATEST(1, CEIL(EXTRACT(epoch FROM MAX(snapshot_time) - MIN(snapshot_time)) / ($5::int - 2))) AS seconds
+            FROM ranged
+        ),
+        width AS (
+            SELECT CASE
+                WHEN $6::float8 >= n.seconds THEN $6::float8
+                ELSE COALESCE((SELECT MIN(w) FROM unnest($7::float8[]) w WHERE w >= n.seconds), n.seconds)
+            END AS seconds
+            FROM needed n
+        )
+        SELECT
+            r.protocol_name,
+            r.metric,
+            to_timestamp(floor(extract(epoch FROM r.snapshot_time) / w.seconds) * w.seconds) AS bucket,
+            (array_agg(r.value ORDER BY r.snapshot_time DESC))[1],
+            MIN(r.value),
+            MAX(r.value),
+            AVG(r.value),
+            w.seconds
+        FROM ranged r
+        CROSS JOIN width w
+        GROUP BY r.protocol_name, r.metric, bucket, w.seconds
+        ORDER BY r.protocol_name, r.metric, bucket
+    """
+    args = [
+        [protocol_name.lower() for protocol_name in protocol_names],
+        list(metrics),
+        from_time,
+        to_time,
+        max_points,
+        float(RESOLUTIONS.get(resolution, 0)),
+        [float(width) for width in sorted(RESOLUTIONS.values())],
+    ]
+    return sql, args
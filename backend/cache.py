@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+import asyncpg
+from dotenv import load_dotenv
+from backend.db import DATA_CHANGED_CHANNEL, asyncpg_connection_params
+
+load_dotenv()
+
+API_CACHE_ENABLED = os.getenv("API_CACHE_ENABLED", "1") == "1"
+# Number of API responses kept in memory; the least recently used ones are evicted beyond it
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", 1024))
+# Seconds between attempts to reconnect the invalidation listener
+API_CACHE_RECONNECT_SECONDS = 5
+
+class ResultCache:
+    """In-memory LRU cache of API responses, invalidated by table and protocol.
+
+    Every entry is tagged with the (table, protocol) pairs it was computed from, and
+    `evict` drops exactly the entries carrying a matching tag. The cache only serves
+    entries while `enabled`, i.e. while the invalidation listener is connected; a
+    response computed while an eviction for one of its tags came in is not stored.
+    Entries are only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_entries=API_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.enabled = False
+        self._entries = OrderedDict()
+        self._tag_keys = {}
+        # Eviction counters per tag, per whole table (protocol None), per table with any
+        # protocol ("any", table) and for everything (None)
+        self._versions = {}
+
+    @staticmethod
+    def tag(table, protocol_name=None):
+        return (table, protocol_name.lower() if protocol_name else None)
+
+    def _version(self, tags):
+        counters = []
+        for table, protocol_name in tags:
+            if protocol_name is None:
+                # Computed from every protocol's rows, so any eviction on the table matters
+                counters.append(self._versions.get(("any", table), 0))
+            else:
+                counters.append(self._versions.get((table, protocol_name), 0))
+                counters.append(self._versions.get((table, None), 0))
+        counters.append(self._versions.get(None, 0))
+        return tuple(counters)
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None."""
+        if not self.enabled or key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, value, tags, version):
+        """Stores `value` unless any of its tags was evicted since `version` was taken."""
+        if not self.enabled or version != self._version(tags):
+            return
+        self._drop(key)
+        self._entries[key] = (value, tags)
+        for tag in tags:
+            self._tag_keys.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    async def fetch(self, key, tags, compute):
+        """Returns the cached response for `key`, or awaits `compute()` and caches its result."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        tags = tuple(tags)
+        version = self._version(tags)
+        value = await compute()
+        self.put(key, value, tags, version)
+        return value
+
+    def evict(self, table, protocol_name=None):
+        """Drops the entries computed from `table` for a protocol, or for every protocol if None."""
+        if protocol_name is None:
+            tags = [tag for tag in self._tag_keys if tag[0] == table]
+        else:
+            tags = [self.tag(table, protocol_name), (table, None)]
+        for counter in (self.tag(table, protocol_name), ("any", table)):
+            self._versions[counter] = self._versions.get(counter, 0) + 1
+        for tag in tags:
+            for key in list(self._tag_keys.get(tag, ())):
+                self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._tag_keys.clear()
+        self._versions[None] = self._versions.get(None, 0) + 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+result_cache = ResultCache()
+
+async def listen_for_data_changes(cache=result_cache, observers=()):
+    """Keeps a dedicated connection LISTENing for ETL change notifications and evicts accordingly.
+
+    The cache is only enabled while the listener is connected. Whenever the connection drops,
+    the cache is cleared and disabled until the listener is back, since notifications may
+    have been missed in between. Each observer gets `data_changed(table, protocol_name)` for
+    every notification, and `resync()` whenever notifications may have been missed.
+    """
+    def on_data_changed(connection, pid, channel, payload):
+        try:
+            change = json.loads(payload)
+            cache.evict(change["table"], change.get("protocol"))
+        except (ValueError, KeyError, TypeError):
+            # We cannot tell what changed, so nothing cached can be trusted
+            print(f"Malformed {channel} notification: {payload}")
+            cache.clear()
+            for observer in observers:
+                observer.resync()
+            return
+        for observer in observers:
+            observer.data_changed(change["table"], change.get("protocol"))
+
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(**asyncpg_connection_params())
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            await connection.add_listener(DATA_CHANGED_CHANNEL, on_data_changed)
+            cache.clear()
+            cache.enabled = API_CACHE_ENABLED
+            for observer in observers:
+                observer.resync()
+            await lost.wait()
+            print("API cache listener disconnected")
+        except (OSError, asyncpg.PostgresError) as e:
+            print(f"API cache listener could not connect: {e}")
+        finally:
+            cache.enabled = False
+            cache.clear()
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(API_CACHE_RECONNECT_SECONDS)
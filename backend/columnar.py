@@ -0,0 +1,65 @@
+import sys
+from array import array
+from datetime import date, datetime, time, UTC
+import msgpack
+from fastapi import Request, Response
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+def wants_msgpack(request: Request):
+    """Returns True if the client prefers msgpack over JSON in its Accept header."""
+    preferred = None
+    best_quality = -1.0
+    for part in request.headers.get("accept", "").split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > best_quality:
+            preferred, best_quality = media_type, quality
+    return preferred in MSGPACK_MEDIA_TYPES
+
+def _epoch_ms(value):
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return int(value.timestamp() * 1000)
+
+def _packed(typecode, values):
+    packed = array(typecode, values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+def to_columns(records):
+    """Turns a list of same-shaped dicts into {name: column}.
+
+    Timestamps and dates become packed little-endian int64 epoch milliseconds, floats
+    become packed float64 and integers packed int64, each as
+    {"dtype": ..., "data": bytes}. Other values, such as strings and columns containing
+    None, are kept as plain lists.
+    """
+    if not records:
+        return {}
+    columns = {}
+    for name in records[0]:
+        values = [record[name] for record in records]
+        if all(isinstance(value, (datetime, date)) for value in values):
+            columns[name] = {"dtype": "timestamp[ms]", "data": _packed("q", map(_epoch_ms, values))}
+        elif all(isinstance(value, float) for value in values):
+            columns[name] = {"dtype": "float64", "data": _packed("d", values)}
+        elif all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            columns[name] = {"dtype": "int64", "data": _packed("q", values)}
+        else:
+            columns[name] = values
+    return columns
+
+def columnar_response(records, headers=None, **fields):
+    """Returns a msgpack response of {"length": n, "columns": {...}, **fields}."""
+    body = msgpack.packb({"length": len(records), "columns": to_columns(records), **fields}, use_bin_type=True)
+    return Response(content=body, media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
@@ -0,0 +1,46 @@
+import hashlib
+from datetime import UTC
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+
+def make_etag(version, request: Request, representation="json"):
+    """Returns a weak ETag for a response built from data at `version`.
+
+    The request's path and query, and the representation (json or msgpack), are part of
+    the tag, since they select different bodies from the same data.
+    """
+    raw = "|".join(map(str, (version, request.url.path, request.url.query, representation)))
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+def validator_headers(etag, last_modified=None):
+    headers = {"ETag": etag, "Vary": "Accept", "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(UTC), usegmt=True)
+    return headers
+
+def is_not_modified(request: Request, etag, last_modified=None, exists=True):
+    """Returns True if the client's cached copy, per If-None-Match or If-Modified-Since, is current.
+
+    `If-None-Match: *` only matches when a representation `exists`.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" and "x" name the same version
+        opaque = etag.removeprefix("W/")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return ("*" in tags and exists) or opaque in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=UTC)
+        # HTTP dates have a resolution of one second
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def not_modified_response(etag, last_modified=None):
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
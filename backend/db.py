@@ -1,14 +1,173 @@
+import asyncio
+import json
 import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+import asyncpg
 import psycopg2
+from psycopg2 import pool
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_db_connection():
-    return psycopg2.connect(
+# Connection pool sizing. Checkouts beyond DB_POOL_MAX_SIZE wait for a free connection.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Connections idle for longer than this many seconds are pinged before being handed out
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+
+# Async pool used by the API's read path. Requests waiting for a connection are suspended,
+# not blocking a thread, so the pool can stay small while serving many concurrent requests.
+API_DB_POOL_MIN_SIZE = int(os.getenv("API_DB_POOL_MIN_SIZE", 2))
+API_DB_POOL_MAX_SIZE = int(os.getenv("API_DB_POOL_MAX_SIZE", 20))
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_last_used = {}
+_transaction_end_callbacks = {}
+
+def _connection_params():
+    return dict(
         host=os.getenv("DB_HOST"),
         port=os.getenv("DB_PORT"),
         dbname=os.getenv("DB_NAME"),
         user=os.getenv("DB_USER"),
         password=os.getenv("DB_PASSWORD")
     )
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, **_connection_params())
+    return _pool
+
+def close_pool():
+    """Closes every pooled connection, e.g. on application shutdown."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < DB_POOL_HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def on_transaction_end(conn, callback):
+    """Calls `callback(committed)` when the transaction of a `get_connection()` block ends.
+
+    `committed` is True after a commit and False after a rollback, so state derived from
+    the transaction can be published or discarded.
+    """
+    _transaction_end_callbacks.setdefault(id(conn), []).append(callback)
+
+def _end_transaction(conn, committed):
+    for callback in _transaction_end_callbacks.pop(id(conn), ()):
+        callback(committed)
+
+@contextmanager
+def get_connection():
+    """Checks a healthy connection out of the pool and returns it when the block exits.
+
+    The transaction is committed if the block succeeds and rolled back if it raises.
+    """
+    _pool_slots.acquire()
+    db_pool = get_pool()
+    conn = None
+    try:
+        # Every pooled connection may have gone stale at once, e.g. after a database restart,
+        # so unhealthy ones are discarded until a healthy one (or a fresh one) is handed out
+        for _ in range(DB_POOL_MAX_SIZE + 1):
+            conn = db_pool.getconn()
+            if _is_healthy(conn):
+                break
+            _last_used.pop(id(conn), None)
+            db_pool.putconn(conn, close=True)
+            conn = None
+        else:
+            raise psycopg2.OperationalError("No healthy database connection could be checked out of the pool.")
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            _end_transaction(conn, committed=False)
+            if not conn.closed:
+                conn.rollback()
+            raise
+        _end_transaction(conn, committed=True)
+    finally:
+        if conn is not None:
+            if conn.closed:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            db_pool.putconn(conn, close=bool(conn.closed))
+        _pool_slots.release()
+
+def connect(**kwargs):
+    """Opens a dedicated connection outside the pool, e.g. for a session that changes its settings.
+
+    The caller owns the connection and must close it.
+    """
+    return psycopg2.connect(**_connection_params(), **kwargs)
+
+_async_pool = None
+_async_pool_lock = None
+
+def asyncpg_connection_params():
+    params = _connection_params()
+    params["database"] = params.pop("dbname")
+    return params
+
+async def get_async_pool():
+    """Returns the asyncpg pool of the running event loop, creating it on first use."""
+    global _async_pool, _async_pool_lock
+    if _async_pool is None:
+        if _async_pool_lock is None:
+            _async_pool_lock = asyncio.Lock()
+        async with _async_pool_lock:
+            if _async_pool is None:
+                _async_pool = await asyncpg.create_pool(
+                    min_size=API_DB_POOL_MIN_SIZE, max_size=API_DB_POOL_MAX_SIZE, **asyncpg_connection_params()
+                )
+    return _async_pool
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+@asynccontextmanager
+async def get_async_connection():
+    """Acquires a connection from the async pool and releases it when the block exits."""
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        yield conn
+
+# Channel on which ETLs announce committed changes, as JSON {"table": ..., "protocol": ...}
+DATA_CHANGED_CHANNEL = "dada_data_changed"
+
+def notify_data_changed(cursor, table, protocol_name=None):
+    """Announces that `table` changed for a protocol (or for every protocol if None).
+
+    Postgres delivers the notification only when the surrounding transaction commits,
+    so listeners never hear about changes that were rolled back.
+    """
+    payload = json.dumps({"table": table, "protocol": protocol_name})
+    cursor.execute("SELECT pg_notify(%s, %s)", (DATA_CHANGED_CHANNEL, payload))
@@ -0,0 +1,65 @@
+import math
+
+# Bucket widths (in seconds) a client can ask for with `resolution`
+RESOLUTIONS = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "15m": 15 * 60,
+    "1h": 60 * 60,
+    "6h": 6 * 60 * 60,
+    "1d": 24 * 60 * 60,
+    "1w": 7 * 24 * 60 * 60,
+}
+
+def bucket_width(span_seconds, max_points, resolution="auto"):
+    """Returns the bucket width in seconds for a time range of `span_seconds`.
+
+    The width is the requested resolution, widened when needed so that the range never
+    produces more than `max_points` buckets, counting the partial buckets at both ends
+    (so `max_points` must be at least 3). Automatic widths are rounded up to the next
+    entry of RESOLUTIONS so bucket boundaries stay readable.
+    """
+    needed = max(1, math.ceil(span_seconds / (max_points - 2))) if span_seconds > 0 else 1
+    requested = RESOLUTIONS.get(resolution, 0)
+    if requested >= needed:
+        return requested
+    for width in sorted(RESOLUTIONS.values()):
+        if width >= needed:
+            return width
+    return needed
+
+def lttb(points, threshold):
+    """Downsamples (x, y, ...) points to `threshold` points with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. Between them, each of the `threshold - 2`
+    buckets keeps the point forming the largest triangle with the previously kept point
+    and the average of the next bucket, which preserves peaks and troughs of the series.
+    Points must be sorted by x; extra tuple members are carried along untouched.
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(points))
+        next_bucket = points[next_start:next_end]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        # Point of the current bucket with the largest triangle area
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = points[a][0], points[a][1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
@@ -0,0 +1,66 @@
+from psycopg2.extras import execute_values
+from backend.etl.bulk_loader import BulkLoader
+
+def load_address_cursors(cursor, protocol_name):
+    """Returns {address: (last_tx_hash, last_block_height)} for a protocol's tracked addresses."""
+    cursor.execute("""
+        SELECT address, last_tx_hash, last_block_height
+        FROM etl_address_cursors
+        WHERE protocol_name = %s;
+    """, (protocol_name,))
+    return {address: (tx_hash, block_height) for address, tx_hash, block_height in cursor.fetchall()}
+
+def load_address_balances(cursor, protocol_name, addresses=None):
+    """Returns {address: {unit: quantity}} with the last stored balances of a protocol's addresses."""
+    if addresses is None:
+        cursor.execute("""
+            SELECT address, unit, quantity FROM etl_address_balances
+            WHERE protocol_name = %s;
+        """, (protocol_name,))
+    else:
+        cursor.execute("""
+            SELECT address, unit, quantity FROM etl_address_balances
+            WHERE protocol_name = %s AND address = ANY(%s);
+        """, (protocol_name, list(addresses)))
+    balances = {}
+    for address, unit, quantity in cursor.fetchall():
+        balances.setdefault(address, {})[unit] = int(quantity)
+    return balances
+
+def save_address_cursors(cursor, protocol_name, address_cursors):
+    """Upserts {address: (last_tx_hash, last_block_height)} cursors."""
+    execute_values(cursor, """
+        INSERT INTO etl_address_cursors (protocol_name, address, last_tx_hash, last_block_height)
+        VALUES %s
+        ON CONFLICT (protocol_name, address) DO UPDATE SET
+        last_tx_hash = EXCLUDED.last_tx_hash,
+        last_block_height = EXCLUDED.last_block_height,
+        updated_at = now();
+    """, [(protocol_name, address, tx_hash, block_height) for address, (tx_hash, block_height) in address_cursors.items()])
+
+def save_address_balances(cursor, protocol_name, balances):
+    """Replaces the stored balances of every address in {address: {unit: quantity}}."""
+    if not balances:
+        return
+    cursor.execute("""
+        DELETE FROM etl_address_balances
+        WHERE protocol_name = %s AND address = ANY(%s);
+    """, (protocol_name, list(balances)))
+    with BulkLoader(
+        cursor, "etl_address_balances",
+        columns=("protocol_name", "address", "unit", "quantity"),
+        conflict_columns=("protocol_name", "address", "unit"),
+        update_columns=("quantity",),
+    ) as loader:
+        for address, units in balances.items():
+            for unit, quantity in units.items():
+                if quantity:
+                    loader.add((protocol_name, address, unit, quantity))
+
+def forget_addresses_except(cursor, protocol_name, addresses):
+    """Drops cursors and balances of addresses that are no longer tracked."""
+    for table in ("etl_address_cursors", "etl_address_balances"):
+        cursor.execute(f"""
+            DELETE FROM {table}
+            WHERE protocol_name = %s AND NOT (address = ANY(%s));
+        """, (protocol_name, list(addresses)))
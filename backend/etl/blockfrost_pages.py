@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from blockfrost import ApiError
+from backend.etl.http_cache import CacheMiss
+
+def find_last_page(fetch_page, page_size, on_page=None, errors=None):
+    """Finds the last non-empty page by probing pages 1, 2, 4, 8, ... and then bisecting.
+
+    `fetch_page(page)` returns the items of a page. Every page fetched while probing is
+    passed to `on_page(page, items)` so callers can use it instead of fetching it again.
+    Pages that fail are appended to `errors` as (page, exception), if given.
+    Returns 0 when there are no items at all.
+    """
+    def probe(page):
+        try:
+            items = fetch_page(page)
+        except (ApiError, CacheMiss) as e:
+            # Treat an unreadable page as the end of the listing, like a sequential walk would
+            print(f"Error fetching page {page}: {e}")
+            if errors is not None:
+                errors.append((page, e))
+            items = []
+        if items and on_page:
+            on_page(page, items)
+        return len(items)
+
+    last_full, page = 0, 1
+    while True:
+        count = probe(page)
+        if count == 0:
+            first_empty = page
+            break
+        if count < page_size:
+            return page
+        last_full, page = page, page * 2
+
+    # The last page lies between the last full page and the first empty one
+    while first_empty - last_full > 1:
+        middle = (last_full + first_empty) // 2
+        count = probe(middle)
+        if count == 0:
+            first_empty = middle
+        elif count < page_size:
+            return middle
+        else:
+            last_full = middle
+    return last_full
+
+def iter_pages_concurrently(fetch_page, page_size=100, workers=8, errors=None):
+    """Yields (page, items) for every page of a paginated listing as soon as it arrives.
+
+    The page count is discovered with `find_last_page`; the remaining pages are then
+    fetched concurrently. Pages are not yielded in order. Rate limiting is left to
+    `fetch_page`, so callers sharing a limiter stay within it together. Failed pages are
+    skipped and appended to `errors` as (page, exception), if given.
+    """
+    probed = {}
+    last_page = find_last_page(fetch_page, page_size, on_page=probed.__setitem__, errors=errors)
+    yield from probed.items()
+
+    remaining = [page for page in range(1, last_page + 1) if page not in probed]
+    if not remaining:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(fetch_page, page): page for page in remaining}
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                items = future.result()
+            except (ApiError, CacheMiss) as e:
+                print(f"Error fetching page {page}: {e}")
+                if errors is not None:
+                    errors.append((page, e))
+                continue
+            if items:
+                yield page, items
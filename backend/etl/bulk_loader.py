@@ -0,0 +1,93 @@
+import csv
+import io
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rows buffered before a flush, and the maximum age (in seconds) of a buffered row.
+# Whichever limit is reached first triggers the flush.
+BULK_LOAD_BATCH_SIZE = int(os.getenv("BULK_LOAD_BATCH_SIZE", 5000))
+BULK_LOAD_FLUSH_INTERVAL = float(os.getenv("BULK_LOAD_FLUSH_INTERVAL", 5))
+
+class BulkLoader:
+    """Buffers fact rows and writes them with COPY into a staging table plus one set-based upsert.
+
+    Each flush COPYs the buffered rows into a temporary staging table and then runs a single
+    `INSERT ... SELECT ... ON CONFLICT` into the target table. Rows update `update_columns`
+    on conflict, or are skipped when no update columns are given. Within a batch the first
+    row for a key wins when skipping and the last row wins when updating, matching what
+    row-at-a-time inserts would have produced. Use it as a context manager so the final
+    partial batch is flushed; nothing is committed, that is left to the caller.
+    """
+
+    def __init__(self, cursor, table, columns, conflict_columns, update_columns=(),
+                 batch_size=BULK_LOAD_BATCH_SIZE, flush_interval=BULK_LOAD_FLUSH_INTERVAL):
+        self.cursor = cursor
+        self.table = table
+        self.columns = tuple(columns)
+        self.conflict_columns = tuple(conflict_columns)
+        self.update_columns = tuple(update_columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._key_indexes = [self.columns.index(c) for c in self.conflict_columns]
+        self._buffer = {}
+        self._oldest_row_at = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    def add(self, row):
+        """Buffers one row (a tuple ordered like `columns`), flushing if a limit is reached."""
+        key = tuple(row[i] for i in self._key_indexes)
+        if self.update_columns:
+            self._buffer[key] = row
+        else:
+            self._buffer.setdefault(key, row)
+        if self._oldest_row_at is None:
+            self._oldest_row_at = time.monotonic()
+        if (len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._oldest_row_at >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Writes every buffered row to the target table."""
+        if not self._buffer:
+            return
+        stage = f"stage_{self.table}"
+        column_list = ", ".join(self.columns)
+
+        data = io.StringIO()
+        writer = csv.writer(data)
+        for row in self._buffer.values():
+            writer.writerow(["\\N" if value is None else value for value in row])
+        data.seek(0)
+
+        if self.update_columns:
+            on_conflict = "DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in self.update_columns)
+        else:
+            on_conflict = "DO NOTHING"
+
+        self.cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {stage} ON COMMIT DROP AS
+            SELECT {column_list} FROM {self.table} WITH NO DATA;
+            TRUNCATE {stage};
+        """)
+        self.cursor.copy_expert(
+            f"COPY {stage} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", data
+        )
+        self.cursor.execute(f"""
+            INSERT INTO {self.table} ({column_list})
+            SELECT {column_list} FROM {stage}
+            ON CONFLICT ({", ".join(self.conflict_columns)}) {on_conflict};
+        """)
+        self.rows_written += self.cursor.rowcount
+        self._buffer.clear()
+        self._oldest_row_at = None
@@ -0,0 +1,500 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+import yaml
+from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.db import get_connection, close_pool, notify_data_changed
+from backend.etl.bulk_loader import BulkLoader
+from backend.etl.rollups import refresh_tvl_rollups
+from backend.etl.dimensions import dimension_cache, get_or_create_time_id, get_or_create_protocol_id, get_or_create_asset_id
+from backend.etl.price_oracle import price_oracle
+from backend.etl.rate_limit import rate_limited_call
+from blockfrost import ApiError
+
+load_dotenv()
+
+# Seconds to wait before polling the source again once the follower has caught up with the tip
+CHAIN_FOLLOWER_POLL_SECONDS = float(os.getenv("CHAIN_FOLLOWER_POLL_SECONDS", 20))
+# How often the in-memory balances are valued and written to dws_tvl_snapshots_dm
+CHAIN_FOLLOWER_SNAPSHOT_SECONDS = float(os.getenv("CHAIN_FOLLOWER_SNAPSHOT_SECONDS", 3600))
+# Number of applied blocks after which the checkpoint is saved even if no snapshot is due
+CHAIN_FOLLOWER_CHECKPOINT_BLOCKS = int(os.getenv("CHAIN_FOLLOWER_CHECKPOINT_BLOCKS", 50))
+# Number of recent blocks kept in memory so a chain rollback can be undone without refetching
+CHAIN_FOLLOWER_ROLLBACK_DEPTH = int(os.getenv("CHAIN_FOLLOWER_ROLLBACK_DEPTH", 2160))
+CHAIN_FOLLOWER_FETCH_WORKERS = int(os.getenv("CHAIN_FOLLOWER_FETCH_WORKERS", 8))
+
+PROTOCOL_ADDRESSES_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'config', 'protocol_addresses.yaml'))
+
+# Protocols the follower can track, with their dim_protocol_dm category and chain
+PROTOCOLS = {
+    "Indigo": ("CDP", "Cardano"),
+    "Liqwid": ("Lending Pool", "Cardano"),
+    "Minswap": ("DEX", "Cardano"),
+}
+
+class BlockNotFound(Exception):
+    """Raised by a block source when a block is no longer on the chain, i.e. it was rolled back."""
+
+def utxo_changes(tx_utxos, addresses):
+    """Returns the (address, unit, delta) balance changes a transaction causes on the given addresses.
+
+    `tx_utxos` is a Blockfrost /txs/{hash}/utxos payload. Collateral and reference inputs
+    are not spent by a valid transaction, and collateral outputs are not created by one.
+    """
+    changes = []
+    for utxo in tx_utxos["inputs"]:
+        if utxo["address"] in addresses and not utxo.get("collateral") and not utxo.get("reference"):
+            changes.extend((utxo["address"], amount["unit"], -int(amount["quantity"])) for amount in utxo["amount"])
+    for utxo in tx_utxos["outputs"]:
+        if utxo["address"] in addresses and not utxo.get("collateral"):
+            changes.extend((utxo["address"], amount["unit"], int(amount["quantity"])) for amount in utxo["amount"])
+    return changes
+
+class BlockfrostBlockSource:
+    """Reads blocks, transactions and address states from Blockfrost through the shared rate limiter."""
+
+    finished = False
+
+    def __init__(self, api=None):
+        if api is None:
+            from backend.etl.clients import get_blockfrost_api
+            api = get_blockfrost_api()
+        self.api = api
+
+    def refresh(self):
+        pass
+
+    def tip(self):
+        return rate_limited_call(self.api.block_latest, return_type='json')
+
+    def next_blocks(self, block_hash, count=100):
+        """Returns up to `count` blocks following `block_hash`, oldest first."""
+        try:
+            return rate_limited_call(self.api.blocks_next, block_hash, count=count, return_type='json')
+        except ApiError as e:
+            if e.status_code == 404:
+                raise BlockNotFound(block_hash) from e
+            raise
+
+    def block_transactions(self, block, addresses):
+        """Returns the UTxO payloads of the transactions in a block that touch any of the given addresses."""
+        affected = rate_limited_call(self.api.blocks_addresses, block["hash"], gather_pages=True, return_type='json')
+        tx_hashes = {
+            tx["tx_hash"]
+            for entry in affected if entry["address"] in addresses
+            for tx in entry["transactions"]
+        }
+        return [rate_limited_call(self.api.transaction_utxos, tx_hash, return_type='json') for tx_hash in sorted(tx_hashes)]
+
+    def address_state(self, address):
+        """Returns ({unit: quantity}, anchor_height): the current balances of an address and the
+        height of the newest block they already include.
+
+        The newest transaction is read before and after the UTxOs and the read is retried if a
+        transaction landed in between, so the balances match the anchor exactly.
+        """
+        for _ in range(3):
+            before = self._latest_height(address)
+            try:
+                utxos = rate_limited_call(self.api.address_utxos, address, gather_pages=True, return_type='json')
+            except ApiError as e:
+                if e.status_code != 404:
+                    raise
+                utxos = []  # Address never used on chain
+            if self._latest_height(address) == before:
+                balances = {}
+                for utxo in utxos:
+                    for amount in utxo["amount"]:
+                        balances[amount["unit"]] = balances.get(amount["unit"], 0) + int(amount["quantity"])
+                return balances, before
+        raise RuntimeError(f"Address {address} kept changing while its UTxOs were read")
+
+    def _latest_height(self, address):
+        try:
+            txs = rate_limited_call(self.api.address_transactions, address, count=1, order='desc', return_type='json')
+        except ApiError as e:
+            if e.status_code == 404:
+                return -1  # Address never used on chain
+            raise
+        return txs[0]["block_height"] if txs else -1
+
+class FixtureBlockSource:
+    """A local stand-in for Blockfrost fed by a recorded JSON fixture.
+
+    The fixture holds a `timeline`: a list of views of the chain, each a list of blocks
+    (Blockfrost block payloads with an extra `transactions` list of /txs/{hash}/utxos payloads).
+    Every call to `refresh` moves on to the next view, so a view that replaces the last blocks
+    of the previous one replays a rollback. `address_states` maps addresses to their recorded
+    `balances` and `anchor_height`, and `tracked_addresses` maps protocol names to addresses.
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            fixture = json.load(f)
+        self.timeline = fixture["timeline"]
+        self.address_states = fixture.get("address_states", {})
+        self.tracked_addresses = fixture.get("tracked_addresses")
+        self._view = -1
+        self._blocks = {}
+        self.refresh()
+
+    @property
+    def finished(self):
+        return self._view == len(self.timeline) - 1
+
+    def refresh(self):
+        if self._view < len(self.timeline) - 1:
+            self._view += 1
+            self._chain = self.timeline[self._view]
+            self._blocks = {block["hash"]: index for index, block in enumerate(self._chain)}
+
+    def tip(self):
+        return self._chain[-1]
+
+    def next_blocks(self, block_hash, count=100):
+        if block_hash not in self._blocks:
+            raise BlockNotFound(block_hash)
+        start = self._blocks[block_hash] + 1
+        return self._chain[start:start + count]
+
+    def block_transactions(self, block, addresses):
+        return [
+            tx for tx in block.get("transactions", [])
+            if any(utxo["address"] in addresses for utxo in tx["inputs"] + tx["outputs"])
+        ]
+
+    def address_state(self, address):
+        state = self.address_states.get(address, {})
+        balances = {unit: int(quantity) for unit, quantity in state.get("balances", {}).items()}
+        return balances, state.get("anchor_height", -1)
+
+class ChainFollower:
+    """Keeps a per-address balance index up to date by applying the transactions of each new block.
+
+    Only the in-memory state lives here; loading and saving it is done by `load_checkpoint`
+    and `save_checkpoint`. Recently applied blocks are kept with their deltas so a rollback
+    can be undone block by block.
+    """
+
+    def __init__(self, source, name="tvl", rollback_depth=CHAIN_FOLLOWER_ROLLBACK_DEPTH, workers=CHAIN_FOLLOWER_FETCH_WORKERS):
+        self.source = source
+        self.name = name
+        self.workers = workers
+        self.tip = None
+        self.address_protocols = {}
+        self.balances = {}
+        # Blocks at or below an address's anchor are already reflected in its bootstrapped balances
+        self.anchors = {}
+        self.dirty = set()
+        self.undo_log = deque(maxlen=rollback_depth)
+        self.blocks_since_checkpoint = 0
+
+    def track(self, tracked_addresses):
+        """Sets the tracked {protocol_name: [addresses]}, bootstrapping new addresses from the source."""
+        address_protocols = {
+            address: protocol_name
+            for protocol_name, addresses in tracked_addresses.items()
+            for address in addresses
+        }
+        for address in set(self.address_protocols) - set(address_protocols):
+            self.balances.pop(address, None)
+            self.anchors.pop(address, None)
+            self.dirty.add(address)
+        new_addresses = [address for address in address_protocols if address not in self.balances]
+        self.address_protocols = address_protocols
+        self.bootstrap(new_addresses)
+
+    def bootstrap(self, addresses):
+        if not addresses:
+            return
+        print(f"Bootstrapping {len(addresses)} addresses from the block source...")
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            for address, (balances, anchor) in zip(addresses, executor.map(self.source.address_state, addresses)):
+                self.balances[address] = balances
+                self.anchors[address] = anchor
+                self.dirty.add(address)
+
+    def start(self, tracked_addresses):
+        """Starts from the current tip with every tracked address bootstrapped from the source."""
+        self.tip = self.source.tip()
+        self.balances.clear()
+        self.anchors.clear()
+        self.undo_log.clear()
+        self.address_protocols = {}
+        self.track(tracked_addresses)
+
+    def apply_block(self, block):
+        applied = []
+        height = block["height"]
+        for tx in self.source.block_transactions(block, self.address_protocols):
+            for address, unit, delta in utxo_changes(tx, self.address_protocols):
+                if height <= self.anchors.get(address, -1):
+                    continue
+                self._add(address, unit, delta)
+                applied.append((address, unit, delta))
+        self.undo_log.append((self.tip, applied))
+        self.tip = block
+        self.blocks_since_checkpoint += 1
+
+    def roll_back(self):
+        """Undoes the newest applied block. Returns False if there is nothing left to undo."""
+        if not self.undo_log:
+            return False
+        previous_tip, applied = self.undo_log.pop()
+        for address, unit, delta in applied:
+            if address in self.balances:
+                self._add(address, unit, -delta)
+        print(f"↩ Rolled back block {self.tip['height']} ({self.tip['hash']})")
+        self.tip = previous_tip
+        self.blocks_since_checkpoint += 1
+        return True
+
+    def sync(self):
+        """Applies the blocks following the current tip. Returns the number of blocks applied or undone."""
+        try:
+            blocks = self.source.next_blocks(self.tip["hash"])
+        except BlockNotFound:
+            if self.roll_back():
+                return 1
+            # The fork is deeper than the undo log: start over from the current chain
+            print("⚠ Rollback deeper than the undo log, re-bootstrapping all addresses")
+            self.start(self.tracked_addresses())
+            return 1
+        applied = 0
+        for block in blocks:
+            if block.get("previous_block") != self.tip["hash"]:
+                # The chain switched forks between two requests; the next sync will roll back
+                break
+            self.apply_block(block)
+            applied += 1
+        return applied
+
+    def tracked_addresses(self):
+        tracked = {}
+        for address, protocol_name in self.address_protocols.items():
+            tracked.setdefault(protocol_name, []).append(address)
+        return tracked
+
+    def _add(self, address, unit, delta):
+        units = self.balances.setdefault(address, {})
+        quantity = units.get(unit, 0) + delta
+        if quantity:
+            units[unit] = quantity
+        else:
+            units.pop(unit, None)
+        self.dirty.add(address)
+
+def load_tracked_addresses(cursor, path=PROTOCOL_ADDRESSES_PATH):
+    """Returns {protocol_name: [addresses]} to follow.
+
+    Indigo CDPs come from the addresses the Indigo ETL is tracking; other protocols come from
+    config/protocol_addresses.yaml.
+    """
+    tracked = {}
+    cursor.execute("SELECT address FROM etl_address_cursors WHERE protocol_name = 'Indigo';")
+    indigo = [address for (address,) in cursor.fetchall()]
+    if indigo:
+        tracked["Indigo"] = indigo
+
+    if os.path.exists(path):
+        with open(path) as f:
+            config = yaml.safe_load(f) or {}
+        for key, addresses in (config.get("protocols") or {}).items():
+            protocol_name = key.capitalize()
+            if protocol_name in PROTOCOLS and addresses:
+                tracked.setdefault(protocol_name, [])
+                tracked[protocol_name].extend(a for a in addresses if a not in tracked[protocol_name])
+    return tracked
+
+def load_checkpoint(cursor, follower):
+    """Restores a follower's tip, balances and pending anchors from its last checkpoint.
+    Returns False if it has none."""
+    cursor.execute("""
+        SELECT block_hash, block_height, slot, anchors FROM etl_chain_checkpoints
+        WHERE follower_name = %s;
+    """, (follower.name,))
+    row = cursor.fetchone()
+    if row is None:
+        return False
+    follower.tip = {"hash": row[0], "height": row[1], "slot": row[2]}
+    anchors = row[3] or {}
+
+    cursor.execute("""
+        SELECT address, protocol_name, unit, quantity FROM etl_chain_balances
+        WHERE follower_name = %s;
+    """, (follower.name,))
+    follower.balances.clear()
+    follower.address_protocols.clear()
+    for address, protocol_name, unit, quantity in cursor.fetchall():
+        follower.balances.setdefault(address, {})[unit] = int(quantity)
+        follower.address_protocols[address] = protocol_name
+    follower.anchors.clear()
+    follower.anchors.update({address: int(height) for address, height in anchors.items()})
+    follower.dirty.clear()
+    follower.blocks_since_checkpoint = 0
+    return True
+
+def save_checkpoint(cursor, follower):
+    """Saves the follower's tip together with the balances of every address changed since the last checkpoint.
+
+    Anchors above the tip are saved too: a resumed follower must still skip the blocks
+    up to them, which are already part of the bootstrapped balances.
+    """
+    dirty = list(follower.dirty)
+    if dirty:
+        cursor.execute("""
+            DELETE FROM etl_chain_balances
+            WHERE follower_name = %s AND address = ANY(%s);
+        """, (follower.name, dirty))
+        with BulkLoader(
+            cursor, "etl_chain_balances",
+            columns=("follower_name", "address", "unit", "protocol_name", "quantity"),
+            conflict_columns=("follower_name", "address", "unit"),
+            update_columns=("protocol_name", "quantity"),
+        ) as loader:
+            for address in dirty:
+                protocol_name = follower.address_protocols.get(address)
+                if protocol_name is None:
+                    continue  # No longer tracked
+                for unit, quantity in follower.balances.get(address, {}).items():
+                    loader.add((follower.name, address, unit, protocol_name, quantity))
+
+    pending_anchors = {
+        address: height for address, height in follower.anchors.items()
+        if height > follower.tip["height"] and address in follower.address_protocols
+    }
+    cursor.execute("""
+        INSERT INTO etl_chain_checkpoints (follower_name, block_hash, block_height, slot, anchors)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (follower_name) DO UPDATE SET
+        block_hash = EXCLUDED.block_hash,
+        block_height = EXCLUDED.block_height,
+        slot = EXCLUDED.slot,
+        anchors = EXCLUDED.anchors,
+        updated_at = now();
+    """, (follower.name, follower.tip["hash"], follower.tip["height"], follower.tip.get("slot"), json.dumps(pending_anchors)))
+    follower.dirty.clear()
+    follower.blocks_since_checkpoint = 0
+
+def write_snapshot(cursor, follower):
+    """Values the follower's balances with the shared price oracle and writes them to dws_tvl_snapshots_dm.
+
+    Units without a price are left out. The snapshot is timestamped with the tip block's time,
+    so a replayed fixture writes the same rows.
+    """
+    snapshot_time = datetime.fromtimestamp(follower.tip["time"], UTC) if follower.tip.get("time") else datetime.now(UTC)
+    time_id = get_or_create_time_id(cursor, snapshot_time)
+    protocol_ids = {
+        protocol_name: get_or_create_protocol_id(cursor, protocol_name, *PROTOCOLS[protocol_name])
+        for protocol_name in set(follower.address_protocols.values())
+    }
+    tokens = {
+        unit: price_oracle.token_for_unit(unit)
+        for unit in {unit for units in follower.balances.values() for unit in units}
+    }
+    dimension_cache.ensure_assets(cursor, [
+        (token.symbol, token.name, token.policy_id, token.asset_name_hex)
+        for token in tokens.values() if token is not None
+    ])
+
+    with BulkLoader(
+        cursor, "dws_tvl_snapshots_dm",
+        columns=("protocol_id", "asset_id", "time_id", "address", "tvl_usd", "data_source"),
+        conflict_columns=("protocol_id", "asset_id", "time_id", "address"),
+        update_columns=("tvl_usd", "data_source"),
+    ) as loader:
+        for address, protocol_name in follower.address_protocols.items():
+            for unit, quantity in follower.balances.get(address, {}).items():
+                tvl_usd = price_oracle.value_usd(unit, quantity, cursor)
+                if tvl_usd is None:
+                    continue
+                token = tokens[unit]
+                loader.add((
+                    protocol_ids[protocol_name],
+                    get_or_create_asset_id(cursor, token.symbol, token.name, token.policy_id, token.asset_name_hex),
+                    time_id,
+                    address,
+                    tvl_usd,
+                    'Blockfrost Chain Follower'
+                ))
+    refresh_tvl_rollups(cursor, protocol_ids.values(), [time_id])
+    return loader.rows_written
+
+def run_follower(source, name="tvl", poll_seconds=CHAIN_FOLLOWER_POLL_SECONDS, snapshot_seconds=CHAIN_FOLLOWER_SNAPSHOT_SECONDS,
+                 checkpoint_blocks=CHAIN_FOLLOWER_CHECKPOINT_BLOCKS, tracked_addresses=None):
+    """Follows the chain from the last checkpoint (or the current tip) until the source is finished.
+
+    Against Blockfrost this runs forever. Blocks are applied as they arrive; balances are
+    checkpointed every `checkpoint_blocks` blocks and valued into a TVL snapshot every
+    `snapshot_seconds`, always in the same transaction as the checkpoint.
+    """
+    follower = ChainFollower(source, name=name)
+
+    def current_tracked_addresses(cursor):
+        return tracked_addresses if tracked_addresses is not None else load_tracked_addresses(cursor)
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        tracked = current_tracked_addresses(cursor)
+        if load_checkpoint(cursor, follower):
+            print(f"Resuming follower '{name}' from block {follower.tip['height']} ({follower.tip['hash']})")
+            follower.track(tracked)
+        else:
+            follower.start(tracked)
+            print(f"Starting follower '{name}' at block {follower.tip['height']} ({follower.tip['hash']})")
+        save_checkpoint(cursor, follower)
+
+    last_snapshot = None
+    while True:
+        changed = follower.sync()
+        while changed and follower.blocks_since_checkpoint < checkpoint_blocks:
+            changed = follower.sync()
+        caught_up = not changed
+
+        snapshot_due = caught_up and (last_snapshot is None or time.monotonic() - last_snapshot >= snapshot_seconds)
+        finished = caught_up and source.finished
+        if snapshot_due or finished or follower.blocks_since_checkpoint >= checkpoint_blocks:
+            with get_connection() as conn, conn.cursor() as cursor:
+                if snapshot_due:
+                    follower.track(current_tracked_addresses(cursor))
+                    rows = write_snapshot(cursor, follower)
+                    for protocol_name in set(follower.address_protocols.values()):
+                        notify_data_changed(cursor, "dws_tvl_snapshots_dm", protocol_name)
+                    print(f"📸 Wrote {rows} TVL rows at block {follower.tip['height']}")
+                save_checkpoint(cursor, follower)
+            if snapshot_due:
+                last_snapshot = time.monotonic()
+
+        if finished:
+            return follower
+        if caught_up:
+            time.sleep(poll_seconds)
+            source.refresh()
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow the Cardano chain block by block and keep protocol TVL up to date.")
+    parser.add_argument("--name", default="tvl", help="Follower name; each name keeps its own checkpoint.")
+    parser.add_argument("--fixture", help="Replay a recorded JSON fixture instead of following Blockfrost.")
+    args = parser.parse_args()
+
+    if args.fixture:
+        source = FixtureBlockSource(args.fixture)
+        tracked_addresses = source.tracked_addresses
+        poll_seconds = 0
+    else:
+        source = BlockfrostBlockSource()
+        tracked_addresses = None
+        poll_seconds = CHAIN_FOLLOWER_POLL_SECONDS
+
+    try:
+        run_follower(source, name=args.name, poll_seconds=poll_seconds, tracked_addresses=tracked_addresses)
+    finally:
+        close_pool()
+
+if __name__ == "__main__":
+    main()
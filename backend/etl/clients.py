@@ -0,0 +1,20 @@
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+from blockfrost import BlockFrostApi, ApiUrls
+from pycoingecko import CoinGeckoAPI
+
+load_dotenv()
+
+@lru_cache(maxsize=None)
+def get_blockfrost_api():
+    """Returns the process-wide Blockfrost client."""
+    return BlockFrostApi(
+        project_id=os.getenv("BLOCKFROST_API_KEY"),
+        base_url=ApiUrls.mainnet.value
+    )
+
+@lru_cache(maxsize=None)
+def get_coingecko_api():
+    """Returns the process-wide CoinGecko client."""
+    return CoinGeckoAPI()
@@ -0,0 +1,171 @@
+import threading
+from datetime import timedelta
+from psycopg2.extras import execute_values
+from backend.db import on_transaction_end
+from backend.etl.partitions import ensure_partitions
+from backend.timekeys import TIME_GRAIN_MINUTES, day_bounds, time_id_for, time_id_start
+
+# Maximum number of keys sent in one bulk upsert statement
+DIMENSION_BATCH_SIZE = 1000
+
+class DimensionCache:
+    """Process-wide cache of surrogate keys for dim_protocol_dm and dim_asset_dm, and of the
+    days populated in dim_time_dm.
+
+    Both keyed dimensions are preloaded with a single query on first use. Lookups are then
+    served from memory, and missing keys are bulk-upserted in batches. Time keys are computed
+    from the timestamp; the dimension only needs each day populated once, for the foreign
+    keys of the facts. Keys and days created by a transaction are only visible to that
+    transaction's connection until it commits, so parallel jobs never write facts pointing
+    at dimension rows another job has not committed yet; a rollback discards them.
+    """
+
+    def __init__(self):
+        self._time_days = set()
+        self._protocol_ids = {}
+        self._asset_ids = {}
+        self._pending = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drops every cached key; the next lookup reloads the dimensions."""
+        with self._lock:
+            self._time_days.clear()
+            self._protocol_ids.clear()
+            self._asset_ids.clear()
+            self._loaded = False
+
+    def preload(self, cursor):
+        """Loads every existing dimension key with one round trip."""
+        cursor.execute("""
+            SELECT 'protocol', protocol_name, protocol_id FROM dim_protocol_dm
+            UNION ALL
+            SELECT 'asset', asset_symbol, asset_id FROM dim_asset_dm;
+        """)
+        targets = {"protocol": self._protocol_ids, "asset": self._asset_ids}
+        with self._lock:
+            for dimension, natural_key, surrogate_key in cursor.fetchall():
+                targets[dimension][natural_key] = surrogate_key
+            self._loaded = True
+
+    def _ensure_loaded(self, cursor):
+        if not self._loaded:
+            self.preload(cursor)
+
+    def _pending_for(self, cursor):
+        """Returns the keys created by the cursor's open transaction, to be published on commit."""
+        conn = cursor.connection
+        with self._lock:
+            pending = self._pending.get(id(conn))
+            if pending is not None:
+                return pending
+            pending = self._pending[id(conn)] = {"days": set(), "protocol": {}, "asset": {}}
+        on_transaction_end(conn, lambda committed: self._end_transaction(id(conn), committed))
+        return pending
+
+    def _end_transaction(self, conn_id, committed):
+        with self._lock:
+            pending = self._pending.pop(conn_id, None)
+            if pending and committed:
+                self._time_days.update(pending["days"])
+                self._protocol_ids.update(pending["protocol"])
+                self._asset_ids.update(pending["asset"])
+
+    def _lookup(self, cursor, dimension, natural_key):
+        committed = self._protocol_ids if dimension == "protocol" else self._asset_ids
+        key = committed.get(natural_key)
+        if key is None:
+            pending = self._pending.get(id(cursor.connection))
+            key = pending[dimension].get(natural_key) if pending else None
+        return key
+
+    def _has_day(self, cursor, day):
+        if day in self._time_days:
+            return True
+        pending = self._pending.get(id(cursor.connection))
+        return bool(pending) and day in pending["days"]
+
+    def time_id(self, cursor, timestamp):
+        """Returns the time_id of the bucket containing `timestamp`, populating its day in dim_time_dm once."""
+        time_id = time_id_for(timestamp)
+        day = time_id_start(time_id).date()
+        if not self._has_day(cursor, day):
+            self.ensure_days(cursor, day, day)
+        return time_id
+
+    def ensure_days(self, cursor, start_date, end_date, grain_minutes=TIME_GRAIN_MINUTES):
+        """Populates dim_time_dm with every bucket of a date range in one set-based statement."""
+        start, _ = day_bounds(start_date)
+        _, end = day_bounds(end_date)
+        cursor.execute("SELECT populate_dim_time_dm(%s, %s, %s)", (start, end, grain_minutes))
+        # The first write to a day also makes sure the fact tables have partitions for it and beyond
+        ensure_partitions(start, end)
+        days = self._pending_for(cursor)["days"]
+        day = start_date
+        while day <= end_date:
+            days.add(day)
+            day += timedelta(days=1)
+
+    def protocol_id(self, cursor, protocol_name, protocol_segment, chain):
+        """Returns the protocol_id for a protocol, creating the dimension row if needed."""
+        self._ensure_loaded(cursor)
+        protocol_id = self._lookup(cursor, "protocol", protocol_name)
+        if protocol_id is None:
+            self.ensure_protocols(cursor, [(protocol_name, protocol_segment, chain)])
+            protocol_id = self._lookup(cursor, "protocol", protocol_name)
+        return protocol_id
+
+    def ensure_protocols(self, cursor, protocols):
+        """Bulk-upserts (protocol_name, protocol_segment, chain) tuples that are not cached yet."""
+        self._ensure_loaded(cursor)
+        missing = {p[0]: p for p in protocols if self._lookup(cursor, "protocol", p[0]) is None}
+        self._upsert(cursor, """
+            INSERT INTO dim_protocol_dm (protocol_name, protocol_segment, chain)
+            VALUES %s
+            ON CONFLICT (protocol_name) DO UPDATE SET protocol_name = EXCLUDED.protocol_name
+            RETURNING protocol_name, protocol_id;
+        """, list(missing.values()), "protocol")
+
+    def asset_id(self, cursor, asset_symbol, asset_name, asset_policy_id=None, asset_fingerprint=None):
+        """Returns the asset_id for an asset symbol, creating the dimension row if needed."""
+        self._ensure_loaded(cursor)
+        asset_id = self._lookup(cursor, "asset", asset_symbol)
+        if asset_id is None:
+            self.ensure_assets(cursor, [(asset_symbol, asset_name, asset_policy_id, asset_fingerprint)])
+            asset_id = self._lookup(cursor, "asset", asset_symbol)
+        return asset_id
+
+    def ensure_assets(self, cursor, assets):
+        """Bulk-upserts (asset_symbol, asset_name, asset_policy_id, asset_fingerprint) tuples that are not cached yet."""
+        self._ensure_loaded(cursor)
+        missing = {a[0]: a for a in assets if self._lookup(cursor, "asset", a[0]) is None}
+        self._upsert(cursor, """
+            INSERT INTO dim_asset_dm (asset_symbol, asset_name, asset_policy_id, asset_fingerprint)
+            VALUES %s
+            ON CONFLICT (asset_symbol) DO UPDATE SET asset_symbol = EXCLUDED.asset_symbol
+            RETURNING asset_symbol, asset_id;
+        """, list(missing.values()), "asset")
+
+    def _upsert(self, cursor, query, rows, dimension):
+        # The no-op DO UPDATE makes RETURNING include rows another process inserted concurrently
+        if not rows:
+            return
+        pending = self._pending_for(cursor)[dimension]
+        for start in range(0, len(rows), DIMENSION_BATCH_SIZE):
+            returned = execute_values(cursor, query, rows[start:start + DIMENSION_BATCH_SIZE], fetch=True)
+            pending.update(returned)
+
+dimension_cache = DimensionCache()
+
+def get_or_create_time_id(cursor, timestamp):
+    """Gets or creates a time_id from dim_time_dm for a given timestamp."""
+    return dimension_cache.time_id(cursor, timestamp)
+
+def get_or_create_protocol_id(cursor, protocol_name, protocol_segment, chain):
+    """Gets or creates a protocol_id from dim_protocol_dm for a given protocol."""
+    return dimension_cache.protocol_id(cursor, protocol_name, protocol_segment, chain)
+
+def get_or_create_asset_id(cursor, asset_symbol, asset_name, asset_policy_id=None, asset_fingerprint=None):
+    """Gets or creates an asset_id from dim_asset_dm for a given asset."""
+    return dimension_cache.asset_id(cursor, asset_symbol, asset_name, asset_policy_id, asset_fingerprint)
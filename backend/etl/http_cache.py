@@ -0,0 +1,151 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from blockfrost.utils import convert_json_to_object
+from backend.etl.rate_limit import rate_limited_call
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "1") == "1"
+HTTP_CACHE_PATH = os.getenv(
+    "HTTP_CACHE_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.cache', 'http_cache.sqlite3'))
+)
+# Total size of cached response bodies; least recently used entries are evicted beyond it
+HTTP_CACHE_MAX_MB = float(os.getenv("HTTP_CACHE_MAX_MB", 256))
+# Offline replay: serve every request from the cache regardless of age and never hit the network
+HTTP_CACHE_OFFLINE = os.getenv("HTTP_CACHE_OFFLINE", "0") == "1"
+
+# How long (in seconds) a response stays fresh, per endpoint
+HTTP_CACHE_TTLS = {
+    "defillama_tvl": 10 * 60,
+    "coingecko_price": 60,
+    "blockfrost_asset_addresses": 10 * 60,
+    "blockfrost_address_utxos": 5 * 60,
+    "blockfrost_address_transactions": 60,
+}
+DEFAULT_TTL = 60
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a request has no cached response."""
+
+class ResponseCache:
+    """Disk-backed (SQLite) cache of JSON API responses with per-endpoint TTLs and LRU eviction."""
+
+    def __init__(self, path=HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_MB * 1024 * 1024, offline=HTTP_CACHE_OFFLINE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connection(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # WAL lets several ETL processes share the cache file
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        return self._db
+
+    @staticmethod
+    def make_key(endpoint, params):
+        raw = json.dumps([endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key, max_age=None):
+        """Returns the cached body for `key`, or None if missing or older than `max_age` seconds."""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            row = db.execute("SELECT body, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (max_age is not None and now - row[1] > max_age):
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, endpoint, payload):
+        body = json.dumps(payload)
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("""
+                INSERT OR REPLACE INTO responses (key, endpoint, body, size, fetched_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, endpoint, body, len(body), now, now))
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+
+    def fetch(self, endpoint, params, fetch_fn, ttl=None):
+        """Returns the JSON response for `endpoint`/`params`, calling `fetch_fn()` only when the cache cannot serve it."""
+        key = self.make_key(endpoint, params)
+        if self.offline:
+            payload = self.get(key)
+            if payload is None:
+                raise CacheMiss(f"No cached response for {endpoint} {params} (offline mode)")
+            return payload
+
+        if ttl is None:
+            ttl = HTTP_CACHE_TTLS.get(endpoint, DEFAULT_TTL)
+        payload = self.get(key, max_age=ttl)
+        if payload is None:
+            payload = fetch_fn()
+            self.put(key, endpoint, payload)
+        return payload
+
+response_cache = ResponseCache()
+
+def cached_json(endpoint, params, fetch_fn, ttl=None):
+    """Fetches a JSON response through the shared cache, or directly if caching is disabled."""
+    if not HTTP_CACHE_ENABLED:
+        return fetch_fn()
+    return response_cache.fetch(endpoint, params, fetch_fn, ttl)
+
+def cached_blockfrost(endpoint, func, *args, cache_ttl=None, cache_version=None, **kwargs):
+    """Calls a Blockfrost API method through the cache, returning the same objects the SDK would.
+
+    Only cache misses reach Blockfrost, and those go through the shared rate limiter.
+    `cache_ttl` overrides the endpoint's TTL; 0 always fetches live but still records the
+    response, so offline replays keep working. `cache_version` is added to the cache key of
+    a response that cannot change while the version stays the same, e.g. an address's UTxOs
+    at its latest transaction; such responses do not expire unless `cache_ttl` says so.
+    """
+    params = [args, kwargs]
+    if cache_version is not None:
+        params.append(cache_version)
+        if cache_ttl is None:
+            cache_ttl = math.inf
+    payload = cached_json(
+        endpoint, params,
+        lambda: rate_limited_call(func, *args, return_type='json', **kwargs),
+        ttl=cache_ttl
+    )
+    return convert_json_to_object(payload)
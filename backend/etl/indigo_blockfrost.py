@@ -1,177 +1,204 @@
 
 import os
-import psycopg2
 from dotenv import load_dotenv
-from datetime import datetime, UTC, timedelta
+from datetime import datetime, UTC
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-from backend.db import get_db_connection
-from blockfrost import BlockFrostApi, ApiError, ApiUrls
-from pycoingecko import CoinGeckoAPI
+from backend.db import get_connection, notify_data_changed
+from backend.etl.dimensions import dimension_cache, get_or_create_time_id, get_or_create_protocol_id, get_or_create_asset_id
+from backend.etl.http_cache import CacheMiss, cached_blockfrost
+from backend.etl.bulk_loader import BulkLoader
+from backend.etl.rollups import refresh_tvl_rollups
+from backend.etl.address_state import load_address_cursors, load_address_balances, save_address_cursors, save_address_balances, forget_addresses_except
+from backend.etl.blockfrost_pages import iter_pages_concurrently
+from blockfrost import ApiError
+from backend.etl.clients import get_blockfrost_api
+from backend.etl.price_oracle import price_oracle
 
 load_dotenv()
 
-api = BlockFrostApi(
-    project_id=os.getenv("BLOCKFROST_API_KEY"),
-    base_url=ApiUrls.mainnet.value
-)
-
-# Configure data retention (in days) via environment variable
-# Set to 0 or comment out to disable retention
-DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", 0))
-
-def delete_old_data(table_name, protocol_name, retention_days):
-    """Deletes data older than retention_days for a given protocol from a specified table."""
-    if retention_days <= 0:
-        print(f"Data retention is disabled for {protocol_name} in {table_name}.")
-        return
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cutoff_date = datetime.now(UTC) - timedelta(days=retention_days)
-    print(f"Deleting {protocol_name} data from {table_name} older than {cutoff_date}...")
-    cursor.execute(f"""
-        DELETE FROM {table_name}
-        WHERE protocol_id IN (
-            SELECT protocol_id FROM dim_protocol_dm WHERE protocol_name = %s
-        ) AND time_id IN (
-            SELECT time_id FROM dim_time_dm WHERE date < %s
-        );
-    """, (protocol_name, cutoff_date.date()))
-    deleted_rows = cursor.rowcount
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print(f"Deleted {deleted_rows} old rows for {protocol_name} in {table_name}.")
-
-def get_or_create_time_id(cursor, timestamp):
-    """Gets or creates a time_id from dim_time_dm for a given timestamp."""
-    date_only = timestamp.date()
-    cursor.execute("SELECT time_id FROM dim_time_dm WHERE date = %s", (date_only,))
-    time_id = cursor.fetchone()
-    if time_id:
-        return time_id[0]
-    else:
-        # Populate dim_time_dm for the date if it doesn't exist
-        cursor.execute("SELECT populate_dim_time_dm(%s, %s)", (date_only, date_only))
-        cursor.execute("SELECT time_id FROM dim_time_dm WHERE date = %s", (date_only,))
-        return cursor.fetchone()[0]
-
-def get_or_create_protocol_id(cursor, protocol_name, protocol_segment, chain):
-    """Gets or creates a protocol_id from dim_protocol_dm for a given protocol."""
-    cursor.execute("SELECT protocol_id FROM dim_protocol_dm WHERE protocol_name = %s", (protocol_name,))
-    protocol_id = cursor.fetchone()
-    if protocol_id:
-        return protocol_id[0]
-    else:
-        cursor.execute("""
-            INSERT INTO dim_protocol_dm (protocol_name, protocol_segment, chain)
-            VALUES (%s, %s, %s) RETURNING protocol_id;
-        """, (protocol_name, protocol_segment, chain))
-        return cursor.fetchone()[0]
-
-def get_or_create_asset_id(cursor, asset_symbol, asset_name, asset_policy_id=None, asset_fingerprint=None):
-    """Gets or creates an asset_id from dim_asset_dm for a given asset."""
-    cursor.execute("SELECT asset_id FROM dim_asset_dm WHERE asset_symbol = %s", (asset_symbol,))
-    asset_id = cursor.fetchone()
-    if asset_id:
-        return asset_id[0]
-    else:
-        cursor.execute("""
-            INSERT INTO dim_asset_dm (asset_symbol, asset_name, asset_policy_id, asset_fingerprint)
-            VALUES (%s, %s, %s, %s) RETURNING asset_id;
-        """, (asset_symbol, asset_name, asset_policy_id, asset_fingerprint))
-        return cursor.fetchone()[0]
+api = get_blockfrost_api()
+
+# Number of concurrent Blockfrost workers used to fetch CDP UTxOs.
+# Set to 1 to fetch addresses one after another.
+INDIGO_FETCH_WORKERS = int(os.getenv("INDIGO_FETCH_WORKERS", 8))
+# Incremental mode only refetches the UTxOs of CDPs with new transactions since the last run
+# and carries the stored balances of unchanged CDPs forward. Set to 0 to refetch every CDP.
+INDIGO_INCREMENTAL = os.getenv("INDIGO_INCREMENTAL", "1") == "1"
 
 # The asset ID for iUSD (policy_id + asset_name_hex)
 IUSD_ASSET = "f66d78b4a3cb3d37afa0ec36461e51ecbde00f26c8f0a68f94b6988069555344"
 
-def get_indigo_cdp_addresses(asset_id):
-    """Gets all addresses holding a specific Indigo iAsset, which are the CDPs, with pagination."""
-    all_pool_addresses = set()
-    page = 1
-    while True:
-        try:
-            asset_holders = api.asset_addresses(asset=asset_id, count=100, page=page)
-            if not asset_holders:
-                break
-            for holder in asset_holders:
-                all_pool_addresses.add(holder.address)
-            page += 1
-        except ApiError as e:
-            print(f"Error fetching asset holders for {asset_id} (page {page}): {e}")
-            break
-    return list(all_pool_addresses)
+def get_indigo_cdp_addresses(asset_id, workers=INDIGO_FETCH_WORKERS, errors=None):
+    """Yields the addresses holding a specific Indigo iAsset, which are the CDPs.
+
+    Holder pages are fetched concurrently and addresses are streamed as pages arrive.
+    Pages that fail are appended to `errors`, if given.
+    """
+    def fetch_page(page):
+        return cached_blockfrost("blockfrost_asset_addresses", api.asset_addresses, asset=asset_id, count=100, page=page)
+
+    seen = set()
+    for page, asset_holders in iter_pages_concurrently(fetch_page, page_size=100, workers=workers, errors=errors):
+        for holder in asset_holders:
+            if holder.address not in seen:
+                seen.add(holder.address)
+                yield holder.address
+
+def fetch_address_utxos(address, latest_tx_hash=None):
+    """Fetches the UTxOs of an address through the response cache and the shared Blockfrost rate limiter.
+
+    With the hash of the address's newest transaction, the response is cached under it: the
+    UTxOs cannot change without a new transaction, so a cached response is reused for as long
+    as the hash stays the same and is never older than the cursor stored next to it.
+    """
+    return cached_blockfrost("blockfrost_address_utxos", api.address_utxos, address, cache_version=latest_tx_hash)
+
+def fetch_latest_transaction(address):
+    """Returns (tx_hash, block_height) of the newest transaction touching an address, or (None, None).
+
+    The cursor is always fetched live (but still recorded for offline replays), since it
+    decides which UTxO response is current.
+    """
+    txs = cached_blockfrost("blockfrost_address_transactions", api.address_transactions, address, count=1, order='desc', cache_ttl=0)
+    return (txs[0].tx_hash, txs[0].block_height) if txs else (None, None)
+
+def utxo_balances(utxos):
+    """Sums UTxO amounts per unit, leaving out iUSD: we are interested in the collateral, not the iUSD itself."""
+    balances = {}
+    for utxo in utxos:
+        for amount in utxo.amount:
+            if amount.unit != IUSD_ASSET:
+                balances[amount.unit] = balances.get(amount.unit, 0) + int(amount.quantity)
+    return balances
+
+def fetch_address_state(address, known_cursors=None):
+    """Returns (latest_tx, balances) for a CDP address.
+
+    With `known_cursors` (incremental mode), the newest transaction is checked first and
+    balances is None if it matches the stored cursor, so the UTxOs are not fetched at all.
+    The cursor is read before the UTxOs, so a transaction landing in between is picked up
+    on the next run rather than missed.
+    """
+    latest_tx = None
+    if known_cursors is not None:
+        latest_tx = fetch_latest_transaction(address)
+        if address in known_cursors and known_cursors[address][0] == latest_tx[0]:
+            return latest_tx, None
+    return latest_tx, utxo_balances(fetch_address_utxos(address, latest_tx[0] if latest_tx else None))
+
+def fetch_utxos_concurrently(addresses, workers=INDIGO_FETCH_WORKERS, fetch=fetch_address_utxos, errors=None):
+    """Yields (address, fetch(address)) pairs as they complete, fetching with a bounded thread pool.
+
+    Addresses whose fetch fails are logged, skipped and appended to `errors`, if given.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(fetch, address): address for address in addresses}
+        for future in as_completed(futures):
+            address = futures[future]
+            try:
+                yield address, future.result()
+            except (ApiError, CacheMiss) as e:
+                print(f"Error fetching data for address {address}: {e}")
+                if errors is not None:
+                    errors.append((address, e))
 
 def fetch_and_insert_indigo_tvl():
     """Fetches TVL for all Indigo CDPs and inserts it into the dws_tvl_snapshots_dm table.
 
-    This function also applies data retention based on DATA_RETENTION_DAYS.
+    Aged snapshots are rolled up and removed by backend/etl/tiered_retention.py.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cg = CoinGeckoAPI()
-
     current_timestamp = datetime.now(UTC)
-    time_id = get_or_create_time_id(cursor, current_timestamp)
-    protocol_id = get_or_create_protocol_id(cursor, 'Indigo', 'CDP', 'Cardano')
-    iusd_asset_id_dim = get_or_create_asset_id(cursor, 'IUSD', 'Indigo Protocol iUSD', IUSD_ASSET, '')
-
-    try:
-        ada_price_usd = cg.get_price(ids='cardano', vs_currencies='usd')['cardano']['usd']
-    except Exception as e:
-        print(f"Error fetching ADA price from CoinGecko: {e}")
-        ada_price_usd = 0.0 # Fallback to 0 if price cannot be fetched
-
-    cdp_addresses = get_indigo_cdp_addresses(IUSD_ASSET)
-    if not cdp_addresses:
-        print("No CDP addresses found. Exiting.")
-        return
-
-    for address in cdp_addresses:
-        try:
-            utxos = api.address_utxos(address)
-            for utxo in utxos:
-                for amount in utxo.amount:
-                    # We are interested in the collateral (ADA, etc.), not the iUSD itself
-                    if amount.unit == IUSD_ASSET:
-                        continue
-
-                    asset_symbol = amount.unit
-                    tvl = int(amount.quantity)
-                    
-                    # Determine asset_id for the collateral asset
-                    if asset_symbol == 'lovelace':
-                        collateral_asset_id = get_or_create_asset_id(cursor, 'ADA', 'Cardano', 'lovelace', '')
-                        tvl_ada = tvl / 1_000_000  # Convert lovelace to ADA
-                        tvl_usd = tvl_ada * ada_price_usd # Convert ADA to USD
-                    else:
-                        # For other assets, we would need their price in USD. For now, we'll use a dummy value or skip.
-                        # This part needs further development to fetch prices for other assets.
-                        collateral_asset_id = get_or_create_asset_id(cursor, asset_symbol, asset_symbol, asset_symbol, '') # Placeholder
-                        tvl_usd = tvl # Placeholder, assuming 1:1 for non-ADA assets for now
-
-                    cursor.execute("""
-                        INSERT INTO dws_tvl_snapshots_dm (protocol_id, asset_id, time_id, address, tvl_usd, data_source)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (protocol_id, asset_id, time_id, address) DO NOTHING;
-                    """, (
-                        protocol_id,
-                        collateral_asset_id,
-                        time_id,
-                        address,
-                        tvl_usd,
-                        'Blockfrost/CoinGecko'
-                    ))
-        except ApiError as e:
-            print(f"Error fetching data for address {address}: {e}")
-
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-    # Apply data retention after new data is inserted
-    delete_old_data("dws_tvl_snapshots_dm", "Indigo", DATA_RETENTION_DAYS)
+
+    known_cursors = None
+    if INDIGO_INCREMENTAL:
+        with get_connection() as conn, conn.cursor() as cursor:
+            known_cursors = load_address_cursors(cursor, 'Indigo')
+
+    # CDP addresses are streamed from discovery straight into the UTxO workers.
+    # Everything is fetched before a pooled connection is checked out for writing,
+    # so the connection is not held open while waiting on Blockfrost.
+    fetch_errors = []
+    cdp_addresses = get_indigo_cdp_addresses(IUSD_ASSET, errors=fetch_errors)
+    seen_addresses = []
+    changed_balances = {}
+    changed_cursors = {}
+    for address, (latest_tx, balances) in fetch_utxos_concurrently(
+        cdp_addresses, fetch=lambda address: fetch_address_state(address, known_cursors), errors=fetch_errors
+    ):
+        seen_addresses.append(address)
+        if balances is not None:
+            changed_balances[address] = balances
+            changed_cursors[address] = latest_tx
+
+    if not seen_addresses:
+        print("No CDP addresses found.")
+    elif INDIGO_INCREMENTAL:
+        print(f"{len(changed_balances)} of {len(seen_addresses)} CDP addresses changed since the last run.")
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        time_id = get_or_create_time_id(cursor, current_timestamp)
+        protocol_id = get_or_create_protocol_id(cursor, 'Indigo', 'CDP', 'Cardano')
+
+        if INDIGO_INCREMENTAL:
+            # Unchanged CDPs carry their stored balances forward and are revalued below
+            unchanged = [address for address in seen_addresses if address not in changed_balances]
+            address_balances = load_address_balances(cursor, 'Indigo', unchanged) if unchanged else {}
+            save_address_cursors(cursor, 'Indigo', changed_cursors)
+            save_address_balances(cursor, 'Indigo', changed_balances)
+            # After a failed page or address fetch, the seen addresses are incomplete,
+            # so stored state is only forgotten when every fetch succeeded
+            if fetch_errors:
+                print(f"Keeping stored CDP state: {len(fetch_errors)} Blockfrost fetches failed.")
+            else:
+                forget_addresses_except(cursor, 'Indigo', seen_addresses)
+        else:
+            address_balances = {}
+        address_balances.update(changed_balances)
+        holdings = [
+            (address, unit, quantity)
+            for address, units in address_balances.items()
+            for unit, quantity in units.items()
+        ]
+
+        # Collateral is valued by the shared price oracle, which prices every known native unit
+        # from one batched request and falls back to the last stored price when CoinGecko is down.
+        # Create the collateral assets we have not seen before in one batch,
+        # so the lookups below are served from the dimension cache.
+        collateral_tokens = {unit: price_oracle.token_for_unit(unit) for unit in {unit for _, unit, _ in holdings}}
+        dimension_cache.ensure_assets(cursor, [
+            (token.symbol, token.name, token.policy_id, token.asset_name_hex)
+            for token in collateral_tokens.values() if token is not None
+        ])
+
+        unpriced_units = set()
+        with BulkLoader(
+            cursor, "dws_tvl_snapshots_dm",
+            columns=("protocol_id", "asset_id", "time_id", "address", "tvl_usd", "data_source"),
+            conflict_columns=("protocol_id", "asset_id", "time_id", "address"),
+        ) as loader:
+            for address, unit, quantity in holdings:
+                tvl_usd = price_oracle.value_usd(unit, quantity, cursor)
+                if tvl_usd is None:
+                    unpriced_units.add(unit)
+                    continue
+                token = collateral_tokens[unit]
+                collateral_asset_id = get_or_create_asset_id(cursor, token.symbol, token.name, token.policy_id, token.asset_name_hex)
+
+                loader.add((
+                    protocol_id,
+                    collateral_asset_id,
+                    time_id,
+                    address,
+                    tvl_usd,
+                    'Blockfrost/CoinGecko'
+                ))
+        refresh_tvl_rollups(cursor, [protocol_id], [time_id])
+        if unpriced_units:
+            print(f"Skipped collateral in {len(unpriced_units)} units without a price: {', '.join(sorted(unpriced_units))}")
+
+        notify_data_changed(cursor, "dws_tvl_snapshots_dm", "Indigo")
 
 if __name__ == "__main__":
     # For production, schedule this script to run periodically (e.g., hourly, daily)
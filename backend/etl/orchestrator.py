@@ -0,0 +1,101 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.db import DB_POOL_MAX_SIZE, close_pool
+from backend.etl import apy, indigo_blockfrost, liqwid_blockfrost, minswap_blockfrost, risk_metrics, token_prices, top_wallets, tvl
+
+load_dotenv()
+
+# Maximum number of ETL jobs running at the same time
+ETL_MAX_PARALLEL_JOBS = int(os.getenv("ETL_MAX_PARALLEL_JOBS", 4))
+
+# Every ETL job with the jobs it depends on. Jobs run as soon as all of their
+# dependencies have succeeded; a failed job causes its dependents to be skipped.
+# All jobs share one connection pool, one dimension cache and one set of API clients.
+JOBS = {
+    "token_prices": (token_prices.fetch_and_insert_token_prices, []),
+    "tvl": (tvl.fetch_and_insert_all_tvl, []),
+    "indigo": (indigo_blockfrost.fetch_and_insert_indigo_tvl, []),
+    "liqwid": (liqwid_blockfrost.fetch_and_insert_liqwid_tvl, []),
+    "minswap": (minswap_blockfrost.fetch_and_insert_all_pools_tvl, []),
+    "top_wallets": (top_wallets.fetch_and_insert_top_wallets, []),
+    "apy": (apy.fetch_and_insert_liqwid_apy, ["token_prices", "liqwid"]),
+    "risk_metrics": (risk_metrics.fetch_and_insert_risk_metrics, ["tvl", "indigo", "liqwid", "minswap", "top_wallets"]),
+}
+
+def resolve_jobs(selected):
+    """Returns the selected job names plus everything they depend on, transitively."""
+    resolved = set()
+    pending = list(selected)
+    while pending:
+        name = pending.pop()
+        if name not in JOBS:
+            raise ValueError(f"Unknown ETL job: {name}")
+        if name not in resolved:
+            resolved.add(name)
+            pending.extend(JOBS[name][1])
+    return resolved
+
+def run_job(name):
+    func = JOBS[name][0]
+    started = time.monotonic()
+    print(f"▶ Starting {name}")
+    func()
+    print(f"✅ Finished {name} in {time.monotonic() - started:.1f}s")
+
+def run_dag(job_names, max_workers=ETL_MAX_PARALLEL_JOBS):
+    """Runs the given jobs in dependency order, running independent jobs in parallel.
+
+    Returns a dict mapping each job name to 'succeeded', 'failed' or 'skipped'.
+    """
+    status = {}
+    remaining = set(job_names)
+    # Never run more jobs at once than there are pooled connections
+    max_workers = max(1, min(max_workers, DB_POOL_MAX_SIZE))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while remaining or running:
+            for name in sorted(remaining):
+                dependencies = [d for d in JOBS[name][1] if d in job_names]
+                if any(status.get(d) in ("failed", "skipped") for d in dependencies):
+                    print(f"⏭ Skipping {name}: a dependency did not succeed")
+                    status[name] = "skipped"
+                    remaining.discard(name)
+                elif all(status.get(d) == "succeeded" for d in dependencies):
+                    running[executor.submit(run_job, name)] = name
+                    remaining.discard(name)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    status[name] = "succeeded"
+                except Exception as e:
+                    print(f"❌ {name} failed: {e}")
+                    status[name] = "failed"
+    return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the DADA ETL jobs as a dependency DAG in one process.")
+    parser.add_argument("jobs", nargs="*", help=f"Jobs to run (default: all). Dependencies are added automatically. Choices: {', '.join(JOBS)}")
+    parser.add_argument("--workers", type=int, default=ETL_MAX_PARALLEL_JOBS, help="Maximum number of jobs running at the same time.")
+    args = parser.parse_args()
+
+    try:
+        status = run_dag(resolve_jobs(args.jobs or JOBS), max_workers=args.workers)
+    finally:
+        close_pool()
+
+    for name, result in status.items():
+        print(f"{name}: {result}")
+    if any(result != "succeeded" for result in status.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+from dotenv import load_dotenv
+from psycopg2 import errors
+from backend.db import connect
+
+load_dotenv()
+
+# Months of partitions kept ahead of the newest data written, so inserts never miss one
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+# Milliseconds partition creation waits for its lock on a fact table before leaving it to a later write
+PARTITION_LOCK_TIMEOUT_MS = int(os.getenv("PARTITION_LOCK_TIMEOUT_MS", 2000))
+
+# Fact tables range-partitioned by month of time_id (see sql/dws/create_dws_partitions.sql)
+PARTITIONED_TABLES = (
+    "dws_tvl_snapshots_dm",
+    "dws_token_prices_dm",
+    "dws_apy_snapshots_dm",
+    "dws_top_wallets_dm",
+    "dws_risk_metrics_dm",
+)
+
+def ensure_partitions(start, end, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Creates the missing partitions of every fact table from `start` to `months_ahead` months after `end`.
+
+    Creating a partition locks its parent exclusively until commit, which would block every
+    read of the table for the rest of an ETL transaction. So this runs in a short transaction
+    of its own, on a dedicated connection so that jobs holding every pooled connection cannot
+    starve it. If the lock is not granted within PARTITION_LOCK_TIMEOUT_MS, e.g. behind a long
+    write, creation is left to a later write; partitions are kept months ahead for that reason.
+    """
+    conn = connect()
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true);", (f"{PARTITION_LOCK_TIMEOUT_MS}ms",))
+            cursor.execute("""
+                SELECT SUM(create_dws_partitions(parent::regclass, %s, %s + make_interval(months => %s)))
+                FROM unnest(%s::text[]) AS parent;
+            """, (start, end, months_ahead, list(PARTITIONED_TABLES)))
+            created = cursor.fetchone()[0]
+    except errors.LockNotAvailable as e:
+        print(f"Skipped creating fact table partitions, the tables are busy: {e}")
+        return
+    finally:
+        conn.close()
+    if created:
+        print(f"Created {created} fact table partitions.")
+
+def drop_partitions_before(cursor, table_name, cutoff):
+    """Detaches and drops the partitions of `table_name` holding only rows before `cutoff`; returns how many."""
+    cursor.execute("SELECT drop_dws_partitions(%s::regclass, %s);", (table_name, cutoff))
+    return cursor.fetchone()[0]
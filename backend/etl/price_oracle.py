@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from backend.etl.clients import get_coingecko_api
+from backend.etl.http_cache import cached_json
+
+load_dotenv()
+
+# Seconds a batch of prices is reused in memory before CoinGecko is asked again
+PRICE_ORACLE_TTL = float(os.getenv("PRICE_ORACLE_TTL", 60))
+
+class Token:
+    """A priced Cardano token: its CoinGecko ID, native unit (policy_id + asset_name_hex) and decimals."""
+
+    def __init__(self, symbol, name, coingecko_id, policy_id, asset_name_hex, decimals):
+        self.symbol = symbol
+        self.name = name
+        self.coingecko_id = coingecko_id
+        self.policy_id = policy_id
+        self.asset_name_hex = asset_name_hex
+        self.decimals = decimals
+
+    @property
+    def unit(self):
+        return 'lovelace' if self.symbol == 'ADA' else self.policy_id + self.asset_name_hex
+
+# Every token the ETLs price. Adding a token here makes it available to token_prices
+# and to collateral valuation without any extra API calls.
+TOKENS = [
+    Token("ADA", "Cardano", "cardano", None, None, 6),
+    Token("MIN", "Minswap", "minswap", "29d222ce763455e3d7a09a665ce554f00ac89d2e99a1a83d267170c6", "4d494e", 6),
+    Token("INDY", "Indigo DAO Token", "indigo-dao-governance-token", "533bb94a8850ee3ccbe483106489399112b74c905342cb1792a797a0", "494e4459", 6),
+    Token("LQ", "Liqwid Finance", "liqwid-finance", "da8c30857834c6ae7203935b89278c532b3995245295456f993e1d24", "4c51", 6),
+    Token("IUSD", "Indigo Protocol iUSD", "iusd", "f66d78b4a3cb3d37afa0ec36461e51ecbde00f26c8f0a68f94b69880", "69555344", 6),
+]
+
+class PriceOracle:
+    """Shared USD prices for every token in TOKENS.
+
+    All prices are fetched from CoinGecko with one batched request and kept in memory for
+    `ttl` seconds. Tokens CoinGecko cannot price (or every token, when CoinGecko is down)
+    fall back to their latest row in dws_token_prices_dm, if a cursor is given; those are
+    read once per refresh and kept for the same `ttl`.
+    """
+
+    def __init__(self, tokens=TOKENS, ttl=PRICE_ORACLE_TTL):
+        self.tokens = {token.symbol: token for token in tokens}
+        self.by_unit = {token.unit: token for token in tokens}
+        self.ttl = ttl
+        self._quotes = {}
+        self._stored = None  # Fallback prices of this refresh, None until first needed
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def token_for_unit(self, unit):
+        """Returns the Token for a native unit ('lovelace' or policy_id + asset_name_hex), or None."""
+        return self.by_unit.get(unit)
+
+    def quotes(self, cursor=None):
+        """Returns {symbol: (price_usd, data_source)} for every token that could be priced."""
+        with self._lock:
+            if self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl:
+                self._quotes = self._fetch_live()
+                self._stored = None
+                self._fetched_at = time.monotonic()
+            quotes = dict(self._quotes)
+
+            missing = [symbol for symbol in self.tokens if symbol not in quotes]
+            # Without a cursor only live prices are returned, so callers storing them never re-store a fallback
+            if missing and cursor is not None:
+                if self._stored is None:
+                    self._stored = self._fetch_stored(cursor, missing)
+                    for symbol in self._stored:
+                        print(f"Using the last stored price for {symbol}")
+                quotes.update((symbol, (price_usd, 'dws_token_prices_dm')) for symbol, price_usd in self._stored.items())
+        return quotes
+
+    def price_usd(self, symbol, cursor=None):
+        quote = self.quotes(cursor).get(symbol)
+        return quote[0] if quote else None
+
+    def value_usd(self, unit, quantity, cursor=None):
+        """Returns the USD value of `quantity` base units of a native unit, or None if it has no price."""
+        token = self.token_for_unit(unit)
+        if token is None:
+            return None
+        price_usd = self.price_usd(token.symbol, cursor)
+        if price_usd is None:
+            return None
+        return quantity / 10 ** token.decimals * price_usd
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+    def _fetch_live(self):
+        cg = get_coingecko_api()
+        coingecko_ids = sorted(token.coingecko_id for token in self.tokens.values())
+        try:
+            prices = cached_json(
+                "coingecko_price", {"ids": coingecko_ids},
+                lambda: cg.get_price(ids=coingecko_ids, vs_currencies='usd')
+            )
+        except Exception as e:
+            print(f"Error fetching prices from CoinGecko: {e}")
+            return {}
+        return {
+            token.symbol: (float(prices[token.coingecko_id]['usd']), 'CoinGecko')
+            for token in self.tokens.values()
+            if prices.get(token.coingecko_id, {}).get('usd') is not None
+        }
+
+    @staticmethod
+    def _fetch_stored(cursor, symbols):
+        cursor.execute("""
+            SELECT a.asset_symbol, p.price_usd
+            FROM dim_asset_dm a
+            CROSS JOIN LATERAL (
+                -- One index probe per asset instead of reading its whole price history
+                SELECT price_usd FROM dws_token_prices_dm
+                WHERE asset_id = a.asset_id
+                ORDER BY time_id DESC
+                LIMIT 1
+            ) p
+            WHERE a.asset_symbol = ANY(%s);
+        """, (list(symbols),))
+        return {symbol: float(price_usd) for symbol, price_usd in cursor.fetchall()}
+
+price_oracle = PriceOracle()
@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+from blockfrost import ApiError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Blockfrost allows 10 requests/second per IP, with a burst of 500 requests
+# that refills at the same 10 requests/second. Override via environment variables
+# if your plan has different limits.
+BLOCKFROST_RATE_LIMIT = float(os.getenv("BLOCKFROST_RATE_LIMIT", 10))
+BLOCKFROST_BURST = int(os.getenv("BLOCKFROST_BURST", 500))
+# How many times a rate-limited (HTTP 429) request is retried before giving up
+BLOCKFROST_MAX_RETRIES = 3
+
+class TokenBucket:
+    """Thread-safe token bucket refilling at `rate` tokens per second up to `capacity` tokens."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` tokens are available, then consumes them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+# Shared by every Blockfrost caller in the process so concurrent workers
+# stay under the per-project limit together.
+blockfrost_limiter = TokenBucket(BLOCKFROST_RATE_LIMIT, BLOCKFROST_BURST)
+
+def rate_limited_call(func, *args, limiter=blockfrost_limiter, **kwargs):
+    """Calls a Blockfrost API method under the shared limiter, retrying HTTP 429 responses with backoff."""
+    for attempt in range(BLOCKFROST_MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except ApiError as e:
+            if e.status_code != 429 or attempt == BLOCKFROST_MAX_RETRIES:
+                raise
+            time.sleep(2 ** attempt)
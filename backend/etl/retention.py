@@ -0,0 +1,26 @@
+import os
+from datetime import datetime, UTC, timedelta
+from dotenv import load_dotenv
+from backend.etl.partitions import drop_partitions_before
+
+load_dotenv()
+
+# Configure data retention (in days) via environment variable
+# Set to 0 or comment out to disable retention
+DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", 0))
+
+def drop_old_partitions(cursor, table_name, retention_days=DATA_RETENTION_DAYS):
+    """Drops the monthly partitions of a fact table that lie entirely before the retention window.
+
+    Dropping a partition only touches the catalog, so retention costs the same whatever the
+    number of rows, and leaves no dead tuples behind. Rows are kept until their whole month
+    has aged out, i.e. up to one month longer than `retention_days`. Runs on the caller's
+    cursor, so the drop commits together with the ETL's inserts.
+    """
+    if retention_days <= 0:
+        print(f"Data retention is disabled for {table_name}.")
+        return
+
+    cutoff = datetime.now(UTC) - timedelta(days=retention_days)
+    dropped = drop_partitions_before(cursor, table_name, cutoff)
+    print(f"Dropped {dropped} partitions of {table_name} older than {cutoff}.")
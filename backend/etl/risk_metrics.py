@@ -1,6 +1,5 @@
 import os
 import sys
-import psycopg2
 from dotenv import load_dotenv
 from datetime import datetime, UTC, timedelta
 
@@ -9,74 +8,18 @@ load_dotenv()
 # Add the project root to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from backend.db import get_db_connection
-
-# Configure data retention (in days) via environment variable
-# Set to 0 or comment out to disable retention
-DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", 0))
-
-def delete_old_data(table_name, protocol_name, retention_days):
-    """Deletes data older than retention_days for a given protocol from a specified table."""
-    if retention_days <= 0:
-        print(f"Data retention is disabled for {protocol_name} in {table_name}.")
-        return
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cutoff_date = datetime.now(UTC) - timedelta(days=retention_days)
-    print(f"Deleting {protocol_name} data from {table_name} older than {cutoff_date}...")
-    cursor.execute(f"""
-        DELETE FROM {table_name}
-        WHERE protocol_id IN (
-            SELECT protocol_id FROM dim_protocol_dm WHERE protocol_name = %s
-        ) AND time_id IN (
-            SELECT time_id FROM dim_time_dm WHERE date < %s
-        );
-    """, (protocol_name, cutoff_date.date()))
-    deleted_rows = cursor.rowcount
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print(f"Deleted {deleted_rows} old rows for {protocol_name} in {table_name}.")
-
-def get_or_create_time_id(cursor, timestamp):
-    """Gets or creates a time_id from dim_time_dm for a given timestamp."""
-    date_only = timestamp.date()
-    cursor.execute("SELECT time_id FROM dim_time_dm WHERE date = %s", (date_only,))
-    time_id = cursor.fetchone()
-    if time_id:
-        return time_id[0]
-    else:
-        # Populate dim_time_dm for the date if it doesn't exist
-        cursor.execute("SELECT populate_dim_time_dm(%s, %s)", (date_only, date_only))
-        cursor.execute("SELECT time_id FROM dim_time_dm WHERE date = %s", (date_only,))
-        return cursor.fetchone()[0]
-
-def get_or_create_protocol_id(cursor, protocol_name, protocol_segment, chain):
-    """Gets or creates a protocol_id from dim_protocol_dm for a given protocol."""
-    cursor.execute("SELECT protocol_id FROM dim_protocol_dm WHERE protocol_name = %s", (protocol_name,))
-    protocol_id = cursor.fetchone()
-    if protocol_id:
-        return protocol_id[0]
-    else:
-        cursor.execute("""
-            INSERT INTO dim_protocol_dm (protocol_name, protocol_segment, chain)
-            VALUES (%s, %s, %s) RETURNING protocol_id;
-        """, (protocol_name, protocol_segment, chain))
-        return cursor.fetchone()[0]
-
-
-def compute_risk_metrics(protocol_id, protocol_name):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # TVL volatility
+from backend.db import get_connection, notify_data_changed
+from backend.etl.retention import DATA_RETENTION_DAYS, drop_old_partitions
+from backend.etl.bulk_loader import BulkLoader
+from backend.etl.dimensions import get_or_create_time_id, get_or_create_protocol_id
+from backend.timekeys import time_id_for
+
+def compute_risk_metrics(cur, protocol_id, protocol_name):
+    # TVL volatility, over the protocol-level rollup rather than the per-address rows
     cur.execute("""
-        SELECT stddev(tvl_usd) FROM dws_tvl_snapshots_dm
-        WHERE protocol_id = %s AND time_id IN (
-            SELECT time_id FROM dim_time_dm WHERE date > now() - interval '7 days'
-        )
-    """, (protocol_id,))
+        SELECT stddev(tvl_usd) FROM dws_tvl_protocol_dm
+        WHERE protocol_id = %s AND time_id >= %s
+    """, (protocol_id, time_id_for(datetime.now(UTC) - timedelta(days=7))))
     tvl_vol = cur.fetchone()[0] or 0.0
 
     # Whale concentration (based on available dws_top_wallets_dm data)
@@ -107,8 +50,6 @@ def compute_risk_metrics(protocol_id, protocol_name):
 
         whale_pct = (top_balance / total_balance) * 100 if total_balance > 0 else 0
 
-    cur.close()
-    conn.close()
     return tvl_vol, whale_pct
 
 def fetch_and_insert_risk_metrics():
@@ -118,53 +59,41 @@ def fetch_and_insert_risk_metrics():
         "Liqwid": {"segment": "Lending Pool", "chain": "Cardano"}
     }
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    current_timestamp = datetime.now(UTC)
-    time_id = get_or_create_time_id(cur, current_timestamp)
+    with get_connection() as conn, conn.cursor() as cur:
+        current_timestamp = datetime.now(UTC)
+        time_id = get_or_create_time_id(cur, current_timestamp)
 
-    for protocol_name, details in protocols.items():
-        protocol_id = get_or_create_protocol_id(cur, protocol_name, details["segment"], details["chain"])
-        tvl_vol, whale_pct = compute_risk_metrics(protocol_id, protocol_name)
+        loader = BulkLoader(
+            cur, "dws_risk_metrics_dm",
+            columns=("protocol_id", "time_id", "metric_name", "metric_value", "data_source"),
+            conflict_columns=("protocol_id", "time_id", "metric_name"),
+        )
+        for protocol_name, details in protocols.items():
+            protocol_id = get_or_create_protocol_id(cur, protocol_name, details["segment"], details["chain"])
+            tvl_vol, whale_pct = compute_risk_metrics(cur, protocol_id, protocol_name)
 
-        # Insert TVL Volatility
-        cur.execute(
-            """
-            INSERT INTO dws_risk_metrics_dm (protocol_id, time_id, metric_name, metric_value, data_source)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (protocol_id, time_id, metric_name) DO NOTHING;
-            """,
-            (
+            # Insert TVL Volatility
+            loader.add((
                 protocol_id,
                 time_id,
                 "tvl_volatility",
                 tvl_vol,
                 "Internal Calculation"
-            )
-        )
+            ))
 
-        # Insert Whale Concentration
-        cur.execute(
-            """
-            INSERT INTO dws_risk_metrics_dm (protocol_id, time_id, metric_name, metric_value, data_source)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (protocol_id, time_id, metric_name) DO NOTHING;
-            """,
-            (
+            # Insert Whale Concentration
+            loader.add((
                 protocol_id,
                 time_id,
                 "whale_concentration_pct",
                 whale_pct,
                 "Internal Calculation"
-            )
-        )
-    conn.commit()
-    cur.close()
-    conn.close()
+            ))
+        loader.flush()
 
-    # Apply data retention after new data is inserted
-    delete_old_data("dws_risk_metrics_dm", "Risk Metrics", DATA_RETENTION_DAYS)
+        # Apply data retention after new data is inserted
+        drop_old_partitions(cur, "dws_risk_metrics_dm", DATA_RETENTION_DAYS)
+        notify_data_changed(cur, "dws_risk_metrics_dm")
 
 if __name__ == "__main__":
     # For production, schedule this script to run periodically (e.g., hourly, daily)
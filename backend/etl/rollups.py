@@ -0,0 +1,78 @@
+import os
+import sys
+from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.db import get_connection
+
+load_dotenv()
+
+# Rows of dws_tvl_snapshots_dm that carry a protocol-wide TVL instead of one address's holdings
+OVERALL_ADDRESS = 'Overall'
+# data_source of the zero-TVL 'Overall' placeholders older tvl.py runs wrote for protocols
+# without a DefiLlama id; they never count as a reported TVL
+PLACEHOLDER_SOURCE = 'Manual'
+
+def refresh_tvl_rollups(cursor, protocol_ids=None, time_ids=None):
+    """Recomputes dws_tvl_protocol_asset_dm and dws_tvl_protocol_dm for the given keys.
+
+    Only the (protocol_id, time_id) combinations listed are rebuilt from dws_tvl_snapshots_dm,
+    so an ETL refreshing the buckets it just wrote touches a handful of rollup rows.
+    Pass None for either argument to refresh every protocol or every time_id.
+    Runs on the caller's cursor, so the rollups commit together with the facts.
+    """
+    protocol_ids = None if protocol_ids is None else list(protocol_ids)
+    time_ids = None if time_ids is None else list(time_ids)
+    params = {"protocol_ids": protocol_ids, "time_ids": time_ids}
+    scope = """
+        (%(protocol_ids)s::int[] IS NULL OR protocol_id = ANY(%(protocol_ids)s))
+        AND (%(time_ids)s::int[] IS NULL OR time_id = ANY(%(time_ids)s))
+    """
+
+    # Jobs running in parallel may refresh the same buckets (e.g. tvl and indigo both write
+    # Indigo's TVL). Refreshes are serialized until commit, so each one aggregates after the
+    # previous one's facts are visible and none of them is lost.
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('dws_tvl_rollups'));")
+    cursor.execute(f"DELETE FROM dws_tvl_protocol_asset_dm WHERE {scope};", params)
+    cursor.execute(f"""
+        INSERT INTO dws_tvl_protocol_asset_dm (protocol_id, asset_id, time_id, tvl_usd, address_count)
+        SELECT protocol_id, asset_id, time_id, SUM(tvl_usd), COUNT(DISTINCT address)
+        FROM dws_tvl_snapshots_dm
+        WHERE {scope}
+        AND asset_id IS NOT NULL
+        AND address IS DISTINCT FROM '{OVERALL_ADDRESS}'
+        GROUP BY protocol_id, asset_id, time_id;
+    """, params)
+
+    cursor.execute(f"DELETE FROM dws_tvl_protocol_dm WHERE {scope};", params)
+    cursor.execute(f"""
+        INSERT INTO dws_tvl_protocol_dm (protocol_id, time_id, tvl_usd, reported_tvl_usd, address_tvl_usd, address_count)
+        SELECT
+            protocol_id,
+            time_id,
+            COALESCE(reported_tvl_usd, address_tvl_usd),
+            reported_tvl_usd,
+            address_tvl_usd,
+            address_count
+        FROM (
+            SELECT
+                protocol_id,
+                time_id,
+                -- A bucket holds at most one reported value: the newest 'Overall' row
+                (array_agg(tvl_usd ORDER BY tvl_snapshot_id DESC) FILTER (
+                    WHERE address = '{OVERALL_ADDRESS}' AND data_source IS DISTINCT FROM '{PLACEHOLDER_SOURCE}'
+                ))[1] AS reported_tvl_usd,
+                SUM(tvl_usd) FILTER (WHERE address IS DISTINCT FROM '{OVERALL_ADDRESS}') AS address_tvl_usd,
+                COUNT(DISTINCT address) FILTER (WHERE address IS DISTINCT FROM '{OVERALL_ADDRESS}') AS address_count
+            FROM dws_tvl_snapshots_dm
+            WHERE {scope}
+            GROUP BY protocol_id, time_id
+        ) totals;
+    """, params)
+
+if __name__ == "__main__":
+    # Rebuilds the rollups of every time bucket that still has raw facts, e.g. after a backfill.
+    # Buckets whose raw rows were removed by retention keep their rollups.
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT time_id FROM dws_tvl_snapshots_dm;")
+        refresh_tvl_rollups(cursor, time_ids=[time_id for (time_id,) in cursor.fetchall()])
+    print("Successfully rebuilt the TVL rollups.")
@@ -0,0 +1,165 @@
+import os
+import sys
+from datetime import datetime, UTC, timedelta
+from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.db import get_connection, notify_data_changed
+from backend.etl.partitions import drop_partitions_before
+from backend.etl.retention import DATA_RETENTION_DAYS
+from backend.timekeys import time_id_for, time_id_start
+
+load_dotenv()
+
+# Days raw per-address TVL snapshots are kept before they are rolled into the hourly tier
+RAW_RETENTION_DAYS = int(os.getenv("RAW_RETENTION_DAYS", DATA_RETENTION_DAYS))
+# Days the hourly tier is kept before it is rolled into the daily tier; 0 keeps it forever
+HOURLY_RETENTION_DAYS = int(os.getenv("HOURLY_RETENTION_DAYS", 90))
+# Rows removed per DELETE statement, each in its own short transaction
+RETENTION_DELETE_BATCH_SIZE = int(os.getenv("RETENTION_DELETE_BATCH_SIZE", 5000))
+
+# Per tier: its table, the width of its buckets in minutes and the query aggregating the
+# finer data between %(start)s (inclusive, NULL for no bound) and %(cutoff)s into it
+TIERS = {
+    "hourly": {
+        "table": "dws_tvl_snapshots_hourly_dm",
+        "minutes": 60,
+        # Addresses are summed per snapshot first, so the statistics are over class totals
+        "source": """
+            SELECT
+                protocol_id,
+                asset_id,
+                address_class,
+                time_id_of(time_id_start(time_id), 60),
+                AVG(tvl_usd),
+                MIN(tvl_usd),
+                MAX(tvl_usd),
+                (array_agg(tvl_usd ORDER BY time_id DESC))[1],
+                COUNT(*)
+            FROM (
+                SELECT protocol_id, asset_id, tvl_address_class(address) AS address_class, time_id, SUM(tvl_usd) AS tvl_usd
+                FROM dws_tvl_snapshots_dm
+                WHERE (%(start)s::int IS NULL OR time_id >= %(start)s) AND time_id < %(cutoff)s
+                GROUP BY protocol_id, asset_id, tvl_address_class(address), time_id
+            ) totals
+            GROUP BY protocol_id, asset_id, address_class, time_id_of(time_id_start(time_id), 60)
+        """,
+    },
+    "daily": {
+        "table": "dws_tvl_snapshots_daily_dm",
+        "minutes": 1440,
+        "source": """
+            SELECT
+                protocol_id,
+                asset_id,
+                address_class,
+                time_id_of(time_id_start(time_id), 1440),
+                SUM(tvl_avg * sample_count) / SUM(sample_count),
+                MIN(tvl_min),
+                MAX(tvl_max),
+                (array_agg(tvl_last ORDER BY time_id DESC))[1],
+                SUM(sample_count)
+            FROM dws_tvl_snapshots_hourly_dm
+            WHERE (%(start)s::int IS NULL OR time_id >= %(start)s) AND time_id < %(cutoff)s
+            GROUP BY protocol_id, asset_id, address_class, time_id_of(time_id_start(time_id), 1440)
+        """,
+    },
+}
+
+def roll_up(cursor, tier, cutoff):
+    """Aggregates the finer data of every bucket between the tier's watermark and `cutoff` into it.
+
+    Each bucket is aggregated exactly once: the watermark moves to `cutoff` in the same
+    transaction, and later runs start from it. Returns the watermark.
+    """
+    spec = TIERS[tier]
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('dws_tvl_tiers'));")
+    cursor.execute("SELECT rolled_up_to FROM etl_retention_watermarks WHERE tier = %s;", (tier,))
+    row = cursor.fetchone()
+    start = row[0] if row else None
+    if start is not None and start >= cutoff:
+        return start
+
+    cursor.execute(f"""
+        INSERT INTO {spec['table']} (
+            protocol_id, asset_id, address_class, time_id, tvl_avg, tvl_min, tvl_max, tvl_last, sample_count
+        )
+        {spec['source']};
+    """, {"start": start, "cutoff": cutoff})
+    print(f"Rolled {cursor.rowcount} {tier} TVL buckets up to {time_id_start(cutoff)}.")
+    cursor.execute("""
+        INSERT INTO etl_retention_watermarks (tier, rolled_up_to, updated_at)
+        VALUES (%s, %s, now())
+        ON CONFLICT (tier) DO UPDATE SET rolled_up_to = EXCLUDED.rolled_up_to, updated_at = now();
+    """, (tier, cutoff))
+    return cutoff
+
+def delete_in_batches(table_name, id_column, before_time_id, batch_size=RETENTION_DELETE_BATCH_SIZE):
+    """Deletes the rows of `table_name` before `before_time_id`, `batch_size` rows per transaction.
+
+    Every batch commits on its own, so locks are held briefly and vacuum can keep up.
+    Returns the number of rows deleted.
+    """
+    total = 0
+    while True:
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f"""
+                DELETE FROM {table_name}
+                WHERE ({id_column}, time_id) IN (
+                    SELECT {id_column}, time_id FROM {table_name}
+                    WHERE time_id < %s
+                    LIMIT %s
+                );
+            """, (before_time_id, batch_size))
+            deleted = cursor.rowcount
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+def protocols_with_snapshots_before(cursor, before_time_id):
+    """Returns the names of the protocols that have raw TVL snapshots before `before_time_id`."""
+    cursor.execute("""
+        SELECT p.protocol_name FROM dim_protocol_dm p
+        WHERE EXISTS (
+            SELECT 1 FROM dws_tvl_snapshots_dm s
+            WHERE s.protocol_id = p.protocol_id AND s.time_id < %s
+        );
+    """, (before_time_id,))
+    return [row[0] for row in cursor.fetchall()]
+
+def apply_tiered_retention(now=None):
+    """Rolls aged raw TVL snapshots into the hourly tier and aged hourly rows into the daily tier,
+    then deletes what was rolled up."""
+    if RAW_RETENTION_DAYS <= 0:
+        print("Tiered retention is disabled (RAW_RETENTION_DAYS=0).")
+        return
+
+    now = now or datetime.now(UTC)
+    raw_cutoff = time_id_for(now - timedelta(days=RAW_RETENTION_DAYS), TIERS["hourly"]["minutes"])
+    with get_connection() as conn, conn.cursor() as cursor:
+        raw_watermark = roll_up(cursor, "hourly", raw_cutoff)
+        hourly_watermark = None
+        if HOURLY_RETENTION_DAYS > 0:
+            # The daily tier is built from the hourly one, so it never overtakes the raw window
+            hourly_days = max(HOURLY_RETENTION_DAYS, RAW_RETENTION_DAYS)
+            hourly_cutoff = time_id_for(now - timedelta(days=hourly_days), TIERS["daily"]["minutes"])
+            hourly_watermark = roll_up(cursor, "daily", hourly_cutoff)
+
+    # Only now that the rollups have committed can the rows they summarize go
+    with get_connection() as conn, conn.cursor() as cursor:
+        affected_protocols = protocols_with_snapshots_before(cursor, raw_watermark)
+        dropped = drop_partitions_before(cursor, "dws_tvl_snapshots_dm", time_id_start(raw_watermark))
+    deleted = delete_in_batches("dws_tvl_snapshots_dm", "tvl_snapshot_id", raw_watermark)
+    print(f"Dropped {dropped} partitions and deleted {deleted} rows of raw TVL snapshots.")
+    if hourly_watermark is not None:
+        deleted_hourly = delete_in_batches("dws_tvl_snapshots_hourly_dm", "tvl_hourly_id", hourly_watermark)
+        print(f"Deleted {deleted_hourly} hourly TVL rows.")
+
+    # Only the protocols that lost snapshots are invalidated, not every cached response
+    if dropped or deleted:
+        with get_connection() as conn, conn.cursor() as cursor:
+            for protocol_name in affected_protocols:
+                notify_data_changed(cursor, "dws_tvl_snapshots_dm", protocol_name)
+
+if __name__ == "__main__":
+    apply_tiered_retention()
+    print("Successfully applied tiered TVL retention.")
@@ -1,145 +1,125 @@
+import argparse
 import os
-import psycopg2
 from dotenv import load_dotenv
-from datetime import datetime, UTC, timedelta
-from pycoingecko import CoinGeckoAPI
+from datetime import datetime, UTC
+from psycopg2.extras import execute_values
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-from backend.db import get_db_connection
+from backend.db import get_connection, notify_data_changed
+from backend.etl.retention import DATA_RETENTION_DAYS, drop_old_partitions
+from backend.etl.dimensions import dimension_cache
+from backend.etl.price_oracle import TOKENS, price_oracle
+from backend.timekeys import TIME_GRAIN_MINUTES
 
 load_dotenv()
 
-# Configure data retention (in days) via environment variable
-# Set to 0 or comment out to disable retention
-DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", 0))
-
-def delete_old_data(table_name, protocol_name, retention_days):
-    """Deletes data older than retention_days for a given protocol from a specified table."""
-    if retention_days <= 0:
-        print(f"Data retention is disabled for {protocol_name} in {table_name}.")
-        return
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cutoff_date = datetime.now(UTC) - timedelta(days=retention_days)
-    print(f"Deleting {protocol_name} data from {table_name} older than {cutoff_date}...")
-    cursor.execute(f"""
-        DELETE FROM {table_name}
-        WHERE protocol_id IN (
-            SELECT protocol_id FROM dim_protocol_dm WHERE protocol_name = %s
-        ) AND time_id IN (
-            SELECT time_id FROM dim_time_dm WHERE date < %s
-        );
-    """, (protocol_name, cutoff_date.date()))
-    deleted_rows = cursor.rowcount
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print(f"Deleted {deleted_rows} old rows for {protocol_name} in {table_name}.")
-
-def get_or_create_time_id(cursor, timestamp):
-    """Gets or creates a time_id from dim_time_dm for a given timestamp."""
-    date_only = timestamp.date()
-    cursor.execute("SELECT time_id FROM dim_time_dm WHERE date = %s", (date_only,))
-    time_id = cursor.fetchone()
-    if time_id:
-        return time_id[0]
-    else:
-        # Populate dim_time_dm for the date if it doesn't exist
-        cursor.execute("SELECT populate_dim_time_dm(%s, %s)", (date_only, date_only))
-        cursor.execute("SELECT time_id FROM dim_time_dm WHERE date = %s", (date_only,))
-        return cursor.fetchone()[0]
-
-def get_or_create_asset_id(cursor, asset_symbol, asset_name, asset_policy_id=None, asset_fingerprint=None):
-    """Gets or creates an asset_id from dim_asset_dm for a given asset."""
-    cursor.execute("SELECT asset_id FROM dim_asset_dm WHERE asset_symbol = %s", (asset_symbol,))
-    asset_id = cursor.fetchone()
-    if asset_id:
-        return asset_id[0]
-    else:
-        cursor.execute("""
-            INSERT INTO dim_asset_dm (asset_symbol, asset_name, asset_policy_id, asset_fingerprint)
-            VALUES (%s, %s, %s, %s) RETURNING asset_id;
-        """, (asset_symbol, asset_name, asset_policy_id, asset_fingerprint))
-        return cursor.fetchone()[0]
-
-# Define common tokens and their CoinGecko API IDs
-COMMON_TOKENS = {
-    "ADA": "cardano",
-    "MIN": "minswap",
-    "INDY": "indigo-dao-governance-token",
-    "LQ": "liqwid-finance",
-    "IUSD": "iusd",
-}
-
-# Map CoinGecko IDs to their respective policy_id + asset_name_hex for token_address
-# This is a simplified mapping and might need more robust handling for complex cases
-TOKEN_ADDRESS_MAP = {
-    "minswap": {"policy_id": "29d222ce763455e3d7a09a665ce554f00ac89d2e99a1a83d267170c6", "asset_name": "4d494e"},
-    "liqwid-finance": {"policy_id": "da8c30857834c6ae7203935b89278c532b3995245295456f993e1d24", "asset_name": "4c51"},
-    "iusd": {"policy_id": "f66d78b4a3cb3d37afa0ec36461e51ecbde00f26c8f0a68f94b69880", "asset_name": "69555344"},
-}
+# Row of etl_transform_watermarks tracking the ODS ids merged into dws_token_prices_dm
+PRICE_TRANSFORM = "coingecko_prices"
+
+def _lock_ods(cursor):
+    # Landing and merging are serialized until commit, so ODS ids become visible in order
+    # and the watermark never passes an id whose row is still uncommitted
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('ods_coingecko_prices_hm'));")
+
+def land_prices(cursor, quotes, timestamp):
+    """Appends the quotes to ods_coingecko_prices_hm with one INSERT. Returns the number of rows."""
+    rows = [
+        (token.coingecko_id, quotes[token.symbol][0], timestamp)
+        for token in TOKENS
+        if token.symbol in quotes
+    ]
+    _lock_ods(cursor)
+    execute_values(cursor, "INSERT INTO ods_coingecko_prices_hm (coingecko_id, price_usd, timestamp) VALUES %s;", rows)
+    return len(rows)
+
+def transform_prices(cursor, from_id=None):
+    """Merges ODS price rows into dws_token_prices_dm with one set-based statement.
+
+    Without `from_id`, only the rows above the watermark are merged. With it, every row above
+    `from_id` is merged again, so 0 replays the whole ODS history without calling CoinGecko.
+    The newest ODS row of each asset and time bucket wins. Returns the number of rows merged.
+    """
+    _lock_ods(cursor)
+    if from_id is None:
+        cursor.execute("SELECT high_water_id FROM etl_transform_watermarks WHERE transform = %s;", (PRICE_TRANSFORM,))
+        row = cursor.fetchone()
+        from_id = row[0] if row else 0
+
+    cursor.execute("""
+        SELECT MAX(id), MIN(timestamp), MAX(timestamp) FROM ods_coingecko_prices_hm WHERE id > %s;
+    """, (from_id,))
+    to_id, first_timestamp, last_timestamp = cursor.fetchone()
+    if to_id is None:
+        return 0
+
+    # Assets and time buckets must exist before the facts reference them
+    dimension_cache.ensure_assets(cursor, [
+        (token.symbol, token.name, token.policy_id, token.asset_name_hex) for token in TOKENS
+    ])
+    dimension_cache.ensure_days(cursor, first_timestamp.astimezone(UTC).date(), last_timestamp.astimezone(UTC).date())
+    asset_ids = [dimension_cache.asset_id(cursor, token.symbol, token.name) for token in TOKENS]
+
+    cursor.execute("""
+        INSERT INTO dws_token_prices_dm (asset_id, time_id, price_usd, data_source)
+        SELECT DISTINCT ON (m.asset_id, time_id_of(o.timestamp, %(grain)s))
+            m.asset_id, time_id_of(o.timestamp, %(grain)s), o.price_usd, 'CoinGecko'
+        FROM ods_coingecko_prices_hm o
+        JOIN unnest(%(coingecko_ids)s::text[], %(asset_ids)s::int[]) AS m (coingecko_id, asset_id)
+            ON m.coingecko_id = o.coingecko_id
+        WHERE o.id > %(from_id)s AND o.id <= %(to_id)s
+        ORDER BY m.asset_id, time_id_of(o.timestamp, %(grain)s), o.id DESC
+        ON CONFLICT (asset_id, time_id) DO UPDATE
+        SET price_usd = EXCLUDED.price_usd, data_source = EXCLUDED.data_source;
+    """, {
+        "grain": TIME_GRAIN_MINUTES,
+        "coingecko_ids": [token.coingecko_id for token in TOKENS],
+        "asset_ids": asset_ids,
+        "from_id": from_id,
+        "to_id": to_id,
+    })
+    merged = cursor.rowcount
+    print(f"Merged {merged} token prices from ODS ids {from_id + 1} to {to_id}.")
+
+    # A replay never moves the watermark back
+    cursor.execute("""
+        INSERT INTO etl_transform_watermarks (transform, high_water_id, updated_at)
+        VALUES (%s, %s, now())
+        ON CONFLICT (transform) DO UPDATE
+        SET high_water_id = GREATEST(etl_transform_watermarks.high_water_id, EXCLUDED.high_water_id), updated_at = now();
+    """, (PRICE_TRANSFORM, to_id))
+    return merged
+
+def merge_token_prices(cursor, from_id=None):
+    """Runs the ODS-to-DWS transform, then retention and the change notification."""
+    merged = transform_prices(cursor, from_id)
+    drop_old_partitions(cursor, "dws_token_prices_dm", DATA_RETENTION_DAYS)
+    if merged:
+        notify_data_changed(cursor, "dws_token_prices_dm")
+    return merged
 
 def fetch_and_insert_token_prices():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cg = CoinGeckoAPI()
-
-    current_timestamp = datetime.now(UTC)
-    time_id = get_or_create_time_id(cursor, current_timestamp)
-
-    try:
-        coingecko_ids = list(COMMON_TOKENS.values())
-        prices = cg.get_price(ids=coingecko_ids, vs_currencies='usd')
-
-        for token_symbol, coingecko_id in COMMON_TOKENS.items():
-            if coingecko_id in prices:
-                price_usd = prices[coingecko_id]['usd']
-                
-                # Insert into ODS table
-                cursor.execute("""
-                    INSERT INTO ods_coingecko_prices_hm (coingecko_id, price_usd, timestamp)
-                    VALUES (%s, %s, %s);
-                """, (
-                    coingecko_id,
-                    price_usd,
-                    current_timestamp
-                ))
-
-                # Get or create asset_id
-                asset_info = TOKEN_ADDRESS_MAP.get(coingecko_id, {})
-                asset_policy_id = asset_info.get("policy_id")
-                asset_name_hex = asset_info.get("asset_name")
-                asset_id = get_or_create_asset_id(cursor, token_symbol, token_symbol, asset_policy_id, asset_name_hex)
-
-                # Insert into DWS table
-                cursor.execute("""
-                    INSERT INTO dws_token_prices_dm (asset_id, time_id, price_usd, data_source)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (asset_id, time_id) DO UPDATE SET
-                    price_usd = EXCLUDED.price_usd, data_source = EXCLUDED.data_source;
-                """, (
-                    asset_id,
-                    time_id,
-                    price_usd,
-                    'CoinGecko'
-                ))
-            else:
-                print(f"Could not fetch price for {token_symbol} (CoinGecko ID: {coingecko_id})")
-
-    except Exception as e:
-        print(f"Error fetching prices from CoinGecko: {e}")
-
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-    # Apply data retention after new data is inserted
-    # Note: For dim tables, retention is usually not applied or handled differently.
-    # For ods_coingecko_prices_hm, you might want a separate retention policy (e.g., truncate daily/weekly).
-    # For dws_token_prices_dm, we apply retention based on time_id.
-    delete_old_data("dws_token_prices_dm", "Token Prices", DATA_RETENTION_DAYS)
+    # Every token is priced by the shared oracle with one batched CoinGecko request.
+    # No cursor is passed, so only live prices are returned and stored prices are never re-landed.
+    quotes = price_oracle.quotes()
+    for token in TOKENS:
+        if token.symbol not in quotes:
+            print(f"Could not fetch price for {token.symbol} (CoinGecko ID: {token.coingecko_id})")
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        if quotes:
+            land_prices(cursor, quotes, datetime.now(UTC))
+        merge_token_prices(cursor)
 
 if __name__ == "__main__":
-    fetch_and_insert_token_prices()
-    print("Successfully fetched and inserted token prices.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Land CoinGecko prices in the ODS and merge new ODS rows into dws_token_prices_dm.")
+    parser.add_argument("--no-fetch", action="store_true", help="Only merge ODS rows above the watermark, e.g. after loading a backfill into the ODS.")
+    parser.add_argument("--replay-from", type=int, metavar="ODS_ID", help="Merge every ODS row above this id again, without calling CoinGecko (0 replays all).")
+    args = parser.parse_args()
+
+    if args.replay_from is not None or args.no_fetch:
+        with get_connection() as conn, conn.cursor() as cursor:
+            merge_token_prices(cursor, args.replay_from)
+        print("Successfully merged token prices from the ODS.")
+    else:
+        fetch_and_insert_token_prices()
+        print("Successfully fetched and inserted token prices.")
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from backend.timekeys import time_id_range
+
+# Fact tables that can be exported, with the columns of one export row. Every row is joined
+# to dim_time_dm and, where the fact has them, to dim_protocol_dm and dim_asset_dm.
+FACT_EXPORTS = {
+    "tvl_snapshots": {
+        "table": "dws_tvl_snapshots_dm",
+        "id": "tvl_snapshot_id",
+        "columns": ["f.address", "f.tvl_usd", "f.data_source"],
+        "protocol": True,
+        "asset": True,
+    },
+    "token_prices": {
+        "table": "dws_token_prices_dm",
+        "id": "token_price_id",
+        "columns": ["f.price_usd", "f.data_source"],
+        "protocol": False,
+        "asset": True,
+    },
+    "apy_snapshots": {
+        "table": "dws_apy_snapshots_dm",
+        "id": "apy_snapshot_id",
+        "columns": ["f.pool_name", "f.apy_value", "f.data_source"],
+        "protocol": True,
+        "asset": True,
+    },
+    "top_wallets": {
+        "table": "dws_top_wallets_dm",
+        "id": "top_wallet_id",
+        "columns": ["f.wallet_address", "f.balance_usd", "f.data_source"],
+        "protocol": True,
+        "asset": True,
+    },
+    "risk_metrics": {
+        "table": "dws_risk_metrics_dm",
+        "id": "risk_metric_id",
+        "columns": ["f.metric_name", "f.metric_value", "f.data_source"],
+        "protocol": True,
+        "asset": False,
+    },
+}
+
+def build_export_query(dataset, protocol_name=None, asset_symbol=None, from_date=None, to_date=None):
+    """Returns (sql, args, column_names) selecting a dataset's rows with the given filters.
+
+    Raises ValueError for an unknown dataset or a filter the dataset does not have.
+    """
+    spec = FACT_EXPORTS.get(dataset)
+    if spec is None:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    if protocol_name is not None and not spec["protocol"]:
+        raise ValueError(f"{dataset} cannot be filtered by protocol")
+    if asset_symbol is not None and not spec["asset"]:
+        raise ValueError(f"{dataset} cannot be filtered by asset")
+
+    select = ["t.ts"]
+    joins = ["JOIN dim_time_dm t ON f.time_id = t.time_id"]
+    if spec["protocol"]:
+        select.append("p.protocol_name")
+        joins.append("JOIN dim_protocol_dm p ON f.protocol_id = p.protocol_id")
+    if spec["asset"]:
+        select.append("a.asset_symbol")
+        joins.append("LEFT JOIN dim_asset_dm a ON f.asset_id = a.asset_id")
+    select.extend(spec["columns"])
+
+    first, last = time_id_range(from_date, to_date)
+    where, args = [], []
+    for condition, value in (
+        ("p.protocol_name ILIKE ${}", protocol_name),
+        ("a.asset_symbol ILIKE ${}", asset_symbol),
+        ("f.time_id >= ${}", first),
+        ("f.time_id <= ${}", last),
+    ):
+        if value is not None:
+            args.append(value)
+            where.append(condition.format(len(args)))
+
+    sql = f"""
+        SELECT {', '.join(select)}
+        FROM {spec['table']} f
+        {' '.join(joins)}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY f.time_id, f.{spec['id']}
+    """
+    column_names = [column.split(".", 1)[1] for column in select]
+    return sql, args, column_names
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def encode_csv(rows, header=None):
+    """Encodes rows (and an optional header row) as CSV text."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+def encode_ndjson(rows, column_names):
+    """Encodes rows as newline-delimited JSON objects keyed by column name."""
+    return "".join(
+        json.dumps({name: _json_value(value) for name, value in zip(column_names, row)}) + "\n"
+        for row in rows
+    )
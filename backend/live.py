@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import asyncpg
+from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+
+load_dotenv()
+
+# Events buffered per streaming client; a client that falls further behind is told to resync
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", 100))
+# Seconds between keep-alive comments on an idle stream, so proxies do not close it
+LIVE_KEEPALIVE_SECONDS = 15
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+class LiveUpdates:
+    """Fans ETL change notifications out to the clients streaming live TVL points.
+
+    The API's single LISTEN connection calls `data_changed`. For every protocol with
+    subscribers, the newest point is loaded once with `load_point(protocol_name)` and
+    queued for each of them, so the database cost does not grow with the number of clients.
+    """
+
+    def __init__(self, load_point, queue_size=LIVE_QUEUE_SIZE):
+        self.load_point = load_point
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._pending = set()
+        self._tasks = set()
+
+    def subscribe(self, protocol_names):
+        """Returns a queue that receives the formatted events of the given protocols."""
+        queue = asyncio.Queue(self.queue_size)
+        for protocol_name in protocol_names:
+            self._subscribers.setdefault(protocol_name.lower(), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        for protocol_name, queues in list(self._subscribers.items()):
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[protocol_name]
+
+    def data_changed(self, table, protocol_name=None):
+        """Schedules a push of the newest point of each subscribed protocol `table` changed for."""
+        if table != "dws_tvl_snapshots_dm":
+            return
+        protocol_names = [protocol_name.lower()] if protocol_name else list(self._subscribers)
+        for name in protocol_names:
+            # Notifications arriving before the push has started are served by the same query
+            if name in self._subscribers and name not in self._pending:
+                self._pending.add(name)
+                task = asyncio.create_task(self._push(name))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def resync(self):
+        """Tells every client to refetch, as changes may have been missed (e.g. on reconnect)."""
+        for queue in set().union(*self._subscribers.values()):
+            self._send(queue, sse_event("resync", {}))
+
+    async def _push(self, protocol_name):
+        self._pending.discard(protocol_name)
+        try:
+            point = await self.load_point(protocol_name)
+        except (OSError, asyncpg.PostgresError) as e:
+            print(f"Could not load the live TVL point of {protocol_name}: {e}")
+            return
+        if point is None:
+            return
+        event = sse_event("tvl", {"protocol": protocol_name, **point})
+        for queue in list(self._subscribers.get(protocol_name, ())):
+            self._send(queue, event)
+
+    @staticmethod
+    def _send(queue, event):
+        if queue.full():
+            # Too slow to keep up: drop the backlog and let the client refetch instead
+            while not queue.empty():
+                queue.get_nowait()
+            event = sse_event("resync", {})
+        queue.put_nowait(event)
+
+    async def stream(self, protocol_names):
+        """Yields the events of the given protocols, with keep-alive comments while idle."""
+        queue = self.subscribe(protocol_names)
+        try:
+            # Clients reconnect after this many milliseconds if the stream drops
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE_SECONDS)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(queue)
@@ -1,9 +1,44 @@
-from fastapi import FastAPI, HTTPException
-from backend.db import get_db_connection
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import date, datetime, UTC
+from typing import Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from backend.batch import BATCH_METRICS, build_batch_query
+from backend.cache import listen_for_data_changes, result_cache
+from backend.columnar import columnar_response, wants_msgpack
+from backend.conditional import is_not_modified, make_etag, not_modified_response, validator_headers
+from backend.db import close_async_pool, get_async_connection
+from backend.downsample import RESOLUTIONS, bucket_width, lttb
+from backend.export import FACT_EXPORTS, build_export_query, encode_csv, encode_ndjson
+from backend.live import LiveUpdates
+from backend.pagination import decode_cursor, next_cursor
+from backend.timekeys import time_id_range, time_id_start
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
+# Points returned by /tvl when the client does not ask for a number, and the most it may ask for
+TVL_DEFAULT_POINTS = int(os.getenv("TVL_DEFAULT_POINTS", 500))
+TVL_MAX_POINTS = int(os.getenv("TVL_MAX_POINTS", 5000))
+# Buckets aggregated per returned point when LTTB downsampling is requested
+TVL_LTTB_OVERSAMPLING = 4
+# Largest page a client may ask the paginated endpoints for
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 1000))
+# Most protocols one /batch request may ask for
+API_MAX_BATCH_PROTOCOLS = int(os.getenv("API_MAX_BATCH_PROTOCOLS", 20))
+# Rows fetched from the export cursor and sent to the client at a time
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 5000))
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Evicts cached responses and pushes new TVL points to /live/tvl clients as ETLs commit;
+    # the cache stays off while this is not connected
+    listener = asyncio.create_task(listen_for_data_changes(observers=[live_updates]))
+    yield
+    listener.cancel()
+    await close_async_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,56 +66,414 @@ app.add_middleware(
 #        return {"protocol": protocol_name, "tvl": row[0], "timestamp": row[1]}
 #    else:
 #        return {"error": "No TVL data found"}
+async def tvl_version(protocol_name):
+    """Returns (version, last_modified) of a protocol's TVL data.
+
+    Every ETL write refreshes the protocol's rollup rows, so their latest refresh time,
+    count and newest time_id change whenever any TVL response would. The token is cached
+    like the responses, so conditional requests between ETL runs do not query Postgres.
+    """
+    async def load():
+        async with get_async_connection() as conn:
+            row = await conn.fetchrow("""
+                SELECT MAX(r.refreshed_at), COUNT(*), MAX(r.time_id)
+                FROM dws_tvl_protocol_dm r
+                JOIN dim_protocol_dm p ON r.protocol_id = p.protocol_id
+                WHERE p.protocol_name ILIKE $1
+            """, protocol_name)
+        return tuple(row), row[0]
+
+    key = ("tvl_version", protocol_name)
+    return await result_cache.fetch(key, [result_cache.tag("dws_tvl_snapshots_dm", protocol_name)], load)
+
+async def tvl_snapshots_version(protocol_name):
+    """Returns the version of a protocol's raw TVL snapshots.
+
+    Retention deletes aged snapshots without touching the rollups, so the rollup version is
+    extended with the oldest remaining snapshot's time_id, which every such delete moves.
+    """
+    async def load():
+        async with get_async_connection() as conn:
+            oldest = await conn.fetchval("""
+                SELECT MIN((SELECT MIN(s.time_id) FROM dws_tvl_snapshots_dm s WHERE s.protocol_id = p.protocol_id))
+                FROM dim_protocol_dm p
+                WHERE p.protocol_name ILIKE $1
+            """, protocol_name)
+        version, _ = await tvl_version(protocol_name)
+        return version + (oldest,)
+
+    key = ("tvl_snapshots_version", protocol_name)
+    return await result_cache.fetch(key, [result_cache.tag("dws_tvl_snapshots_dm", protocol_name)], load)
+
+async def risk_version(protocol_name):
+    """Returns the version of a protocol's risk metrics: their count, newest id and newest time_id."""
+    async def load():
+        async with get_async_connection() as conn:
+            row = await conn.fetchrow("""
+                SELECT COUNT(*), MAX(r.risk_metric_id), MAX(r.time_id)
+                FROM dws_risk_metrics_dm r
+                JOIN dim_protocol_dm p ON r.protocol_id = p.protocol_id
+                WHERE p.protocol_name ILIKE $1
+            """, protocol_name)
+        return tuple(row)
+
+    key = ("risk_version", protocol_name)
+    return await result_cache.fetch(key, [result_cache.tag("dws_risk_metrics_dm", protocol_name)], load)
+
+def tvl_series_sql(protocol_name, asset_symbol=None):
+    """Returns (sql, args) selecting (snapshot_time, tvl) of a protocol from the TVL rollups.
+
+    Without an asset this is the protocol-level rollup; with one, the protocol/asset rollup.
+    """
+    if asset_symbol is None:
+        return """
+            SELECT time_id_start(r.time_id) AS snapshot_time, r.tvl_usd AS tvl
+            FROM dws_tvl_protocol_dm r
+            JOIN dim_protocol_dm p ON r.protocol_id = p.protocol_id
+            WHERE p.protocol_name ILIKE $1
+        """, [protocol_name]
+    return """
+        SELECT time_id_start(r.time_id) AS snapshot_time, r.tvl_usd AS tvl
+        FROM dws_tvl_protocol_asset_dm r
+        JOIN dim_protocol_dm p ON r.protocol_id = p.protocol_id
+        JOIN dim_asset_dm a ON r.asset_id = a.asset_id
+        WHERE p.protocol_name ILIKE $1 AND a.asset_symbol ILIKE $2
+    """, [protocol_name, asset_symbol]
+
+async def latest_tvl_point(protocol_name):
+    """Returns the newest point of a protocol's TVL series, or None if it has none."""
+    series, args = tvl_series_sql(protocol_name)
+    async with get_async_connection() as conn:
+        row = await conn.fetchrow(f"""
+            WITH series AS ({series})
+            SELECT snapshot_time, tvl FROM series
+            ORDER BY snapshot_time DESC
+            LIMIT 1
+        """, *args)
+    if row is None:
+        return None
+    return {"timestamp": row[0], "tvl": float(row[1])}
+
+live_updates = LiveUpdates(latest_tvl_point)
+
+@app.get("/live/tvl")
+async def stream_tvl_updates(
+    protocol: list[str] = Query(..., min_length=1, description="Protocols to follow; repeat for several."),
+):
+    """Streams the newest TVL point of each protocol as Server-Sent Events whenever an ETL commits one.
+
+    Emits `tvl` events with {protocol, timestamp, tvl}, and `resync` events when the client
+    should refetch the series because updates may have been missed.
+    """
+    return StreamingResponse(live_updates.stream(protocol), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Keeps reverse proxies such as nginx from buffering the stream
+        "X-Accel-Buffering": "no",
+    })
+
 @app.get("/tvl/{protocol_name}")
-def get_tvl_time_series(protocol_name: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT snapshot_time, tvl
-        FROM tvl_snapshots
-        WHERE protocol_name ILIKE %s
-        ORDER BY snapshot_time ASC
-    """, (protocol_name,))
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    if not rows:
-        raise HTTPException(status_code=404, detail="No TVL data found.")
-
-    return [
-        {
-            "timestamp": row[0].isoformat(),
-            "tvl": row[1]
+async def get_tvl_time_series(
+    request: Request,
+    response: Response,
+    protocol_name: str,
+    from_: Optional[datetime] = Query(None, alias="from", description="Start of the time range (inclusive)."),
+    to: Optional[datetime] = Query(None, description="End of the time range (inclusive)."),
+    resolution: str = Query("auto", description=f"Bucket width: auto or one of {', '.join(RESOLUTIONS)}."),
+    max_points: int = Query(TVL_DEFAULT_POINTS, ge=3, le=TVL_MAX_POINTS, description="Upper bound on the number of points returned."),
+    downsample: Literal["none", "lttb"] = Query("none", description="lttb picks max_points shape-preserving points out of finer buckets."),
+    asset: Optional[str] = Query(None, description="Only the TVL held in this asset."),
+):
+    """Returns the TVL series of a protocol aggregated into time buckets.
+
+    The series is read from the TVL rollups, not from the per-address facts. Each point
+    carries the last, min, max and average TVL of its bucket. The bucket width grows with
+    the requested range so a response never has more than `max_points` points.
+    """
+    if resolution != "auto" and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+    if from_ and to and from_ > to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'.")
+
+    version, last_modified = await tvl_version(protocol_name)
+    etag = make_etag(version, request, "msgpack" if wants_msgpack(request) else "json")
+    if is_not_modified(request, etag, last_modified, exists=version[1] > 0):
+        return not_modified_response(etag, last_modified)
+    headers = validator_headers(etag, last_modified)
+
+    async def load():
+        async with get_async_connection() as conn:
+            series, args = tvl_series_sql(protocol_name, asset)
+            first, last = await conn.fetchrow(f"""
+                WITH series AS ({series})
+                SELECT MIN(snapshot_time), MAX(snapshot_time)
+                FROM series
+                WHERE (${len(args) + 1}::timestamptz IS NULL OR snapshot_time >= ${len(args) + 1})
+                AND (${len(args) + 2}::timestamptz IS NULL OR snapshot_time <= ${len(args) + 2})
+            """, *args, as_utc(from_), as_utc(to))
+            if first is None:
+                raise HTTPException(status_code=404, detail="No TVL data found.")
+
+            # LTTB needs finer buckets to choose from than the number of points it keeps
+            bucket_points = max_points * TVL_LTTB_OVERSAMPLING if downsample == "lttb" else max_points
+            width = bucket_width((last - first).total_seconds(), bucket_points, resolution)
+            rows = await conn.fetch(f"""
+                WITH series AS ({series})
+                SELECT
+                    to_timestamp(floor(extract(epoch FROM snapshot_time) / ${len(args) + 1}::float8) * ${len(args) + 1}::float8) AS bucket,
+                    (array_agg(tvl ORDER BY snapshot_time DESC))[1],
+                    MIN(tvl),
+                    MAX(tvl),
+                    AVG(tvl)
+                FROM series
+                WHERE snapshot_time BETWEEN ${len(args) + 2} AND ${len(args) + 3}
+                GROUP BY bucket
+                ORDER BY bucket ASC
+            """, *args, width, first, last)
+
+        if downsample == "lttb":
+            points = lttb([(row[0].timestamp(), float(row[1]), row) for row in rows], max_points)
+            rows = [point[2] for point in points]
+
+        return [
+            {
+                "timestamp": row[0],
+                "tvl": float(row[1]),
+                "tvl_min": float(row[2]),
+                "tvl_max": float(row[3]),
+                "tvl_avg": float(row[4])
+            }
+            for row in rows
+        ]
+
+    key = ("tvl", protocol_name, asset, from_, to, resolution, max_points, downsample)
+    points = await result_cache.fetch(key, [result_cache.tag("dws_tvl_snapshots_dm", protocol_name)], load)
+    if wants_msgpack(request):
+        return columnar_response(points, headers=headers)
+    response.headers.update(headers)
+    return points
+
+async def get_protocol_id(conn, protocol_name):
+    """Returns the protocol_id matching a protocol name case-insensitively, or raises a 404."""
+    protocol_id = await conn.fetchval("""
+        SELECT protocol_id FROM dim_protocol_dm WHERE protocol_name ILIKE $1
+    """, protocol_name)
+    if protocol_id is None:
+        raise HTTPException(status_code=404, detail=f"Unknown protocol: {protocol_name}")
+    return protocol_id
+
+def as_utc(timestamp):
+    """Reads timestamps given without a timezone as UTC."""
+    if timestamp is not None and timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=UTC)
+    return timestamp
+
+def parse_cursor(cursor):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/tvl/{protocol_name}/snapshots")
+async def get_tvl_snapshots(
+    request: Request,
+    response: Response,
+    protocol_name: str,
+    from_: Optional[date] = Query(None, alias="from", description="First day of the range (inclusive)."),
+    to: Optional[date] = Query(None, description="Last day of the range (inclusive)."),
+    limit: int = Query(100, ge=1, le=API_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page."),
+):
+    """Returns the raw per-address TVL snapshots of a protocol, newest first, one page at a time.
+
+    Pages are keyset-paginated on (time_id, tvl_snapshot_id), so every page costs the same
+    however far back the client walks.
+    """
+    after = parse_cursor(cursor)
+    first, last = time_id_range(from_, to)
+    # No Last-Modified: retention removes snapshots without a modification time to compare
+    version = await tvl_snapshots_version(protocol_name)
+    etag = make_etag(version, request, "msgpack" if wants_msgpack(request) else "json")
+    if is_not_modified(request, etag, exists=version[-1] is not None):
+        return not_modified_response(etag)
+    headers = validator_headers(etag)
+
+    async def load():
+        async with get_async_connection() as conn:
+            protocol_id = await get_protocol_id(conn, protocol_name)
+            rows = await conn.fetch("""
+                SELECT s.time_id, s.tvl_snapshot_id, s.address, a.asset_symbol, s.tvl_usd, s.data_source
+                FROM dws_tvl_snapshots_dm s
+                LEFT JOIN dim_asset_dm a ON s.asset_id = a.asset_id
+                WHERE s.protocol_id = $1
+                AND ($2::int IS NULL OR s.time_id >= $2)
+                AND ($3::int IS NULL OR s.time_id <= $3)
+                AND ($4::int IS NULL OR (s.time_id, s.tvl_snapshot_id) < ($4::int, $5::int))
+                ORDER BY s.time_id DESC, s.tvl_snapshot_id DESC
+                LIMIT $6
+            """, protocol_id, first, last, *(after or (None, None)), limit + 1)
+
+        cursor_out = next_cursor(rows, limit)
+        return {
+            "protocol": protocol_name,
+            "snapshots": [
+                {
+                    "timestamp": time_id_start(row[0]),
+                    "address": row[2],
+                    "asset": row[3],
+                    "tvl_usd": float(row[4]),
+                    "data_source": row[5]
+                }
+                for row in rows
+            ],
+            "next_cursor": cursor_out
         }
-        for row in rows
-    ]
+
+    key = ("tvl_snapshots", protocol_name, from_, to, limit, cursor)
+    page = await result_cache.fetch(key, [result_cache.tag("dws_tvl_snapshots_dm", protocol_name)], load)
+    if wants_msgpack(request):
+        return columnar_response(page["snapshots"], headers=headers, protocol=page["protocol"], next_cursor=page["next_cursor"])
+    response.headers.update(headers)
+    return page
 
 @app.get("/risk/{protocol_name}")
-def get_risk_metrics(protocol_name: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT metric_name, metric_value, collected_at
-        FROM risk_metrics
-        WHERE protocol_name = %s
-        ORDER BY collected_at DESC
-        LIMIT 10
-    """, (protocol_name.lower(),))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    if not rows:
-        raise HTTPException(status_code=404, detail="No risk metrics found.")
-    metrics = [
-        {
-            "metric": row[0],
-            "value": float(row[1]),
-            "timestamp": row[2].isoformat()
+async def get_risk_metrics(
+    request: Request,
+    response: Response,
+    protocol_name: str,
+    from_: Optional[date] = Query(None, alias="from", description="First day of the range (inclusive)."),
+    to: Optional[date] = Query(None, description="Last day of the range (inclusive)."),
+    limit: int = Query(10, ge=1, le=API_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page."),
+):
+    """Returns the risk metrics of a protocol, newest first, keyset-paginated on (time_id, risk_metric_id)."""
+    after = parse_cursor(cursor)
+    first, last = time_id_range(from_, to)
+    version = await risk_version(protocol_name)
+    etag = make_etag(version, request, "msgpack" if wants_msgpack(request) else "json")
+    if is_not_modified(request, etag, exists=version[0] > 0):
+        return not_modified_response(etag)
+    headers = validator_headers(etag)
+
+    async def load():
+        async with get_async_connection() as conn:
+            protocol_id = await get_protocol_id(conn, protocol_name)
+            rows = await conn.fetch("""
+                SELECT r.time_id, r.risk_metric_id, r.metric_name, r.metric_value
+                FROM dws_risk_metrics_dm r
+                WHERE r.protocol_id = $1
+                AND ($2::int IS NULL OR r.time_id >= $2)
+                AND ($3::int IS NULL OR r.time_id <= $3)
+                AND ($4::int IS NULL OR (r.time_id, r.risk_metric_id) < ($4::int, $5::int))
+                ORDER BY r.time_id DESC, r.risk_metric_id DESC
+                LIMIT $6
+            """, protocol_id, first, last, *(after or (None, None)), limit + 1)
+        if not rows and after is None:
+            raise HTTPException(status_code=404, detail="No risk metrics found.")
+
+        cursor_out = next_cursor(rows, limit)
+        metrics = [
+            {
+                "metric": row[2],
+                "value": float(row[3]),
+                "timestamp": time_id_start(row[0])
+            }
+            for row in rows
+        ]
+        return {
+            "protocol": protocol_name,
+            "metrics": metrics,
+            "next_cursor": cursor_out
         }
-        for row in rows
-    ]
-    return {
-        "protocol": protocol_name,
-        "metrics": metrics
-    }
+
+    key = ("risk", protocol_name, from_, to, limit, cursor)
+    page = await result_cache.fetch(key, [result_cache.tag("dws_risk_metrics_dm", protocol_name)], load)
+    if wants_msgpack(request):
+        return columnar_response(page["metrics"], headers=headers, protocol=page["protocol"], next_cursor=page["next_cursor"])
+    response.headers.update(headers)
+    return page
+
+@app.get("/batch")
+async def get_batch(
+    protocol: list[str] = Query(..., min_length=1, max_length=API_MAX_BATCH_PROTOCOLS, description="Protocols to return; repeat for several."),
+    metric: list[str] = Query(["tvl"], min_length=1, description=f"Metrics to return, of {', '.join(BATCH_METRICS)}; repeat for several."),
+    from_: Optional[datetime] = Query(None, alias="from", description="Start of the time range (inclusive)."),
+    to: Optional[datetime] = Query(None, description="End of the time range (inclusive)."),
+    resolution: str = Query("auto", description=f"Bucket width: auto or one of {', '.join(RESOLUTIONS)}."),
+    max_points: int = Query(TVL_DEFAULT_POINTS, ge=3, le=TVL_MAX_POINTS, description="Upper bound on the number of points per series."),
+):
+    """Returns several protocols' metric series, bucketed like /tvl, from a single query.
+
+    The response is {"resolution_seconds": ..., "series": {protocol: {metric: [points]}}},
+    keyed by the protocol names as requested. Every series shares the same buckets, and a
+    (protocol, metric) without data in the range gets an empty list.
+    """
+    if resolution != "auto" and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+    if from_ and to and from_ > to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'.")
+    protocol = list({name.lower(): name for name in protocol}.values())
+    metric = list(dict.fromkeys(metric))
+    try:
+        sql, args = build_batch_query(protocol, metric, as_utc(from_), as_utc(to), max_points, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def load():
+        async with get_async_connection() as conn:
+            rows = await conn.fetch(sql, *args)
+
+        requested = {name.lower(): name for name in protocol}
+        series = {name: {name_metric: [] for name_metric in metric} for name in protocol}
+        width = None
+        for protocol_name, metric_name, bucket, last, low, high, avg, width in rows:
+            series[requested[protocol_name.lower()]][metric_name].append({
+                "timestamp": bucket,
+                "value": float(last),
+                "min": float(low),
+                "max": float(high),
+                "avg": float(avg),
+            })
+        return {"resolution_seconds": int(width) if width else None, "series": series}
+
+    key = ("batch", tuple(protocol), tuple(metric), from_, to, resolution, max_points)
+    tags = dict.fromkeys(result_cache.tag(BATCH_METRICS[name], protocol_name) for name in metric for protocol_name in protocol)
+    return await result_cache.fetch(key, tags, load)
+
+@app.get("/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    output_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    protocol: Optional[str] = Query(None, description="Only rows of this protocol."),
+    asset: Optional[str] = Query(None, description="Only rows of this asset symbol."),
+    from_: Optional[date] = Query(None, alias="from", description="First day of the range (inclusive)."),
+    to: Optional[date] = Query(None, description="Last day of the range (inclusive)."),
+):
+    """Streams every row of a fact table, joined to its dimensions, as CSV or NDJSON.
+
+    Rows are read through a server-side cursor and sent in chunks as they arrive, so an
+    export of any size runs in constant memory.
+    """
+    try:
+        sql, args, column_names = build_export_query(dataset, protocol, asset, from_, to)
+    except ValueError as e:
+        raise HTTPException(status_code=400 if dataset in FACT_EXPORTS else 404, detail=str(e))
+
+    async def stream():
+        if output_format == "csv":
+            yield encode_csv([], header=column_names)
+        async with get_async_connection() as conn, conn.transaction():
+            chunk = []
+            async for row in conn.cursor(sql, *args, prefetch=EXPORT_CHUNK_ROWS):
+                chunk.append(row)
+                if len(chunk) >= EXPORT_CHUNK_ROWS:
+                    yield encode_csv(chunk) if output_format == "csv" else encode_ndjson(chunk, column_names)
+                    chunk = []
+            if chunk:
+                yield encode_csv(chunk) if output_format == "csv" else encode_ndjson(chunk, column_names)
+
+    media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{dataset}.{output_format}"'
+    })
@@ -0,0 +1,28 @@
+import base64
+import json
+
+def encode_cursor(time_id, row_id):
+    """Returns an opaque keyset cursor pointing just past the row with this (time_id, id)."""
+    raw = json.dumps([time_id, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Returns the (time_id, id) a cursor points past. Raises ValueError if the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        time_id, row_id = json.loads(raw)
+        return int(time_id), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def next_cursor(rows, limit, time_index=0, id_index=1):
+    """Returns the cursor of the page after `rows`, or None if this was the last page.
+
+    Pages are fetched with LIMIT limit + 1: the extra row only tells whether another page exists
+    and is dropped from `rows` here.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(last[time_index], last[id_index])
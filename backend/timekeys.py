@@ -0,0 +1,47 @@
+import os
+from datetime import date, datetime, time, timedelta, UTC
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Width of a time bucket in minutes. Every fact row of the same bucket shares one time_id,
+# so this is the finest granularity the warehouse keeps (60 = hourly, 1440 = daily).
+TIME_GRAIN_MINUTES = int(os.getenv("TIME_GRAIN_MINUTES", 60))
+if TIME_GRAIN_MINUTES <= 0 or 1440 % TIME_GRAIN_MINUTES:
+    raise ValueError(f"TIME_GRAIN_MINUTES must divide a day evenly, got {TIME_GRAIN_MINUTES}")
+
+def time_id_for(timestamp, grain_minutes=TIME_GRAIN_MINUTES):
+    """Returns the time_id of the bucket containing `timestamp`: its start in minutes since the epoch.
+
+    Naive timestamps are taken as UTC and dates as their midnight. Keys stay in minutes
+    whatever the grain, so buckets of different grains never collide.
+    """
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.combine(timestamp, time.min)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=UTC)
+    minutes = int(timestamp.timestamp() // 60)
+    return minutes - minutes % grain_minutes
+
+def time_id_start(time_id):
+    """Returns the start of the bucket a time_id stands for, as an aware UTC datetime."""
+    return datetime.fromtimestamp(time_id * 60, UTC)
+
+def time_id_range(from_=None, to=None):
+    """Returns (first, last) minute keys covering a range, for `time_id BETWEEN` filters.
+
+    Dates cover their whole day. Either bound may be None.
+    """
+    first = time_id_for(from_, 1) if from_ is not None else None
+    if to is None:
+        last = None
+    elif isinstance(to, datetime):
+        last = time_id_for(to, 1)
+    else:
+        last = time_id_for(to + timedelta(days=1), 1) - 1
+    return first, last
+
+def day_bounds(day: date):
+    """Returns the first and last instant of a UTC day, for populating dim_time_dm."""
+    start = datetime.combine(day, time.min, UTC)
+    return start, start + timedelta(days=1) - timedelta(minutes=1)
@@ -1,13 +1,77 @@
+import { useEffect, useState } from "react";
 import TvlChart from "./components/TvlChart";
 
+const API_URL = "http://localhost:8000";
+const PROTOCOLS = ["Minswap", "Indigo", "Liqwid"];
+const MAX_POINTS = 300;
+
+// Adds a live point to a series bucketed `widthSeconds` wide, like the /batch response.
+// Live points come at the rollup grain, so each one is snapped to its bucket: a point in the
+// last bucket updates it, and only a point past it starts a new bucket. The bucket's average
+// is left as loaded; the next resync recomputes it.
+function mergePoint(data, point, widthSeconds) {
+  const time = Date.parse(point.timestamp);
+  const width = (widthSeconds ?? 0) * 1000;
+  const bucket = width > 0 ? Math.floor(time / width) * width : time;
+  const last = data[data.length - 1];
+  const lastBucket = last ? Date.parse(last.timestamp) : null;
+  if (last && lastBucket === bucket) {
+    return [
+      ...data.slice(0, -1),
+      { ...last, value: point.tvl, min: Math.min(last.min, point.tvl), max: Math.max(last.max, point.tvl) },
+    ];
+  }
+  if (last && lastBucket > bucket) {
+    return data;
+  }
+  const timestamp = new Date(bucket).toISOString();
+  return [...data, { timestamp, value: point.tvl, min: point.tvl, max: point.tvl, avg: point.tvl }];
+}
+
 export default function App() {
+  const [batch, setBatch] = useState({ series: {}, resolution_seconds: null });
+
+  useEffect(() => {
+    const names = PROTOCOLS.map((protocol) => protocol.toLowerCase());
+    const query = names.map((name) => `protocol=${encodeURIComponent(name)}`).join("&");
+
+    const load = () => {
+      // One request and one query for every chart on the page
+      fetch(`${API_URL}/batch?${query}&metric=tvl&max_points=${MAX_POINTS}`)
+        .then((res) => res.json())
+        .then((json) => setBatch(json))
+        .catch((err) => console.error(err));
+    };
+
+    // New points are pushed as ETLs commit them, so the series are only downloaded again on resync
+    const events = new EventSource(`${API_URL}/live/tvl?${query}`);
+    events.addEventListener("tvl", (event) => {
+      const point = JSON.parse(event.data);
+      setBatch((current) => {
+        const protocolSeries = current.series[point.protocol];
+        const tvl = mergePoint(protocolSeries?.tvl ?? [], point, current.resolution_seconds);
+        return { ...current, series: { ...current.series, [point.protocol]: { ...protocolSeries, tvl } } };
+      });
+    });
+    events.addEventListener("resync", load);
+    // Points may have been missed while the stream was down
+    let connected = false;
+    events.onopen = () => {
+      if (connected) load();
+      connected = true;
+    };
+    load();
+
+    return () => events.close();
+  }, []);
+
   return (
     <div className="min-h-screen bg-gray-100 p-6 space-y-6">
       <h1 className="text-3xl font-bold text-center text-blue-600">DADA – Cardano Risk Dashboard</h1>
       <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
-        <TvlChart protocol="Minswap" />
-        <TvlChart protocol="Indigo" />
-        #<TvlChart protocol="Liqwid" />
+        {PROTOCOLS.map((protocol) => (
+          <TvlChart key={protocol} protocol={protocol} data={batch.series[protocol.toLowerCase()]?.tvl ?? []} />
+        ))}
       </div>
     </div>
   );
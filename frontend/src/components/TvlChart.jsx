@@ -1,19 +1,7 @@
-import { useEffect, useState } from "react";
 import { LineChart, Line, CartesianGrid, XAxis, YAxis, Tooltip, Legend, ResponsiveContainer } from "recharts";
 
-export default function TvlChart({ protocol }) {
-  const [data, setData] = useState([]);
-
-  useEffect(() => {
-    fetch(`http://localhost:8000/tvl/${protocol.toLowerCase()}`)
-      .then((res) => res.json())
-      .then((json) => {
-        // Expecting array of { timestamp, tvl }
-        setData(json);
-      })
-      .catch((err) => console.error(err));
-  }, [protocol]);
-
+export default function TvlChart({ protocol, data }) {
+  // Expecting array of { timestamp, value, min, max, avg }, loaded for every chart at once by App
   return (
     <div className="bg-white p-4 rounded shadow">
       <h2 className="text-xl font-semibold mb-2">{protocol} TVL Over Time</h2>
@@ -24,7 +12,7 @@ export default function TvlChart({ protocol }) {
           <YAxis />
           <Tooltip />
           <Legend />
-          <Line type="monotone" dataKey="tvl" stroke="#3b82f6" />
+          <Line type="monotone" dataKey="value" name="tvl" stroke="#3b82f6" />
         </LineChart>
       </ResponsiveContainer>
     </div>
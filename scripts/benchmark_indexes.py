@@ -0,0 +1,404 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.db import connect
+from backend.etl.rollups import OVERALL_ADDRESS, PLACEHOLDER_SOURCE, refresh_tvl_rollups
+from backend.etl.tiered_retention import TIERS
+from backend.timekeys import time_id_for
+
+load_dotenv()
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Scratch schema the synthetic star schema is built in; dropped afterwards unless --keep
+BENCHMARK_SCHEMA = "dada_benchmark"
+INDEX_FILE = "sql/indexes/create_dws_indexes.sql"
+
+# Shape of the synthetic data. The time span is fixed, so larger runs put more addresses,
+# wallets and metrics into every hourly bucket, as a growing protocol would.
+BENCHMARK_PROTOCOLS = 20
+BENCHMARK_HOURS = 90 * 24
+BENCHMARK_MIN_ASSETS = 50
+# Executions after which Postgres may switch a prepared statement to its generic plan
+PLAN_CACHE_RUNS = 6
+
+# Hot queries of the API and the ETLs, copied from where they run (noted on each). Each one
+# must read through one of `indexes` (or their partitions) and never sequentially scan a DWS
+# table; `no_sort` also forbids a Sort node and `index_only` requires an Index Only Scan.
+# The latency bound in milliseconds is `max_ms` plus `per_million_ms` per million TVL rows,
+# for queries whose work grows with the size of a bucket. API queries keep their positional
+# parameters and run as prepared statements, like asyncpg runs them; `args` names the
+# benchmark parameters bound to $1, $2, ...
+HOT_QUERIES = [
+    {
+        "name": "tvl_snapshots_page",  # main.get_tvl_snapshots
+        "sql": """
+            SELECT s.time_id, s.tvl_snapshot_id, s.address, a.asset_symbol, s.tvl_usd, s.data_source
+            FROM dws_tvl_snapshots_dm s
+            LEFT JOIN dim_asset_dm a ON s.asset_id = a.asset_id
+            WHERE s.protocol_id = $1
+            AND ($2::int IS NULL OR s.time_id >= $2)
+            AND ($3::int IS NULL OR s.time_id <= $3)
+            AND ($4::int IS NULL OR (s.time_id, s.tvl_snapshot_id) < ($4::int, $5::int))
+            ORDER BY s.time_id DESC, s.tvl_snapshot_id DESC
+            LIMIT $6
+        """,
+        # The second page of the last week
+        "args": ["protocol_id", "week_ago", "no_bound", "latest", "first_id", "page_size"],
+        "indexes": ["idx_dws_tvl_snapshots_dm_protocol_time"],
+        "no_sort": True,
+        "max_ms": 10,
+    },
+    {
+        "name": "risk_page",  # main.get_risk_metrics
+        "sql": """
+            SELECT r.time_id, r.risk_metric_id, r.metric_name, r.metric_value
+            FROM dws_risk_metrics_dm r
+            WHERE r.protocol_id = $1
+            AND ($2::int IS NULL OR r.time_id >= $2)
+            AND ($3::int IS NULL OR r.time_id <= $3)
+            AND ($4::int IS NULL OR (r.time_id, r.risk_metric_id) < ($4::int, $5::int))
+            ORDER BY r.time_id DESC, r.risk_metric_id DESC
+            LIMIT $6
+        """,
+        # The first page, without a range
+        "args": ["protocol_id", "no_bound", "no_bound", "no_bound", "no_bound", "page_size"],
+        "indexes": ["idx_dws_risk_metrics_dm_protocol_time"],
+        "no_sort": True,
+        "index_only": True,
+        "max_ms": 10,
+    },
+    {
+        "name": "tvl_volatility",  # risk_metrics.compute_risk_metrics
+        "sql": """
+            SELECT stddev(tvl_usd) FROM dws_tvl_protocol_dm
+            WHERE protocol_id = %(protocol_id)s AND time_id >= %(week_ago)s
+        """,
+        "indexes": ["dws_tvl_protocol_dm_pkey"],
+        "max_ms": 10,
+    },
+    {
+        "name": "top_wallets_top10",  # risk_metrics.compute_risk_metrics
+        "sql": """
+            SELECT sum(balance_usd) FROM (
+                SELECT balance_usd FROM dws_top_wallets_dm
+                WHERE protocol_id = %(protocol_id)s
+                ORDER BY balance_usd DESC
+                LIMIT 10
+            ) t
+        """,
+        "indexes": ["idx_dws_top_wallets_dm_protocol_balance"],
+        "no_sort": True,
+        "index_only": True,
+        "max_ms": 10,
+    },
+    {
+        "name": "top_wallets_total",  # risk_metrics.compute_risk_metrics
+        "sql": """
+            SELECT sum(balance_usd) FROM dws_top_wallets_dm
+            WHERE protocol_id = %(protocol_id)s
+        """,
+        "indexes": ["idx_dws_top_wallets_dm_protocol_balance"],
+        "index_only": True,
+        "max_ms": 20,
+        "per_million_ms": 2,
+    },
+    {
+        "name": "stored_price",  # price_oracle.PriceOracle._fetch_stored
+        "sql": """
+            SELECT a.asset_symbol, p.price_usd
+            FROM dim_asset_dm a
+            CROSS JOIN LATERAL (
+                SELECT price_usd FROM dws_token_prices_dm
+                WHERE asset_id = a.asset_id
+                ORDER BY time_id DESC
+                LIMIT 1
+            ) p
+            WHERE a.asset_symbol = ANY(%(symbols)s)
+        """,
+        "indexes": ["dws_token_prices_dm_asset_id_time_id_key"],
+        "no_sort": True,
+        "max_ms": 10,
+    },
+    {
+        "name": "tvl_series",  # main.tvl_series_sql
+        "sql": """
+            SELECT time_id_start(r.time_id) AS snapshot_time, r.tvl_usd AS tvl
+            FROM dws_tvl_protocol_dm r
+            JOIN dim_protocol_dm p ON r.protocol_id = p.protocol_id
+            WHERE p.protocol_name ILIKE %(protocol_name)s AND r.time_id >= %(month_ago)s
+            ORDER BY r.time_id
+        """,
+        "indexes": ["dws_tvl_protocol_dm_pkey"],
+        "no_sort": True,
+        "max_ms": 20,
+    },
+    {
+        "name": "tvl_rollup_refresh",  # rollups.refresh_tvl_rollups
+        "sql": f"""
+            SELECT
+                protocol_id,
+                time_id,
+                (array_agg(tvl_usd ORDER BY tvl_snapshot_id DESC) FILTER (
+                    WHERE address = '{OVERALL_ADDRESS}' AND data_source IS DISTINCT FROM '{PLACEHOLDER_SOURCE}'
+                ))[1],
+                SUM(tvl_usd) FILTER (WHERE address IS DISTINCT FROM '{OVERALL_ADDRESS}'),
+                COUNT(DISTINCT address) FILTER (WHERE address IS DISTINCT FROM '{OVERALL_ADDRESS}')
+            FROM dws_tvl_snapshots_dm
+            WHERE protocol_id = ANY(%(protocol_ids)s) AND time_id = ANY(%(time_ids)s)
+            GROUP BY protocol_id, time_id
+        """,
+        "indexes": ["idx_dws_tvl_snapshots_dm_protocol_time"],
+        "max_ms": 10,
+        "per_million_ms": 1,
+    },
+    {
+        "name": "tvl_hourly_rollup",  # tiered_retention.roll_up
+        "sql": TIERS["hourly"]["source"],
+        "indexes": ["idx_dws_tvl_snapshots_dm_time"],
+        "max_ms": 50,
+        "per_million_ms": 20,
+    },
+]
+
+def ddl_files():
+    """Returns the DDL files scripts/create_tables.sql includes, in order."""
+    with open(os.path.join(ROOT, "scripts", "create_tables.sql")) as f:
+        return re.findall(r"^\\i\s+(\S+)", f.read(), re.MULTILINE)
+
+def run_sql_file(cursor, path):
+    with open(os.path.join(ROOT, path)) as f:
+        cursor.execute(f.read())
+
+def create_schema(cursor):
+    """Creates the star schema in the scratch schema, without the DWS indexes.
+
+    They are created after the load, which is faster than maintaining them row by row.
+    """
+    cursor.execute(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE;")
+    cursor.execute(f"CREATE SCHEMA {BENCHMARK_SCHEMA};")
+    for path in ddl_files():
+        if path != INDEX_FILE:
+            run_sql_file(cursor, path)
+
+def load_data(cursor, rows, start, end):
+    """Fills the scratch schema with `rows` TVL snapshots and the other facts in proportion."""
+    hours = BENCHMARK_HOURS
+    addresses = max(1, rows // (BENCHMARK_PROTOCOLS * hours))
+    assets = max(BENCHMARK_MIN_ASSETS, rows // (100 * hours))
+    wallets = max(1, rows // (10 * BENCHMARK_PROTOCOLS * hours))
+    metrics = max(1, rows // (10 * BENCHMARK_PROTOCOLS * hours))
+
+    cursor.execute("SELECT populate_dim_time_dm(%s, %s, 60);", (start, end))
+    cursor.execute("""
+        SELECT create_dws_partitions(parent::regclass, %s, %s)
+        FROM unnest(ARRAY[
+            'dws_tvl_snapshots_dm', 'dws_token_prices_dm', 'dws_apy_snapshots_dm',
+            'dws_top_wallets_dm', 'dws_risk_metrics_dm'
+        ]) AS parent;
+    """, (start, end))
+    cursor.execute("""
+        INSERT INTO dim_protocol_dm (protocol_name, protocol_segment, chain)
+        SELECT 'Benchmark ' || n, 'DEX', 'Cardano' FROM generate_series(1, %s) n;
+    """, (BENCHMARK_PROTOCOLS,))
+    cursor.execute("""
+        INSERT INTO dim_asset_dm (asset_symbol, asset_name)
+        SELECT 'BENCH' || n, 'Benchmark asset ' || n FROM generate_series(1, %s) n;
+    """, (assets,))
+
+    # One day per statement keeps every statement short, whatever the size of the run
+    day = start
+    while day < end:
+        bounds = {
+            "first": time_id_for(day, 60),
+            "last": time_id_for(min(day + timedelta(days=1), end), 60) - 1,
+            "protocols": BENCHMARK_PROTOCOLS,
+            "addresses": addresses,
+            "assets": assets,
+            "wallets": wallets,
+            "metrics": metrics,
+        }
+        cursor.execute(f"""
+            INSERT INTO dws_tvl_snapshots_dm (protocol_id, asset_id, time_id, address, tvl_usd, data_source)
+            SELECT p, 1 + (p * 7 + a) %% %(assets)s, t, 'addr_bench' || a, random() * 1000000, 'benchmark'
+            FROM generate_series(%(first)s, %(last)s, 60) t,
+                generate_series(1, %(protocols)s) p,
+                generate_series(1, %(addresses)s) a
+            UNION ALL
+            SELECT p, NULL, t, '{OVERALL_ADDRESS}', random() * 100000000, 'benchmark'
+            FROM generate_series(%(first)s, %(last)s, 60) t, generate_series(1, %(protocols)s) p;
+
+            INSERT INTO dws_risk_metrics_dm (protocol_id, time_id, metric_name, metric_value, data_source)
+            SELECT p, t, 'metric_' || m, random() * 100, 'benchmark'
+            FROM generate_series(%(first)s, %(last)s, 60) t,
+                generate_series(1, %(protocols)s) p,
+                generate_series(1, %(metrics)s) m;
+
+            INSERT INTO dws_top_wallets_dm (protocol_id, asset_id, time_id, wallet_address, balance_usd, data_source)
+            SELECT p, 1 + w %% %(assets)s, t, 'addr_whale' || w, random() * 10000000, 'benchmark'
+            FROM generate_series(%(first)s, %(last)s, 60) t,
+                generate_series(1, %(protocols)s) p,
+                generate_series(1, %(wallets)s) w;
+
+            INSERT INTO dws_token_prices_dm (asset_id, time_id, price_usd, data_source)
+            SELECT a, t, random() * 10, 'benchmark'
+            FROM generate_series(%(first)s, %(last)s, 60) t, generate_series(1, %(assets)s) a;
+        """, bounds)
+        day += timedelta(days=1)
+        print(f"Loaded {day.date()}.", end="\r", flush=True)
+    print()
+
+    refresh_tvl_rollups(cursor)
+    return assets
+
+def index_names(cursor, index_name):
+    """Returns an index and the indexes of its partitions, as named in plans."""
+    cursor.execute("""
+        SELECT c.relname FROM pg_partition_tree(%s::regclass) t JOIN pg_class c ON c.oid = t.relid;
+    """, (index_name,))
+    return {name for (name,) in cursor.fetchall()}
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+def prepare_queries(cursor):
+    """Prepares the queries with positional parameters, once per benchmark connection."""
+    for query in HOT_QUERIES:
+        if "args" in query:
+            cursor.execute(f"PREPARE {query['name']} AS {query['sql']}")
+
+def statement(query, params):
+    """Returns the (sql, params) running a query, through its prepared statement if it has one."""
+    if "args" not in query:
+        return query["sql"], params
+    placeholders = ", ".join(["%s"] * len(query["args"]))
+    return f"EXECUTE {query['name']} ({placeholders})", [params[name] for name in query["args"]]
+
+def check_plan(cursor, query, params):
+    """Returns the problems of the query's plan, an empty list if it has the expected shape.
+
+    Prepared queries are run a few times first, so the plan checked is the one Postgres keeps
+    using on a long-lived API connection, whether it settles on a custom or a generic plan.
+    """
+    sql, sql_params = statement(query, params)
+    if "args" in query:
+        for _ in range(PLAN_CACHE_RUNS):
+            cursor.execute(sql, sql_params)
+            cursor.fetchall()
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, sql_params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(plan_nodes(plan[0]["Plan"]))
+
+    expected = set()
+    for index_name in query["indexes"]:
+        expected |= index_names(cursor, index_name)
+
+    problems = []
+    for node in nodes:
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name", "").startswith("dws_"):
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+        if query.get("no_sort") and node["Node Type"] in ("Sort", "Incremental Sort"):
+            problems.append(node["Node Type"])
+    scans = [node for node in nodes if node.get("Index Name") in expected]
+    if not scans:
+        problems.append(f"does not use {', '.join(query['indexes'])}")
+    elif query.get("index_only") and not any(node["Node Type"] == "Index Only Scan" for node in scans):
+        problems.append("no Index Only Scan")
+    return problems
+
+def time_query(cursor, query, params, repeat):
+    """Returns the median latency of the query in milliseconds, after one warm-up run."""
+    sql, sql_params = statement(query, params)
+    cursor.execute(sql, sql_params)
+    cursor.fetchall()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, sql_params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def run_benchmark(rows, repeat=20, latency_scale=1.0, with_indexes=True, keep=False):
+    """Builds the scratch schema with `rows` TVL snapshots and checks every hot query.
+
+    Returns True if every plan has the expected shape and every latency is within its bound.
+    """
+    end = datetime.now(UTC).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=BENCHMARK_HOURS)
+    conn = connect(options=f"-c search_path={BENCHMARK_SCHEMA}")
+    conn.autocommit = True  # VACUUM cannot run in a transaction, and the load commits per day
+    try:
+        with conn.cursor() as cursor:
+            started = time.perf_counter()
+            create_schema(cursor)
+            assets = load_data(cursor, rows, start, end)
+            if with_indexes:
+                run_sql_file(cursor, INDEX_FILE)
+            cursor.execute("VACUUM ANALYZE;")
+            print(f"Built {rows:,} TVL snapshots in {time.perf_counter() - started:.0f}s.")
+
+            latest = time_id_for(end - timedelta(hours=1), 60)
+            params = {
+                "protocol_id": 1,
+                "protocol_name": "Benchmark 1",
+                "protocol_ids": [1],
+                "time_ids": [latest],
+                "latest": latest,
+                "week_ago": time_id_for(end - timedelta(days=7), 60),
+                "month_ago": time_id_for(end - timedelta(days=30), 60),
+                "page_size": 101,
+                "first_id": 0,
+                "no_bound": None,
+                "symbols": [f"BENCH{n}" for n in range(1, min(assets, 10) + 1)],
+                # One hourly run of tiered retention, just behind the raw window
+                "start": time_id_for(start + timedelta(days=1), 60),
+                "cutoff": time_id_for(start + timedelta(days=1, hours=1), 60),
+            }
+
+            prepare_queries(cursor)
+            ok = True
+            print(f"{'query':<22} {'median ms':>10} {'bound ms':>10}  result")
+            for query in HOT_QUERIES:
+                problems = check_plan(cursor, query, params)
+                median_ms = time_query(cursor, query, params, repeat)
+                bound_ms = (query["max_ms"] + query.get("per_million_ms", 0) * rows / 1_000_000) * latency_scale
+                if median_ms > bound_ms:
+                    problems.append("too slow")
+                ok = ok and not problems
+                print(f"{query['name']:<22} {median_ms:>10.2f} {bound_ms:>10.1f}  {'; '.join(problems) or 'ok'}")
+            return ok
+    finally:
+        if not keep:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE;")
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load synthetic data and check the plans and latencies of the hot queries.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="TVL snapshots to load, e.g. 1000000, 10000000 or 100000000.")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs of each query; the median is reported.")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplies every latency bound, for slower machines.")
+    parser.add_argument("--without-indexes", action="store_true", help=f"Skip {INDEX_FILE} to measure the baseline.")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {BENCHMARK_SCHEMA} schema for inspection.")
+    args = parser.parse_args()
+
+    passed = run_benchmark(
+        args.rows,
+        repeat=args.repeat,
+        latency_scale=args.latency_scale,
+        with_indexes=not args.without_indexes,
+        keep=args.keep,
+    )
+    print("All hot queries passed." if passed else "Some hot queries failed.")
+    sys.exit(0 if passed else 1)
@@ -4,11 +4,21 @@
 
 -- Drop existing tables (order matters due to foreign key constraints)
 DROP TABLE IF EXISTS dws_tvl_snapshots_dm CASCADE;
+DROP TABLE IF EXISTS dws_tvl_protocol_asset_dm CASCADE;
+DROP TABLE IF EXISTS dws_tvl_protocol_dm CASCADE;
+DROP TABLE IF EXISTS dws_tvl_snapshots_hourly_dm CASCADE;
+DROP TABLE IF EXISTS dws_tvl_snapshots_daily_dm CASCADE;
 DROP TABLE IF EXISTS dws_token_prices_dm CASCADE;
 DROP TABLE IF EXISTS dws_apy_snapshots_dm CASCADE;
 DROP TABLE IF EXISTS dws_top_wallets_dm CASCADE;
 DROP TABLE IF EXISTS dws_risk_metrics_dm CASCADE;
 DROP TABLE IF EXISTS ods_coingecko_prices_hm CASCADE;
+DROP TABLE IF EXISTS etl_address_cursors CASCADE;
+DROP TABLE IF EXISTS etl_address_balances CASCADE;
+DROP TABLE IF EXISTS etl_chain_checkpoints CASCADE;
+DROP TABLE IF EXISTS etl_chain_balances CASCADE;
+DROP TABLE IF EXISTS etl_retention_watermarks CASCADE;
+DROP TABLE IF EXISTS etl_transform_watermarks CASCADE;
 
 DROP TABLE IF EXISTS apy_snapshots CASCADE;
 DROP TABLE IF EXISTS risk_metrics CASCADE;
@@ -34,3 +44,25 @@ DROP TABLE IF EXISTS dim_time_dm CASCADE;
 \i sql/dws/create_dws_apy_snapshots_dm.sql
 \i sql/dws/create_dws_top_wallets_dm.sql
 \i sql/dws/create_dws_risk_metrics_dm.sql
+
+-- Create DWS Fact Table Partitions
+\i sql/dws/create_dws_partitions.sql
+
+-- Create DWS Rollup Tables
+\i sql/dws/create_dws_tvl_protocol_asset_dm.sql
+\i sql/dws/create_dws_tvl_protocol_dm.sql
+
+-- Create DWS Retention Tier Tables
+\i sql/dws/create_dws_tvl_snapshots_hourly_dm.sql
+\i sql/dws/create_dws_tvl_snapshots_daily_dm.sql
+
+-- Create DWS Indexes
+\i sql/indexes/create_dws_indexes.sql
+
+-- Create ETL State Tables
+\i sql/etl/create_etl_address_cursors.sql
+\i sql/etl/create_etl_address_balances.sql
+\i sql/etl/create_etl_chain_checkpoints.sql
+\i sql/etl/create_etl_chain_balances.sql
+\i sql/etl/create_etl_retention_watermarks.sql
+\i sql/etl/create_etl_transform_watermarks.sql
@@ -1,10 +1,15 @@
 -- sql/dimensions/create_dim_time_dm.sql
 -- Description: Creates the dim_time_dm dimension table.
 -- This table stores time-related attributes for analytical purposes.
+-- time_id is the start of the bucket in minutes since 1970-01-01 00:00 UTC, so ETLs compute
+-- it from a timestamp (see backend/timekeys.py) instead of looking it up.
 
 CREATE TABLE IF NOT EXISTS dim_time_dm (
-    time_id SERIAL PRIMARY KEY,
-    date DATE NOT NULL UNIQUE,
+    time_id INT PRIMARY KEY,
+    ts TIMESTAMPTZ NOT NULL UNIQUE,
+    date DATE NOT NULL,
+    hour SMALLINT NOT NULL,
+    minute SMALLINT NOT NULL,
     year SMALLINT NOT NULL,
     month SMALLINT NOT NULL,
     day SMALLINT NOT NULL,
@@ -15,31 +20,47 @@ CREATE TABLE IF NOT EXISTS dim_time_dm (
     week_of_year SMALLINT NOT NULL
 );
 
--- Optional: Function to populate dim_time_dm for a given date range
--- This function can be called from an ETL to ensure the dimension is up-to-date.
-CREATE OR REPLACE FUNCTION populate_dim_time_dm(start_date DATE, end_date DATE)
+CREATE INDEX IF NOT EXISTS idx_dim_time_dm_date ON dim_time_dm (date);
+
+-- Key of the bucket of grain_minutes containing ts
+CREATE OR REPLACE FUNCTION time_id_of(ts TIMESTAMPTZ, grain_minutes INT DEFAULT 1)
+RETURNS INT AS $$
+    SELECT (floor(extract(epoch FROM ts) / 60 / grain_minutes) * grain_minutes)::int;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Start of the bucket a time_id stands for
+CREATE OR REPLACE FUNCTION time_id_start(time_id INT)
+RETURNS TIMESTAMPTZ AS $$
+    SELECT to_timestamp(time_id::bigint * 60);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Populates dim_time_dm with every bucket of grain_minutes between two timestamps.
+-- Called by the ETLs for each new day they write to; existing buckets are left alone.
+DROP FUNCTION IF EXISTS populate_dim_time_dm(DATE, DATE);
+CREATE OR REPLACE FUNCTION populate_dim_time_dm(start_ts TIMESTAMPTZ, end_ts TIMESTAMPTZ, grain_minutes INT DEFAULT 60)
 RETURNS VOID AS $$
-DECLARE
-    _current_date DATE := start_date;
-BEGIN
-    WHILE _current_date <= end_date LOOP
-        INSERT INTO dim_time_dm (
-            date, year, month, day, day_of_week, day_name, month_name, quarter, week_of_year
-        )
-        VALUES (
-            _current_date,
-            EXTRACT(YEAR FROM _current_date),
-            EXTRACT(MONTH FROM _current_date),
-            EXTRACT(DAY FROM _current_date),
-            EXTRACT(DOW FROM _current_date),
-            TRIM(TO_CHAR(_current_date, 'Day')),
-            TRIM(TO_CHAR(_current_date, 'Month')),
-            EXTRACT(QUARTER FROM _current_date),
-            EXTRACT(WEEK FROM _current_date)
-        )
-        ON CONFLICT (date) DO NOTHING; -- Avoid inserting duplicates
-        
-        _current_date := _current_date + INTERVAL '1 day';
-    END LOOP;
-END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+    INSERT INTO dim_time_dm (
+        time_id, ts, date, hour, minute, year, month, day, day_of_week, day_name, month_name, quarter, week_of_year
+    )
+    SELECT
+        time_id_of(bucket),
+        bucket,
+        utc::date,
+        EXTRACT(HOUR FROM utc),
+        EXTRACT(MINUTE FROM utc),
+        EXTRACT(YEAR FROM utc),
+        EXTRACT(MONTH FROM utc),
+        EXTRACT(DAY FROM utc),
+        EXTRACT(DOW FROM utc),
+        TRIM(TO_CHAR(utc, 'Day')),
+        TRIM(TO_CHAR(utc, 'Month')),
+        EXTRACT(QUARTER FROM utc),
+        EXTRACT(WEEK FROM utc)
+    FROM generate_series(
+        time_id_start(time_id_of(start_ts, grain_minutes)),
+        end_ts,
+        make_interval(mins => grain_minutes)
+    ) AS bucket
+    CROSS JOIN LATERAL (SELECT bucket AT TIME ZONE 'UTC' AS utc) u
+    ON CONFLICT (time_id) DO NOTHING; -- Avoid inserting duplicates
+$$ LANGUAGE sql;
@@ -3,7 +3,7 @@
 -- This table stores detailed APY snapshots.
 
 CREATE TABLE IF NOT EXISTS dws_apy_snapshots_dm (
-    apy_snapshot_id SERIAL PRIMARY KEY,
+    apy_snapshot_id SERIAL,
     protocol_id INT NOT NULL, -- FK to dim_protocol_dm
     asset_id INT, -- FK to dim_asset_dm (if APY is asset-specific)
     time_id INT NOT NULL, -- FK to dim_time_dm
@@ -11,6 +11,7 @@ CREATE TABLE IF NOT EXISTS dws_apy_snapshots_dm (
     apy_value NUMERIC(10, 8) NOT NULL,
     data_source VARCHAR(255),
     
+    PRIMARY KEY (apy_snapshot_id, time_id), -- Partitioned tables need the partition key in every unique key
     CONSTRAINT fk_protocol
         FOREIGN KEY(protocol_id)
         REFERENCES dim_protocol_dm(protocol_id),
@@ -21,4 +22,4 @@ CREATE TABLE IF NOT EXISTS dws_apy_snapshots_dm (
         FOREIGN KEY(time_id)
         REFERENCES dim_time_dm(time_id),
     UNIQUE (protocol_id, asset_id, time_id, pool_name)
-);
+) PARTITION BY RANGE (time_id); -- Monthly partitions, see create_dws_partitions.sql
@@ -0,0 +1,78 @@
+-- sql/dws/create_dws_partitions.sql
+-- Description: Creates the functions managing the monthly partitions of the DWS fact tables.
+-- Fact tables are range-partitioned by time_id; each partition holds one UTC month and is
+-- named <table>_pYYYYMM. Retention drops whole partitions instead of deleting rows.
+
+-- Creates the missing monthly partitions of a fact table from the month of start_ts to the month of end_ts.
+-- Safe to call from parallel jobs: creators are serialized by an advisory lock held until commit.
+-- Returns the number of partitions created.
+CREATE OR REPLACE FUNCTION create_dws_partitions(parent REGCLASS, start_ts TIMESTAMPTZ, end_ts TIMESTAMPTZ)
+RETURNS INT AS $$
+DECLARE
+    -- Months are walked in UTC wall-clock time, so the session time zone does not shift them
+    month_start TIMESTAMP := date_trunc('month', start_ts AT TIME ZONE 'UTC');
+    partition_name TEXT;
+    created INT := 0;
+    locked BOOLEAN := false;
+BEGIN
+    WHILE month_start <= end_ts AT TIME ZONE 'UTC' LOOP
+        partition_name := format('%s_p%s', parent::text, to_char(month_start, 'YYYYMM'));
+        -- Checking first avoids locking the parent when the partition already exists
+        IF to_regclass(partition_name) IS NULL THEN
+            -- Another job may be creating the same partition: wait for it to commit, then check again
+            IF NOT locked THEN
+                PERFORM pg_advisory_xact_lock(hashtext('create_dws_partitions'));
+                locked := true;
+            END IF;
+            IF to_regclass(partition_name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %s FOR VALUES FROM (%s) TO (%s)',
+                    partition_name,
+                    parent,
+                    time_id_of(month_start AT TIME ZONE 'UTC'),
+                    time_id_of((month_start + INTERVAL '1 month') AT TIME ZONE 'UTC')
+                );
+                created := created + 1;
+            END IF;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detaches and drops the partitions of a fact table whose whole month lies before cutoff.
+-- Only catalog entries and files are removed, whatever the number of rows.
+-- Returns the number of partitions dropped.
+CREATE OR REPLACE FUNCTION drop_dws_partitions(parent REGCLASS, cutoff TIMESTAMPTZ)
+RETURNS INT AS $$
+DECLARE
+    partition_name TEXT;
+    dropped INT := 0;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent
+        AND c.relname ~ '_p[0-9]{6}$'
+        AND (to_date(right(c.relname, 6), 'YYYYMM') + INTERVAL '1 month') AT TIME ZONE 'UTC' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %s DETACH PARTITION %I', parent, partition_name);
+        EXECUTE format('DROP TABLE %I', partition_name);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for the current month and the next three; ETLs create later ones as they go
+SELECT create_dws_partitions(parent::regclass, now(), now() + INTERVAL '3 months')
+FROM unnest(ARRAY[
+    'dws_tvl_snapshots_dm',
+    'dws_token_prices_dm',
+    'dws_apy_snapshots_dm',
+    'dws_top_wallets_dm',
+    'dws_risk_metrics_dm'
+]) AS parent;
@@ -3,13 +3,14 @@
 -- This table stores detailed risk metrics snapshots.
 
 CREATE TABLE IF NOT EXISTS dws_risk_metrics_dm (
-    risk_metric_id SERIAL PRIMARY KEY,
+    risk_metric_id SERIAL,
     protocol_id INT NOT NULL, -- FK to dim_protocol_dm
     time_id INT NOT NULL, -- FK to dim_time_dm
     metric_name VARCHAR(255) NOT NULL,
     metric_value NUMERIC(20, 8) NOT NULL,
     data_source VARCHAR(255),
     
+    PRIMARY KEY (risk_metric_id, time_id), -- Partitioned tables need the partition key in every unique key
     CONSTRAINT fk_protocol
         FOREIGN KEY(protocol_id)
         REFERENCES dim_protocol_dm(protocol_id),
@@ -17,4 +18,4 @@ CREATE TABLE IF NOT EXISTS dws_risk_metrics_dm (
         FOREIGN KEY(time_id)
         REFERENCES dim_time_dm(time_id),
     UNIQUE (protocol_id, time_id, metric_name)
-);
+) PARTITION BY RANGE (time_id); -- Monthly partitions, see create_dws_partitions.sql
@@ -3,12 +3,13 @@
 -- This table stores detailed token price snapshots.
 
 CREATE TABLE IF NOT EXISTS dws_token_prices_dm (
-    token_price_id SERIAL PRIMARY KEY,
+    token_price_id SERIAL,
     asset_id INT NOT NULL, -- FK to dim_asset_dm
     time_id INT NOT NULL, -- FK to dim_time_dm
     price_usd NUMERIC(20, 8) NOT NULL,
     data_source VARCHAR(255),
     
+    PRIMARY KEY (token_price_id, time_id), -- Partitioned tables need the partition key in every unique key
     CONSTRAINT fk_asset
         FOREIGN KEY(asset_id)
         REFERENCES dim_asset_dm(asset_id),
@@ -16,4 +17,4 @@ CREATE TABLE IF NOT EXISTS dws_token_prices_dm (
         FOREIGN KEY(time_id)
         REFERENCES dim_time_dm(time_id),
     UNIQUE (asset_id, time_id)
-);
+) PARTITION BY RANGE (time_id); -- Monthly partitions, see create_dws_partitions.sql
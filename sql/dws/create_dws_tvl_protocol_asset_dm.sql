@@ -0,0 +1,24 @@
+-- sql/dws/create_dws_tvl_protocol_asset_dm.sql
+-- Description: Creates the dws_tvl_protocol_asset_dm rollup table.
+-- This table stores TVL per protocol, asset and time bucket, summed over the per-address rows
+-- of dws_tvl_snapshots_dm. It is refreshed incrementally for the time_ids an ETL touched.
+
+CREATE TABLE IF NOT EXISTS dws_tvl_protocol_asset_dm (
+    protocol_id INT NOT NULL, -- FK to dim_protocol_dm
+    asset_id INT NOT NULL, -- FK to dim_asset_dm
+    time_id INT NOT NULL, -- FK to dim_time_dm
+    tvl_usd NUMERIC(38, 8) NOT NULL,
+    address_count INT NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    CONSTRAINT fk_protocol
+        FOREIGN KEY(protocol_id)
+        REFERENCES dim_protocol_dm(protocol_id),
+    CONSTRAINT fk_asset
+        FOREIGN KEY(asset_id)
+        REFERENCES dim_asset_dm(asset_id),
+    CONSTRAINT fk_time
+        FOREIGN KEY(time_id)
+        REFERENCES dim_time_dm(time_id),
+    PRIMARY KEY (protocol_id, asset_id, time_id)
+);
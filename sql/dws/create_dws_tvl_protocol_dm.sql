@@ -0,0 +1,24 @@
+-- sql/dws/create_dws_tvl_protocol_dm.sql
+-- Description: Creates the dws_tvl_protocol_dm rollup table.
+-- This table stores one TVL value per protocol and time bucket. It is refreshed incrementally
+-- for the time_ids an ETL touched.
+-- tvl_usd is the protocol-wide TVL reported by an aggregator (the 'Overall' rows of
+-- dws_tvl_snapshots_dm) when there is one, and the sum of the per-address rows otherwise.
+
+CREATE TABLE IF NOT EXISTS dws_tvl_protocol_dm (
+    protocol_id INT NOT NULL, -- FK to dim_protocol_dm
+    time_id INT NOT NULL, -- FK to dim_time_dm
+    tvl_usd NUMERIC(38, 8) NOT NULL,
+    reported_tvl_usd NUMERIC(38, 8), -- Aggregator-reported TVL, if any
+    address_tvl_usd NUMERIC(38, 8), -- Sum of the per-address rows, if any
+    address_count INT NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    CONSTRAINT fk_protocol
+        FOREIGN KEY(protocol_id)
+        REFERENCES dim_protocol_dm(protocol_id),
+    CONSTRAINT fk_time
+        FOREIGN KEY(time_id)
+        REFERENCES dim_time_dm(time_id),
+    PRIMARY KEY (protocol_id, time_id)
+);
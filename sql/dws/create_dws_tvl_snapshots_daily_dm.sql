@@ -0,0 +1,28 @@
+-- sql/dws/create_dws_tvl_snapshots_daily_dm.sql
+-- Description: Creates the dws_tvl_snapshots_daily_dm tier table.
+-- This table stores the hourly TVL tier once it aged out of its retention window, aggregated
+-- per protocol, asset, address class and day, and kept indefinitely.
+-- Filled by backend/etl/tiered_retention.py.
+
+CREATE TABLE IF NOT EXISTS dws_tvl_snapshots_daily_dm (
+    tvl_daily_id SERIAL PRIMARY KEY,
+    protocol_id INT NOT NULL, -- FK to dim_protocol_dm
+    asset_id INT, -- FK to dim_asset_dm (NULL for protocol-wide TVL)
+    address_class VARCHAR(16) NOT NULL,
+    time_id INT NOT NULL, -- Start of the UTC day in minutes since the epoch, see backend/timekeys.py
+    tvl_avg NUMERIC(38, 8) NOT NULL,
+    tvl_min NUMERIC(38, 8) NOT NULL,
+    tvl_max NUMERIC(38, 8) NOT NULL,
+    tvl_last NUMERIC(38, 8) NOT NULL,
+    sample_count INT NOT NULL, -- Raw snapshots aggregated
+
+    CONSTRAINT fk_protocol
+        FOREIGN KEY(protocol_id)
+        REFERENCES dim_protocol_dm(protocol_id),
+    CONSTRAINT fk_asset
+        FOREIGN KEY(asset_id)
+        REFERENCES dim_asset_dm(asset_id),
+    UNIQUE (protocol_id, asset_id, address_class, time_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_dws_tvl_snapshots_daily_dm_time ON dws_tvl_snapshots_daily_dm (time_id);
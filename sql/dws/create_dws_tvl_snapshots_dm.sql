@@ -3,7 +3,7 @@
 -- This table stores detailed Total Value Locked (TVL) snapshots.
 
 CREATE TABLE IF NOT EXISTS dws_tvl_snapshots_dm (
-    tvl_snapshot_id SERIAL PRIMARY KEY,
+    tvl_snapshot_id SERIAL,
     protocol_id INT NOT NULL, -- FK to dim_protocol_dm
     asset_id INT, -- FK to dim_asset_dm (optional, as some TVL might be overall protocol TVL)
     time_id INT NOT NULL, -- FK to dim_time_dm
@@ -11,6 +11,7 @@ CREATE TABLE IF NOT EXISTS dws_tvl_snapshots_dm (
     tvl_usd NUMERIC(38, 8) NOT NULL,
     data_source VARCHAR(255),
     
+    PRIMARY KEY (tvl_snapshot_id, time_id), -- Partitioned tables need the partition key in every unique key
     CONSTRAINT fk_protocol
         FOREIGN KEY(protocol_id)
         REFERENCES dim_protocol_dm(protocol_id),
@@ -20,5 +21,7 @@ CREATE TABLE IF NOT EXISTS dws_tvl_snapshots_dm (
     CONSTRAINT fk_time
         FOREIGN KEY(time_id)
         REFERENCES dim_time_dm(time_id),
-    UNIQUE (protocol_id, time_id, address)
-);
+    -- One row per address and collateral asset. Protocol-wide rows have no asset, and NULLS NOT
+    -- DISTINCT makes their NULL asset_id conflict, so reruns in a bucket do not add another row.
+    UNIQUE NULLS NOT DISTINCT (protocol_id, asset_id, time_id, address)
+) PARTITION BY RANGE (time_id); -- Monthly partitions, see create_dws_partitions.sql
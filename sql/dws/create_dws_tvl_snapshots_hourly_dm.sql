@@ -0,0 +1,38 @@
+-- sql/dws/create_dws_tvl_snapshots_hourly_dm.sql
+-- Description: Creates the dws_tvl_snapshots_hourly_dm tier table.
+-- This table stores the per-address TVL snapshots that aged out of the raw retention window,
+-- aggregated per protocol, asset, address class and hour. Filled by backend/etl/tiered_retention.py.
+
+-- 'overall' for aggregator-reported rows, 'script' for addresses with a script payment
+-- credential (pools, CDPs, markets) and 'wallet' for every other address
+CREATE OR REPLACE FUNCTION tvl_address_class(address TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN address IS NULL OR address = 'Overall' THEN 'overall'
+        WHEN address ~ '^addr(_test)?1[zrx8w0]' THEN 'script'
+        ELSE 'wallet'
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS dws_tvl_snapshots_hourly_dm (
+    tvl_hourly_id SERIAL PRIMARY KEY,
+    protocol_id INT NOT NULL, -- FK to dim_protocol_dm
+    asset_id INT, -- FK to dim_asset_dm (NULL for protocol-wide TVL)
+    address_class VARCHAR(16) NOT NULL,
+    time_id INT NOT NULL, -- Start of the hour in minutes since the epoch, see backend/timekeys.py
+    tvl_avg NUMERIC(38, 8) NOT NULL,
+    tvl_min NUMERIC(38, 8) NOT NULL,
+    tvl_max NUMERIC(38, 8) NOT NULL,
+    tvl_last NUMERIC(38, 8) NOT NULL,
+    sample_count INT NOT NULL, -- Raw snapshots aggregated, to weight the daily average
+
+    CONSTRAINT fk_protocol
+        FOREIGN KEY(protocol_id)
+        REFERENCES dim_protocol_dm(protocol_id),
+    CONSTRAINT fk_asset
+        FOREIGN KEY(asset_id)
+        REFERENCES dim_asset_dm(asset_id),
+    UNIQUE (protocol_id, asset_id, address_class, time_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_dws_tvl_snapshots_hourly_dm_time ON dws_tvl_snapshots_hourly_dm (time_id);
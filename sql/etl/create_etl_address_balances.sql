@@ -0,0 +1,13 @@
+-- sql/etl/create_etl_address_balances.sql
+-- Description: Creates the etl_address_balances table.
+-- This table stores the last known on-chain balance of every tracked address, per unit,
+-- so snapshots of unchanged addresses can be carried forward and revalued.
+
+CREATE TABLE IF NOT EXISTS etl_address_balances (
+    protocol_name VARCHAR(255) NOT NULL,
+    address VARCHAR(255) NOT NULL,
+    unit VARCHAR(255) NOT NULL, -- 'lovelace' or policy_id + asset_name_hex
+    quantity NUMERIC(38, 0) NOT NULL,
+
+    PRIMARY KEY (protocol_name, address, unit)
+);
@@ -0,0 +1,14 @@
+-- sql/etl/create_etl_address_cursors.sql
+-- Description: Creates the etl_address_cursors table.
+-- This table stores, per tracked address, the latest transaction seen by incremental ETLs,
+-- so unchanged addresses can be detected without refetching their UTxOs.
+
+CREATE TABLE IF NOT EXISTS etl_address_cursors (
+    protocol_name VARCHAR(255) NOT NULL,
+    address VARCHAR(255) NOT NULL,
+    last_tx_hash VARCHAR(64), -- NULL if the address has no transactions yet
+    last_block_height INT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    PRIMARY KEY (protocol_name, address)
+);
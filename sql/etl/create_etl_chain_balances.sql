@@ -0,0 +1,14 @@
+-- sql/etl/create_etl_chain_balances.sql
+-- Description: Creates the etl_chain_balances table.
+-- This table stores each chain follower's per-address balance index as of its checkpoint block.
+-- It is written in the same transaction as etl_chain_checkpoints so the two always agree.
+
+CREATE TABLE IF NOT EXISTS etl_chain_balances (
+    follower_name VARCHAR(255) NOT NULL,
+    address VARCHAR(255) NOT NULL,
+    unit VARCHAR(255) NOT NULL, -- 'lovelace' or policy_id + asset_name_hex
+    protocol_name VARCHAR(255) NOT NULL,
+    quantity NUMERIC(38, 0) NOT NULL,
+
+    PRIMARY KEY (follower_name, address, unit)
+);
@@ -0,0 +1,15 @@
+-- sql/etl/create_etl_chain_checkpoints.sql
+-- Description: Creates the etl_chain_checkpoints table.
+-- This table stores the last block applied by each chain follower, so a restarted
+-- follower resumes from where it stopped instead of rescanning.
+
+CREATE TABLE IF NOT EXISTS etl_chain_checkpoints (
+    follower_name VARCHAR(255) PRIMARY KEY,
+    block_hash VARCHAR(64) NOT NULL,
+    block_height INT NOT NULL,
+    slot BIGINT,
+    -- Bootstrap anchor heights above the block, per address: blocks up to an address's anchor
+    -- are already included in its stored balances and must not be applied again
+    anchors JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,10 @@
+-- sql/etl/create_etl_retention_watermarks.sql
+-- Description: Creates the etl_retention_watermarks table.
+-- This table stores, per retention tier, the time_id up to which the finer data has been
+-- aggregated into it. Finer rows before the watermark are only deleted once it has committed.
+
+CREATE TABLE IF NOT EXISTS etl_retention_watermarks (
+    tier VARCHAR(32) PRIMARY KEY,
+    rolled_up_to INT NOT NULL, -- Exclusive upper bound of the aggregated time_ids
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,10 @@
+-- sql/etl/create_etl_transform_watermarks.sql
+-- Description: Creates the etl_transform_watermarks table.
+-- This table stores, per ODS-to-DWS transform, the highest ODS id merged into the DWS layer.
+-- Each run merges only the ODS rows above it and moves it in the same transaction.
+
+CREATE TABLE IF NOT EXISTS etl_transform_watermarks (
+    transform VARCHAR(64) PRIMARY KEY,
+    high_water_id BIGINT NOT NULL, -- Highest ODS id merged, inclusive
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
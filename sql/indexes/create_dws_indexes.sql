@@ -0,0 +1,33 @@
+-- sql/indexes/create_dws_indexes.sql
+-- Description: Creates the secondary indexes of the DWS tables.
+-- Each index serves one of the hot queries checked by scripts/benchmark_indexes.py; the
+-- query it is for is noted above it. Safe to run again on an existing database:
+--     psql -f sql/indexes/create_dws_indexes.sql
+-- On partitioned tables the index is created on every partition, including future ones.
+
+-- /tvl/{protocol}/snapshots pages newest first on (time_id, tvl_snapshot_id) for one protocol,
+-- and refresh_tvl_rollups aggregates a protocol's rows per time_id.
+CREATE INDEX IF NOT EXISTS idx_dws_tvl_snapshots_dm_protocol_time
+    ON dws_tvl_snapshots_dm (protocol_id, time_id, tvl_snapshot_id);
+
+-- /risk/{protocol} pages newest first on (time_id, risk_metric_id); covering, so a page is
+-- read from the index alone.
+CREATE INDEX IF NOT EXISTS idx_dws_risk_metrics_dm_protocol_time
+    ON dws_risk_metrics_dm (protocol_id, time_id, risk_metric_id)
+    INCLUDE (metric_name, metric_value);
+
+-- risk_metrics.compute_risk_metrics reads the ten largest balances of a protocol and the
+-- sum of all of them; both are index-only scans of this index.
+CREATE INDEX IF NOT EXISTS idx_dws_top_wallets_dm_protocol_balance
+    ON dws_top_wallets_dm (protocol_id, balance_usd DESC);
+
+-- tiered_retention.py rolls up the raw rows between its watermark and a cutoff, then deletes
+-- the rows before it; without this index every run reads the whole partition of the cutoff.
+CREATE INDEX IF NOT EXISTS idx_dws_tvl_snapshots_dm_time
+    ON dws_tvl_snapshots_dm (time_id);
+
+-- The TVL series of /tvl, /batch and compute_risk_metrics (protocol_id = ? AND time_id >= ?)
+-- are served by the primary key (protocol_id, time_id) of dws_tvl_protocol_dm, and /tvl with
+-- an asset by the primary key (protocol_id, asset_id, time_id) of dws_tvl_protocol_asset_dm.
+-- PriceOracle's newest stored price of an asset is served by UNIQUE (asset_id, time_id) of
+-- dws_token_prices_dm.
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+from blockfrost import ApiError
+from backend.etl.blockfrost_pages import find_last_page, iter_pages_concurrently
+
+def listing(total_items, page_size=10, failing=()):
+    """Returns fetch_page for a listing of `total_items`, recording the pages requested."""
+    requested = []
+    def fetch_page(page):
+        requested.append(page)
+        if page in failing:
+            raise ApiError(SimpleNamespace(status_code=500, json=lambda: {}))
+        start = (page - 1) * page_size
+        return list(range(start, min(start + page_size, total_items)))
+    return fetch_page, requested
+
+def test_find_last_page_probes_then_bisects():
+    fetch_page, requested = listing(95)
+    assert find_last_page(fetch_page, 10) == 10
+    # 1, 2, 4, 8 are full, 16 is empty, then bisection between 8 and 16
+    assert requested[:5] == [1, 2, 4, 8, 16]
+    assert len(requested) <= 8
+
+def test_find_last_page_edge_cases():
+    assert find_last_page(listing(0)[0], 10) == 0
+    assert find_last_page(listing(7)[0], 10) == 1
+    # A full last page is only known once the page after it is empty
+    assert find_last_page(listing(80)[0], 10) == 8
+
+def test_iter_pages_yields_every_page_once_without_refetching_probes():
+    fetch_page, requested = listing(95)
+    pages = dict(iter_pages_concurrently(fetch_page, page_size=10, workers=4))
+    assert sorted(pages) == list(range(1, 11))
+    assert sorted(item for items in pages.values() for item in items) == list(range(95))
+    assert len(requested) == len(set(requested))
+
+def test_iter_pages_reports_failed_pages():
+    fetch_page, _ = listing(95, failing={3})
+    errors = []
+    pages = dict(iter_pages_concurrently(fetch_page, page_size=10, workers=4, errors=errors))
+    assert 3 not in pages
+    assert [page for page, _ in errors] == [3]
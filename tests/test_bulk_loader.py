@@ -0,0 +1,74 @@
+import csv
+import io
+from backend.etl.bulk_loader import BulkLoader
+
+class RecordingCursor:
+    """Records the statements and COPY payloads a loader sends."""
+
+    def __init__(self):
+        self.statements = []
+        self.copies = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self.statements.append(" ".join(query.split()))
+
+    def copy_expert(self, query, data):
+        rows = list(csv.reader(io.StringIO(data.read())))
+        self.copies.append((" ".join(query.split()), rows))
+        self.rowcount = len(rows)
+
+def make_loader(cursor, **kwargs):
+    return BulkLoader(
+        cursor, "dws_tvl_snapshots_dm",
+        columns=("protocol_id", "asset_id", "time_id", "address", "tvl_usd"),
+        conflict_columns=("protocol_id", "asset_id", "time_id", "address"),
+        flush_interval=3600, **kwargs
+    )
+
+def test_flush_stages_with_copy_and_skips_conflicts():
+    cursor = RecordingCursor()
+    with make_loader(cursor) as loader:
+        loader.add((1, 2, 100, "addr1", 10.5))
+        loader.add((1, None, 100, "Overall", 99.0))
+
+    create, insert = cursor.statements
+    assert create.startswith("CREATE TEMP TABLE IF NOT EXISTS stage_dws_tvl_snapshots_dm ON COMMIT DROP AS")
+    assert "TRUNCATE stage_dws_tvl_snapshots_dm;" in create
+    copy, rows = cursor.copies[0]
+    assert copy == "COPY stage_dws_tvl_snapshots_dm (protocol_id, asset_id, time_id, address, tvl_usd) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    assert rows == [["1", "2", "100", "addr1", "10.5"], ["1", "\\N", "100", "Overall", "99.0"]]
+    assert insert == (
+        "INSERT INTO dws_tvl_snapshots_dm (protocol_id, asset_id, time_id, address, tvl_usd) "
+        "SELECT protocol_id, asset_id, time_id, address, tvl_usd FROM stage_dws_tvl_snapshots_dm "
+        "ON CONFLICT (protocol_id, asset_id, time_id, address) DO NOTHING;"
+    )
+
+def test_first_row_wins_when_skipping_and_last_when_updating():
+    cursor = RecordingCursor()
+    with make_loader(cursor) as loader:
+        loader.add((1, 2, 100, "addr1", 1.0))
+        loader.add((1, 2, 100, "addr1", 2.0))
+    assert cursor.copies[0][1] == [["1", "2", "100", "addr1", "1.0"]]
+
+    cursor = RecordingCursor()
+    with make_loader(cursor, update_columns=("tvl_usd",)) as loader:
+        loader.add((1, 2, 100, "addr1", 1.0))
+        loader.add((1, 2, 100, "addr1", 2.0))
+    assert cursor.copies[0][1] == [["1", "2", "100", "addr1", "2.0"]]
+    assert cursor.statements[-1].endswith("DO UPDATE SET tvl_usd = EXCLUDED.tvl_usd;")
+
+def test_flushes_every_full_batch_and_nothing_after_an_error():
+    cursor = RecordingCursor()
+    loader = make_loader(cursor, batch_size=2)
+    for address in ("a", "b", "c"):
+        loader.add((1, 2, 100, address, 1.0))
+    assert [len(rows) for _, rows in cursor.copies] == [2]
+    assert loader.rows_written == 2
+
+    try:
+        with loader:
+            raise RuntimeError("fetch failed")
+    except RuntimeError:
+        pass
+    assert len(cursor.copies) == 1
@@ -0,0 +1,68 @@
+import asyncio
+from backend.cache import ResultCache
+
+def make_cache(max_entries=10):
+    cache = ResultCache(max_entries)
+    cache.enabled = True
+    return cache
+
+def tvl(protocol_name):
+    return [ResultCache.tag("dws_tvl_snapshots_dm", protocol_name)]
+
+def test_evicts_only_the_changed_protocol():
+    cache = make_cache()
+    cache.put("indigo", 1, tvl("Indigo"), cache._version(tvl("Indigo")))
+    cache.put("minswap", 2, tvl("minswap"), cache._version(tvl("minswap")))
+    cache.put("all", 3, tvl(None), cache._version(tvl(None)))
+
+    cache.evict("dws_tvl_snapshots_dm", "INDIGO")
+    assert cache.get("indigo") is None
+    assert cache.get("minswap") == 2
+    # Computed from every protocol, so any protocol's change evicts it
+    assert cache.get("all") is None
+
+def test_table_wide_eviction_drops_every_protocol():
+    cache = make_cache()
+    cache.put("indigo", 1, tvl("indigo"), cache._version(tvl("indigo")))
+    risk = [ResultCache.tag("dws_risk_metrics_dm", "indigo")]
+    cache.put("risk", 2, risk, cache._version(risk))
+    cache.evict("dws_tvl_snapshots_dm")
+    assert cache.get("indigo") is None
+    assert cache.get("risk") == 2
+
+def test_result_computed_across_an_eviction_is_not_stored():
+    cache = make_cache()
+
+    async def compute():
+        cache.evict("dws_tvl_snapshots_dm", "indigo")
+        return "stale"
+
+    assert asyncio.run(cache.fetch("indigo", tvl("indigo"), compute)) == "stale"
+    assert cache.get("indigo") is None
+
+    async def fresh():
+        return "fresh"
+
+    asyncio.run(cache.fetch("indigo", tvl("indigo"), fresh))
+    assert cache.get("indigo") == "fresh"
+
+def test_clear_invalidates_results_in_flight():
+    cache = make_cache()
+    version = cache._version(tvl("indigo"))
+    cache.clear()
+    cache.put("indigo", 1, tvl("indigo"), version)
+    assert cache.get("indigo") is None
+
+def test_disabled_cache_serves_and_stores_nothing():
+    cache = ResultCache()
+    cache.put("indigo", 1, tvl("indigo"), cache._version(tvl("indigo")))
+    assert cache.get("indigo") is None
+
+def test_least_recently_used_entry_goes_first():
+    cache = make_cache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, key, tvl("indigo"), cache._version(tvl("indigo")))
+    cache.get("a")
+    cache.put("c", "c", tvl("indigo"), cache._version(tvl("indigo")))
+    assert cache.get("b") is None
+    assert cache.get("a") == "a" and cache.get("c") == "c"
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import os
+from backend.etl.chain_follower import ChainFollower, FixtureBlockSource, load_checkpoint, save_checkpoint, utxo_changes
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "chain_follower_rollback.json")
+A = "addr1_indigo_cdp_a"
+B = "addr1_minswap_pool_b"
+
+class CheckpointCursor:
+    """Stands in for a cursor on etl_chain_checkpoints and etl_chain_balances."""
+
+    def __init__(self):
+        self.checkpoint = None
+        self.balances = {}
+        self.rowcount = 0
+        self._result = None
+
+    def execute(self, query, params=None):
+        if "INSERT INTO etl_chain_checkpoints" in query:
+            name, block_hash, height, slot, anchors = params
+            self.checkpoint = (block_hash, height, slot, json.loads(anchors))
+        elif "FROM etl_chain_checkpoints" in query:
+            self._result = [self.checkpoint] if self.checkpoint else []
+        elif "FROM etl_chain_balances" in query:
+            self._result = [
+                (address, protocol_name, unit, quantity)
+                for (address, unit), (protocol_name, quantity) in self.balances.items()
+            ]
+
+    def copy_expert(self, query, data):
+        for name, address, unit, protocol_name, quantity in csv.reader(io.StringIO(data.read())):
+            self.balances[(address, unit)] = (protocol_name, quantity)
+        self.rowcount = len(self.balances)
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+def sync_until_caught_up(follower):
+    while follower.sync():
+        pass
+
+def test_utxo_changes_ignores_collateral_and_reference_inputs():
+    tx = {
+        "inputs": [
+            {"address": A, "amount": [{"unit": "lovelace", "quantity": "10"}]},
+            {"address": A, "collateral": True, "amount": [{"unit": "lovelace", "quantity": "5"}]},
+            {"address": A, "reference": True, "amount": [{"unit": "lovelace", "quantity": "7"}]},
+        ],
+        "outputs": [{"address": A, "amount": [{"unit": "lovelace", "quantity": "3"}]}],
+    }
+    assert utxo_changes(tx, {A}) == [(A, "lovelace", -10), (A, "lovelace", 3)]
+
+def test_follower_skips_anchored_blocks_and_undoes_a_rollback():
+    source = FixtureBlockSource(FIXTURE)
+    follower = ChainFollower(source, workers=1)
+    follower.start(source.tracked_addresses)
+    assert follower.tip["hash"] == "b100"
+
+    source.refresh()
+    sync_until_caught_up(follower)
+    # Block 101 is already part of A's bootstrapped balance
+    assert follower.balances == {A: {"lovelace": 1050}, B: {"lovelace": 400}}
+
+    source.refresh()
+    sync_until_caught_up(follower)
+    assert follower.tip["hash"] == "b103f"
+    assert follower.balances == {A: {"lovelace": 1005}, B: {"lovelace": 510}}
+
+def test_resumed_follower_keeps_anchors_above_the_checkpoint():
+    source = FixtureBlockSource(FIXTURE)
+    follower = ChainFollower(source, workers=1)
+    follower.start(source.tracked_addresses)
+    cursor = CheckpointCursor()
+    save_checkpoint(cursor, follower)
+    assert cursor.checkpoint[3] == {A: 101}
+
+    resumed = ChainFollower(source, workers=1)
+    assert load_checkpoint(cursor, resumed)
+    resumed.track(source.tracked_addresses)
+    source.refresh()
+    sync_until_caught_up(resumed)
+    assert resumed.balances == {A: {"lovelace": 1050}, B: {"lovelace": 400}}
@@ -0,0 +1,60 @@
+from datetime import datetime, UTC
+from starlette.requests import Request
+from backend.conditional import is_not_modified, make_etag, validator_headers
+
+MODIFIED = datetime(2025, 3, 1, 12, 30, 15, 500000, tzinfo=UTC)
+
+def make_request(path="/tvl/minswap", query="", headers=None):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+def test_etag_depends_on_version_query_and_representation():
+    request = make_request(query="max_points=100")
+    etag = make_etag((1, 2), request)
+    assert etag.startswith('W/"')
+    assert make_etag((1, 2), request) == etag
+    assert make_etag((1, 3), request) != etag
+    assert make_etag((1, 2), request, "msgpack") != etag
+    assert make_etag((1, 2), make_request(query="max_points=200")) != etag
+
+def test_if_none_match_uses_weak_comparison():
+    etag = make_etag((1,), make_request())
+    strong = etag.removeprefix("W/")
+    assert is_not_modified(make_request(headers={"If-None-Match": etag}), etag)
+    assert is_not_modified(make_request(headers={"If-None-Match": f'"other", {strong}'}), etag)
+    assert not is_not_modified(make_request(headers={"If-None-Match": '"other"'}), etag)
+
+def test_wildcard_only_matches_an_existing_representation():
+    etag = make_etag((0,), make_request())
+    request = make_request(headers={"If-None-Match": "*"})
+    assert is_not_modified(request, etag)
+    assert not is_not_modified(request, etag, exists=False)
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    etag = make_etag((1,), make_request())
+    request = make_request(headers={
+        "If-None-Match": '"other"',
+        "If-Modified-Since": "Sat, 01 Mar 2025 12:30:15 GMT",
+    })
+    assert not is_not_modified(request, etag, MODIFIED)
+
+def test_if_modified_since_compares_whole_seconds():
+    etag = make_etag((1,), make_request())
+    current = make_request(headers={"If-Modified-Since": "Sat, 01 Mar 2025 12:30:15 GMT"})
+    older = make_request(headers={"If-Modified-Since": "Sat, 01 Mar 2025 12:30:14 GMT"})
+    garbled = make_request(headers={"If-Modified-Since": "yesterday"})
+    assert is_not_modified(current, etag, MODIFIED)
+    assert not is_not_modified(older, etag, MODIFIED)
+    assert not is_not_modified(garbled, etag, MODIFIED)
+    assert not is_not_modified(current, etag)
+
+def test_validator_headers_format_last_modified_as_http_date():
+    headers = validator_headers('W/"x"', MODIFIED)
+    assert headers["ETag"] == 'W/"x"'
+    assert headers["Last-Modified"] == "Sat, 01 Mar 2025 12:30:15 GMT"
+    assert "Last-Modified" not in validator_headers('W/"x"')
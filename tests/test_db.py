@@ -0,0 +1,78 @@
+import psycopg2
+import pytest
+from backend import db
+
+class FakeConnection:
+    def __init__(self, healthy):
+        self.healthy = healthy
+        self.closed = 0
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if not self.conn.healthy:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+class FakePool:
+    """Hands out the queued connections, then fresh healthy ones."""
+
+    def __init__(self, queued):
+        self.queued = list(queued)
+        self.discarded = []
+        self.returned = []
+
+    def getconn(self):
+        return self.queued.pop(0) if self.queued else FakeConnection(healthy=True)
+
+    def putconn(self, conn, close=False):
+        if close:
+            conn.closed = 1
+            self.discarded.append(conn)
+        else:
+            self.returned.append(conn)
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    def install(queued):
+        pool = FakePool(queued)
+        monkeypatch.setattr(db, "_pool", pool)
+        monkeypatch.setattr(db, "DB_POOL_HEALTH_CHECK_INTERVAL", 0)
+        return pool
+    yield install
+    db._last_used.clear()
+
+def test_get_connection_skips_every_stale_connection(fake_pool):
+    stale = [FakeConnection(healthy=False) for _ in range(3)]
+    pool = fake_pool(stale)
+    with db.get_connection() as conn:
+        assert conn.healthy
+    assert pool.discarded == stale
+    assert pool.returned == [conn]
+    assert conn.commits == 1
+
+def test_get_connection_gives_up_when_no_connection_is_healthy(fake_pool, monkeypatch):
+    monkeypatch.setattr(db, "DB_POOL_MAX_SIZE", 2)
+    pool = fake_pool([FakeConnection(healthy=False) for _ in range(5)])
+    with pytest.raises(psycopg2.OperationalError):
+        with db.get_connection():
+            pass
+    assert len(pool.discarded) == 3
+    assert pool.returned == []
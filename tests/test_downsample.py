@@ -0,0 +1,42 @@
+import math
+import pytest
+from backend.downsample import RESOLUTIONS, bucket_width, lttb
+
+DAY = 24 * 60 * 60
+
+@pytest.mark.parametrize("span, max_points, resolution, expected", [
+    # A day in at most 100 buckets needs 882s, rounded up to 15 minutes
+    (DAY, 100, "auto", RESOLUTIONS["15m"]),
+    # A fine enough requested resolution is kept
+    (DAY, 100, "1h", RESOLUTIONS["1h"]),
+    # A too fine one is widened
+    (DAY, 100, "1m", RESOLUTIONS["15m"]),
+    # Beyond the widest resolution the exact width is used
+    (400 * 7 * DAY, 12, "auto", math.ceil(400 * 7 * DAY / 10)),
+    (0, 100, "auto", RESOLUTIONS["1m"]),
+])
+def test_bucket_width(span, max_points, resolution, expected):
+    assert bucket_width(span, max_points, resolution) == expected
+
+def test_bucket_width_never_exceeds_max_points():
+    for span in (59, 3600, DAY, 31 * DAY, 365 * DAY):
+        for max_points in (3, 10, 100, 1000):
+            width = bucket_width(span, max_points)
+            # Partial buckets at both ends of the range
+            assert math.floor(span / width) + 2 <= max_points
+
+def test_lttb_keeps_ends_and_extremes():
+    points = [(x, 0.0) for x in range(100)]
+    points[37] = (37, 50.0)
+    points[71] = (71, -40.0)
+    sampled = lttb(points, 10)
+    assert len(sampled) == 10
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert points[37] in sampled and points[71] in sampled
+    assert [p[0] for p in sampled] == sorted(p[0] for p in sampled)
+
+def test_lttb_returns_short_series_unchanged_and_carries_extra_members():
+    points = [(x, float(x * x), f"row{x}") for x in range(5)]
+    assert lttb(points, 10) == points
+    assert lttb(points, 2) == points
+    assert all(len(p) == 3 for p in lttb(points, 4))
@@ -0,0 +1,50 @@
+import pytest
+from backend.etl import http_cache
+from backend.etl.http_cache import CacheMiss, ResponseCache, cached_blockfrost
+
+@pytest.fixture
+def calls(tmp_path, monkeypatch):
+    """Routes cached_blockfrost through a scratch cache and records the calls reaching Blockfrost."""
+    calls = []
+    def rate_limited_call(func, *args, return_type=None, **kwargs):
+        calls.append(args)
+        return func(*args, **kwargs)
+    monkeypatch.setattr(http_cache, "HTTP_CACHE_ENABLED", True)
+    monkeypatch.setattr(http_cache, "response_cache", ResponseCache(str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(http_cache, "rate_limited_call", rate_limited_call)
+    return calls
+
+def address_utxos(address):
+    return [{"tx_hash": "tx1", "amount": [{"unit": "lovelace", "quantity": "5"}]}]
+
+def age_every_response(seconds):
+    http_cache.response_cache._connection().execute("UPDATE responses SET fetched_at = fetched_at - ?", (seconds,))
+
+def test_versioned_responses_are_reused_until_the_version_changes(calls):
+    first = cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1", cache_version="tx1")
+    age_every_response(24 * 60 * 60)
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1", cache_version="tx1")
+    assert len(calls) == 1
+    assert first[0].amount[0].quantity == "5"
+
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1", cache_version="tx2")
+    assert len(calls) == 2
+
+def test_unversioned_responses_expire_with_the_endpoint_ttl(calls):
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1")
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1")
+    assert len(calls) == 1
+    age_every_response(http_cache.HTTP_CACHE_TTLS["blockfrost_address_utxos"] + 1)
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1")
+    assert len(calls) == 2
+
+def test_zero_ttl_always_fetches_but_is_replayed_offline(calls):
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1", cache_ttl=0)
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1", cache_ttl=0)
+    assert len(calls) == 2
+
+    http_cache.response_cache.offline = True
+    cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr1", cache_ttl=0)
+    assert len(calls) == 2
+    with pytest.raises(CacheMiss):
+        cached_blockfrost("blockfrost_address_utxos", address_utxos, "addr2", cache_ttl=0)
@@ -0,0 +1,27 @@
+import pytest
+from backend.pagination import decode_cursor, encode_cursor, next_cursor
+
+def test_cursor_round_trips_and_is_url_safe():
+    cursor = encode_cursor(29_000_000, 123456)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor) == (29_000_000, 123456)
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor(1, 2)[:-3], "WzFd", "eyJhIjogMX0"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_next_cursor_drops_the_lookahead_row():
+    rows = [(300, 3), (200, 2), (100, 1)]
+    cursor = next_cursor(rows, 2)
+    assert rows == [(300, 3), (200, 2)]
+    assert decode_cursor(cursor) == (200, 2)
+
+def test_last_page_has_no_cursor():
+    rows = [(300, 3), (200, 2)]
+    assert next_cursor(rows, 2) is None
+    assert rows == [(300, 3), (200, 2)]
+
+def test_next_cursor_reads_the_given_columns():
+    rows = [("a", 7, 300), ("b", 6, 200)]
+    assert decode_cursor(next_cursor(rows, 1, time_index=2, id_index=1)) == (300, 7)
@@ -0,0 +1,26 @@
+from datetime import date, datetime, timedelta, timezone, UTC
+from backend.timekeys import day_bounds, time_id_for, time_id_range, time_id_start
+
+def test_time_id_is_the_bucket_start_in_epoch_minutes():
+    timestamp = datetime(2025, 3, 1, 12, 45, 30, tzinfo=UTC)
+    assert time_id_for(timestamp, 60) == int(datetime(2025, 3, 1, 12, tzinfo=UTC).timestamp() // 60)
+    assert time_id_for(timestamp, 15) == int(datetime(2025, 3, 1, 12, 45, tzinfo=UTC).timestamp() // 60)
+    assert time_id_start(time_id_for(timestamp, 1440)) == datetime(2025, 3, 1, tzinfo=UTC)
+
+def test_naive_timestamps_and_dates_are_utc():
+    aware = datetime(2025, 3, 1, tzinfo=UTC)
+    assert time_id_for(datetime(2025, 3, 1), 60) == time_id_for(aware, 60)
+    assert time_id_for(date(2025, 3, 1), 60) == time_id_for(aware, 60)
+    assert time_id_for(datetime(2025, 3, 1, 2, tzinfo=timezone(timedelta(hours=2))), 60) == time_id_for(aware, 60)
+
+def test_time_id_range_covers_whole_days():
+    first, last = time_id_range(date(2025, 3, 1), date(2025, 3, 2))
+    assert time_id_start(first) == datetime(2025, 3, 1, tzinfo=UTC)
+    assert time_id_start(last) == datetime(2025, 3, 2, 23, 59, tzinfo=UTC)
+    assert time_id_range() == (None, None)
+    assert time_id_range(to=datetime(2025, 3, 1, 6, 30)) == (None, time_id_for(datetime(2025, 3, 1, 6, 30), 1))
+
+def test_day_bounds():
+    assert day_bounds(date(2025, 3, 1)) == (
+        datetime(2025, 3, 1, tzinfo=UTC), datetime(2025, 3, 1, 23, 59, tzinfo=UTC)
+    )